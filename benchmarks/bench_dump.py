@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Throughput and memory benchmark of the s-expression writer.
+
+Usage: python benchmarks/bench_dump.py [FILE ...]
+
+Without arguments the board of a synthetic design of gendesign.py is
+used. Each document is parsed once, then written back with dumps, with
+dump to a file and with the recursive writer dump replaced, checking
+all three give the same text and that it parses back to the same tree.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+# Run from a checkout, without installing bomtool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bomtool import sexp
+
+import gendesign
+
+
+def recursive_dumps(sexpr, retarded=True):
+    """The writer dump replaced, for comparison."""
+    if isinstance(sexpr, sexp._list_types):
+        return "(" + " ".join((recursive_dumps(s, retarded) for s in sexpr)) + ")"
+    elif (retarded and sexpr and type(sexpr) == str
+          and not sexp.contains_any(sexpr, sexp._atom_end)):
+        return sexpr
+    elif type(sexpr) == str:
+        return '"{}"'.format(sexpr.replace('\\', '\\\\').replace('"', '\\"'))
+    else:
+        return repr(sexpr)
+
+
+def measure(fn, repeat=3):
+    """Best wall time of fn() and its peak of allocated memory."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        res = fn()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, res
+
+
+def main(argv):
+    if argv:
+        docs = [(name, io.open(name, encoding='utf-8').read()) for name in argv]
+    else:
+        docs = [('synthetic', gendesign.generate(2000)[1])]
+    fd, path = tempfile.mkstemp(suffix='.kicad_pcb')
+    os.close(fd)
+
+    def dump_file(tree):
+        with io.open(path, 'w', encoding='utf-8') as f:
+            sexp.dump(tree, f)
+
+    try:
+        for name, text in docs:
+            tree = sexp.loads(text)[0]
+            text = None
+            expected = recursive_dumps(tree)
+            size = len(expected.encode('utf-8')) / 1e6
+            print("{} ({:.2f} MB written)".format(name, size))
+            for label, fn in (('recursive', lambda: recursive_dumps(tree)),
+                              ('dumps', lambda: sexp.dumps(tree)),
+                              ('dump', lambda: dump_file(tree))):
+                elapsed, peak, res = measure(fn)
+                if res is None:
+                    with io.open(path, encoding='utf-8') as f:
+                        res = f.read()
+                assert res == expected, "{} output differs".format(label)
+                print("  {:<10} {:8.3f} s {:8.2f} MB/s {:8.1f} MB peak".format(
+                    label, elapsed, size / elapsed, peak / 1e6))
+            assert sexp.loads(expected)[0] == tree, "round trip differs"
+        # Nesting far past the recursion limit
+        deep = 'x'
+        for i in range(100000):
+            deep = [str(i), deep]
+        start = time.time()
+        text = sexp.dumps(deep)
+        print("100000 levels deep: {:.3f} s, {} chars".format(time.time() - start, len(text)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
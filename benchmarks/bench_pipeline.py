@@ -0,0 +1,182 @@
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Time and memory profile of every stage of bomtool.
+
+Usage: python benchmarks/bench_pipeline.py [--scales N ...] [--save FILE]
+                                           [--compare FILE] [--tolerance F]
+
+Generates (once, under --data) the synthetic designs of gendesign.py at
+each scale, then runs each stage of the pipeline on them, reporting
+the best wall time of --repeat runs and the peak of memory allocated
+during a separate run under tracemalloc. --save stores the results as
+a JSON baseline, --compare checks them against one and exits with an
+error when a stage got slower or bigger by more than --tolerance.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+# Run from a checkout, without installing bomtool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bomtool import sexp
+from bomtool.bomtool import (load_netlist, generate_bom, parse_bomline,
+                             write_bom_csv, known_components)
+from bomtool.xyrstool import load_pcb, generate_xyrs, write_xyrs_tsv
+
+import gendesign
+
+
+def stages(net_path, pcb_path):
+    """Return the (name, function) stages of the pipeline, in order.
+
+    Each function takes the results of the previous stages in a dict
+    and stores its own there.
+
+    """
+    def sexp_load(r):
+        with io.open(pcb_path, encoding='utf-8') as f:
+            sexp.load(f)
+
+    def netlist(r):
+        with io.open(net_path, encoding='utf-8') as f:
+            r['netlist'] = load_netlist(f)
+
+    def bomlines(r):
+        known_components.invalidate()
+        for line in set(c.get('BOM', '') for c in r['netlist']):
+            if line and line != 'VIRTUAL':
+                parse_bomline(line)
+
+    def bom(r):
+        known_components.invalidate()
+        r['bom'] = generate_bom(r['netlist'])
+
+    def pcb(r):
+        with io.open(pcb_path, encoding='utf-8') as f:
+            r['pcb'] = load_pcb(f)
+
+    def xyrs(r):
+        r['xyrs'] = generate_xyrs(r['pcb'], r['bom'])
+
+    def bom_csv(r):
+        write_bom_csv(r['bom'], io.StringIO())
+
+    def xyrs_tsv(r):
+        write_xyrs_tsv(r['xyrs'], io.StringIO())
+
+    return [('sexp.load', sexp_load), ('load_netlist', netlist),
+            ('parse_bomline', bomlines), ('generate_bom', bom),
+            ('load_pcb', pcb), ('generate_xyrs', xyrs),
+            ('write_bom_csv', bom_csv), ('write_xyrs_tsv', xyrs_tsv)]
+
+
+def run(net_path, pcb_path, repeat=1):
+    results = {}
+    measures = {}
+    for name, stage in stages(net_path, pcb_path):
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            stage(results)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        stage(results)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        measures[name] = {'time': best, 'peak': peak}
+    return measures
+
+
+# Differences below these are noise, whatever the tolerance
+_noise = {'time': 0.01, 'peak': 1 << 20}
+
+
+def compare(current, baseline, tolerance):
+    """Return the list of regressions of 'current' over 'baseline'."""
+    regressions = []
+    for scale, stages in sorted(current.items()):
+        for name, measure in sorted(stages.items()):
+            base = baseline.get(scale, {}).get(name)
+            if not base:
+                continue
+            for key in ('time', 'peak'):
+                # Stages too quick to time reliably are left out
+                if (measure[key] > base[key] * (1 + tolerance)
+                        and measure[key] - base[key] > _noise[key]):
+                    regressions.append("{} {} {}: {:.4g} -> {:.4g}".format(
+                        scale, name, key, base[key], measure[key]))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the bomtool pipeline")
+    parser.add_argument("--scales", type=int, nargs='+', default=[1000, 10000],
+                        help="Component counts to run (default: 1000 10000, add 100000 for the large one)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), 'bomtool-bench'),
+                        help="Directory of the generated designs")
+    parser.add_argument("--save", metavar="FILE", help="Store the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Check the results against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative growth over the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    current = {}
+    for n in args.scales:
+        net_path, pcb_path = gendesign.write(args.data, n, args.seed)
+        print("{} components ({:.1f} MB board)".format(n, os.path.getsize(pcb_path) / 1e6))
+        measures = current[str(n)] = run(net_path, pcb_path, args.repeat)
+        for name, m in measures.items():
+            print("  {:<16} {:9.3f} s {:9.1f} MB peak".format(name, m['time'], m['peak'] / 1e6))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(current, json.load(f), args.tolerance)
+        for r in regressions:
+            print("REGRESSION", r)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
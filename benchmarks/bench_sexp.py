@@ -0,0 +1,76 @@
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Throughput benchmark for the s-expression parser engines.
+
+Usage: python benchmarks/bench_sexp.py [FILE ...]
+
+Without arguments the board of a synthetic design of gendesign.py is
+used.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import os
+import sys
+import time
+
+# Run from a checkout, without installing bomtool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bomtool import sexp
+
+import gendesign
+
+
+def bench(text, engine, repeat=3, **kwargs):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        sexp.loads(text, engine=engine, **kwargs)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    if argv:
+        docs = [(name, io.open(name, encoding='utf-8').read()) for name in argv]
+    else:
+        docs = [('synthetic', gendesign.generate(2000)[1])]
+    for name, text in docs:
+        size = len(text.encode('utf-8')) / 1e6
+        print("{} ({:.2f} MB)".format(name, size))
+        for engine in sorted(sexp.engines):
+            elapsed = bench(text, engine)
+            print("  {:<8} {:8.3f} s {:8.2f} MB/s".format(engine, elapsed, size / elapsed))
+        elapsed = bench(text, 'regex', keep={'module'})
+        print("  {:<8} {:8.3f} s {:8.2f} MB/s (keep=module)".format('regex', elapsed, size / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
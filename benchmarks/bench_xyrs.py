@@ -0,0 +1,104 @@
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Scaling check for generate_xyrs.
+
+Usage: python benchmarks/bench_xyrs.py
+
+Times generate_xyrs on the boards of gendesign.py of growing size, with ten
+placements per BOM line, and reports the time per placement. It exits
+with an error if that time grows with the board, which means the
+BOM join is no longer linear.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import gc
+import io
+import os
+import re
+import sys
+import time
+import logging
+
+# Run from a checkout, without installing bomtool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bomtool.xyrstool import generate_xyrs
+
+import gendesign
+
+sizes = [1000, 2000, 4000, 8000, 16000]
+# Tolerated growth of the time per placement between the smallest and
+# the largest board, timing noise included
+max_growth = 2.0
+
+
+def synthetic_bom(pcb, per_line=10):
+    """BOM lines placing every module of the board, per_line each."""
+    all_refs = re.findall(r'\(fp_text reference (\S+)', pcb)
+    bom = []
+    for first in range(0, len(all_refs), per_line):
+        refs = all_refs[first:first + per_line]
+        bom.append({
+            'qty': len(refs),
+            'refs': ", ".join(refs),
+            'description': "RES SMD {}k 1% [0603]".format(first),
+            'package': "0603 (1608 Metric)",
+        })
+    return bom
+
+
+def main():
+    logging.disable(logging.WARNING)
+    per_placement = []
+    for n in sizes:
+        pcb = gendesign.generate(n)[1]
+        bom = synthetic_bom(pcb)
+        # Best of three with the collector off, which otherwise runs more
+        # often the bigger the board
+        elapsed = None
+        gc.disable()
+        try:
+            for _ in range(3):
+                start = time.time()
+                xyrs = generate_xyrs(io.StringIO(pcb), bom)
+                took = time.time() - start
+                elapsed = took if elapsed is None else min(elapsed, took)
+        finally:
+            gc.enable()
+        assert len(xyrs) == n
+        per_placement.append(elapsed / n)
+        print("{:>7} placements {:8.3f} s {:8.2f} us/placement"
+              .format(n, elapsed, 1e6 * elapsed / n))
+    growth = per_placement[-1] / per_placement[0]
+    print("growth of the time per placement: {:.2f}x".format(growth))
+    if growth > max_growth:
+        sys.exit("generate_xyrs does not scale linearly")
+
+
+if __name__ == '__main__':
+    main()
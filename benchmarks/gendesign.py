@@ -0,0 +1,228 @@
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Seeded generator of large synthetic KiCad designs.
+
+Usage: python benchmarks/gendesign.py [-n COMPONENTS] [--seed N] DIR
+
+Writes DIR/synthetic-N-SEED.net and DIR/synthetic-N-SEED.kicad_pcb, a KiCad 5
+netlist and board with N components. The mix of parts, the BOM lines
+and the density of tracks, vias and zones follow the boards we build:
+mostly passives, about eight track segments and one via per component
+and two filled ground zones. The same seed always gives the same files.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import os
+import sys
+import random
+import argparse
+
+_resistors = ['10', '22', '47', '100', '330', '470', '1k', '2.2k', '4.7k',
+              '10k', '22k', '47k', '100k', '1M']
+_capacitors = ['10p', '22p', '100p', '1n', '10n', '100n', '1u', '4.7u', '10u']
+_ics = [('TI', 'LMV761MF', 'SOT-23-6'), ('TI', 'TPS62130RGT', 'QFN-16'),
+        ('STM', 'STM32F103C8T6', 'LQFP-48'), ('DIODESINC', 'AP2112K-3.3', 'SOT-23-5'),
+        ('MICROCHIP', 'MCP2551-I/SN', 'SOIC-8'), ('NXP', 'PCA9306DCUR', 'VSSOP-8')]
+
+# Courtyard half sizes (mm) and pad offsets of each package
+_packages = {
+    '0402': ((0.93, 0.47), 0.485),
+    '0603': ((1.48, 0.73), 0.7875),
+    '0805': ((1.68, 0.95), 0.95),
+    'SOT-23-5': ((2.05, 1.75), 1.1),
+    'SOT-23-6': ((2.05, 1.75), 1.1),
+    'SOIC-8': ((3.7, 2.7), 2.7),
+    'VSSOP-8': ((2.2, 1.8), 1.5),
+    'QFN-16': ((2.1, 2.1), 1.5),
+    'LQFP-48': ((5.15, 5.15), 4.2),
+    'CONN': ((2.5, 6.5), 1.27),
+    'HOLE': ((3.45, 3.45), 0.0),
+}
+
+
+def _component(rng, i):
+    """Return (ref, value, package, BOM line) for the i-th component."""
+    kind = rng.random()
+    if kind < 0.45:
+        pkg = rng.choice(['0402', '0603', '0603', '0805'])
+        value = rng.choice(_resistors)
+        tol = rng.choice(['1%', '1%', '5%'])
+        return 'R{}'.format(i), value, pkg, 'RES SMD {} {} [{}]'.format(value, tol, pkg)
+    elif kind < 0.85:
+        pkg = rng.choice(['0402', '0603', '0805'])
+        value = rng.choice(_capacitors)
+        line = 'CAP MLCC {}F {} {}V [{}]'.format(
+            value, rng.choice(['X7R', 'X5R']), rng.choice([10, 16, 25, 50]), pkg)
+        if rng.random() < 0.02:
+            line = '(DNP) ' + line
+        return 'C{}'.format(i), value, pkg, line
+    elif kind < 0.95:
+        manuf, mpn, pkg = rng.choice(_ics)
+        return 'U{}'.format(i), mpn, pkg, 'IC {} {} [{}]'.format(manuf, mpn, pkg)
+    elif kind < 0.98:
+        pins = rng.choice([4, 6, 10])
+        return ('J{}'.format(i), 'Conn_{:02}'.format(pins), 'CONN',
+                '(2) CONN MOLEX 22-23-20{:02}1; HOUSING MOLEX 22-01-30{:02}7'.format(pins, pins))
+    return 'H{}'.format(i), 'MountingHole', 'HOLE', 'VIRTUAL'
+
+
+def generate(n, seed=1):
+    """Return the (netlist, board) texts of a design with n components."""
+    rng = random.Random(seed)
+    comps = [_component(rng, i + 1) for i in range(n)]
+    n_nets = max(2, int(n * 1.2))
+    # Boards are roughly square, 2.5 mm between component centers
+    cols = max(1, int(n ** 0.5))
+    width, height = cols * 2.5 + 10, (n // cols + 1) * 2.5 + 10
+
+    net = ['(export (version D)\n',
+           '  (design\n    (source /synthetic/synthetic.sch)\n',
+           '    (tool "Eeschema 5.1.5"))\n',
+           '  (components\n']
+    pins = [[] for _ in range(n_nets)]
+    for i, (ref, value, pkg, line) in enumerate(comps):
+        fields = '        (field (name BOM) "{}")'.format(line)
+        if rng.random() < 0.05:
+            fields += '\n        (field (name MPN) OVERRIDE-{})'.format(i)
+        net.append(
+            '    (comp (ref {ref})\n'
+            '      (value {value})\n'
+            '      (footprint Synthetic:{pkg})\n'
+            '      (fields\n{fields})\n'
+            '      (libsource (lib Device) (part {part}) (description "Synthetic part"))\n'
+            '      (sheetpath (names /) (tstamps /))\n'
+            '      (tstamp {ts:08X}))\n'.format(ref=ref, value=value, pkg=pkg, fields=fields,
+                                             part=ref.rstrip('0123456789'), ts=i))
+        for pin in (1, 2):
+            pins[rng.randrange(n_nets)].append((ref, pin))
+    net.append('  )\n  (nets\n')
+    for code, nodes in enumerate(pins):
+        net.append('    (net (code {}) (name "/N{}")\n'.format(code + 1, code + 1))
+        for ref, pin in nodes:
+            net.append('      (node (ref {}) (pin {}))\n'.format(ref, pin))
+        net.append('    )\n')
+    net.append('  ))\n')
+
+    pcb = ['(kicad_pcb (version 20171130) (host pcbnew "5.1.5")\n',
+           '  (general (thickness 1.6) (modules {}) (nets {}))\n'.format(n, n_nets + 1),
+           '  (net 0 "")\n']
+    pcb.extend('  (net {} "/N{}")\n'.format(i + 1, i + 1) for i in range(n_nets))
+    for x0, y0, x1, y1 in ((0, 0, width, 0), (width, 0, width, height),
+                           (width, height, 0, height), (0, height, 0, 0)):
+        pcb.append('  (gr_line (start {} {}) (end {} {}) (layer Edge.Cuts) (width 0.05))\n'
+                   .format(x0, y0, x1, y1))
+    for i, (ref, value, pkg, line) in enumerate(comps):
+        (cx, cy), pad = _packages[pkg]
+        x = 5 + (i % cols) * 2.5 + rng.uniform(-0.2, 0.2)
+        y = 5 + (i // cols) * 2.5 + rng.uniform(-0.2, 0.2)
+        rot = rng.choice([0, 0, 90, 180, 270])
+        side = 'B' if rng.random() < 0.1 else 'F'
+        at = '{:.4f} {:.4f}'.format(x, y) + (' {}'.format(rot) if rot else '')
+        out = ['  (module Synthetic:{pkg} (layer {side}.Cu) (tedit 5B301BBD) (tstamp {ts:08X})\n'
+               '    (at {at})\n'
+               '    (descr "Synthetic footprint")\n'
+               '    (attr smd)\n'
+               '    (fp_text reference {ref} (at 0 -{ty:.2f} {rot}) (layer {side}.SilkS)\n'
+               '      (effects (font (size 1 1) (thickness 0.15)))\n'
+               '    )\n'
+               '    (fp_text value {value} (at 0 {ty:.2f} {rot}) (layer {side}.Fab)\n'
+               '      (effects (font (size 1 1) (thickness 0.15)))\n'
+               '    )\n'.format(pkg=pkg, side=side, ts=i, at=at, ref=ref, value=value,
+                               ty=cy + 0.7, rot=rot)]
+        corners = ((-cx, -cy), (cx, -cy), (cx, cy), (-cx, cy))
+        for (x0, y0), (x1, y1) in zip(corners, corners[1:] + corners[:1]):
+            out.append('    (fp_line (start {} {}) (end {} {}) (layer {}.CrtYd) (width 0.05))\n'
+                       .format(x0, y0, x1, y1, side))
+            out.append('    (fp_line (start {} {}) (end {} {}) (layer {}.Fab) (width 0.1))\n'
+                       .format(x0 * 0.8, y0 * 0.8, x1 * 0.8, y1 * 0.8, side))
+        if pkg == 'HOLE':
+            out.append('    (fp_circle (center 0 0) (end 3.2 0) (layer Cmts.User) (width 0.15))\n'
+                       '    (pad 1 np_thru_hole circle (at 0 0) (size 3.2 3.2) (drill 3.2)'
+                       ' (layers *.Cu *.Mask))\n')
+        else:
+            for pin in (1, 2):
+                code = rng.randrange(n_nets) + 1
+                out.append('    (pad {} smd roundrect (at {} 0 {}) (size 0.875 0.95)'
+                           ' (layers {side}.Cu {side}.Paste {side}.Mask) (roundrect_rratio 0.25)\n'
+                           '      (net {} "/N{}"))\n'
+                           .format(pin, pad if pin == 2 else -pad, rot, code, code, side=side))
+        out.append('  )\n')
+        pcb.append(''.join(out))
+    for i in range(n * 8):
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+        pcb.append('  (segment (start {:.4f} {:.4f}) (end {:.4f} {:.4f}) (width 0.25)'
+                   ' (layer {}) (net {}) (tstamp {:08X}))\n'
+                   .format(x, y, x + rng.uniform(-3, 3), y + rng.uniform(-3, 3),
+                           rng.choice(['F.Cu', 'B.Cu']), rng.randrange(n_nets) + 1, i))
+        if i % 8 == 0:
+            pcb.append('  (via (at {:.4f} {:.4f}) (size 0.6) (drill 0.3) (layers F.Cu B.Cu)'
+                       ' (net {}))\n'.format(x, y, rng.randrange(n_nets) + 1))
+    for layer in ('F.Cu', 'B.Cu'):
+        pcb.append('  (zone (net 1) (net_name /N1) (layer {}) (tstamp 0) (hatch edge 0.508)\n'
+                   '    (connect_pads (clearance 0.508))\n'
+                   '    (min_thickness 0.254)\n'
+                   '    (fill yes (arc_segments 32) (thermal_gap 0.508) (thermal_bridge_width 0.508))\n'
+                   '    (polygon\n      (pts\n        (xy 0 0) (xy {w} 0) (xy {w} {h}) (xy 0 {h})\n'
+                   '      )\n    )\n    (filled_polygon\n      (pts\n'.format(layer, w=width, h=height))
+        # Fills follow the outline of every pad and track, about 20
+        # points per component
+        pts = ('(xy {:.4f} {:.4f})'.format(rng.uniform(0, width), rng.uniform(0, height))
+               for _ in range(n * 20))
+        pcb.append('\n'.join('        ' + p for p in pts))
+        pcb.append('\n      )\n    )\n  )\n')
+    pcb.append(')\n')
+    return ''.join(net), ''.join(pcb)
+
+
+def write(directory, n, seed=1):
+    """Write the design with n components to directory, unless already
+    there. Returns the paths of the netlist and the board."""
+    base = os.path.join(directory, 'synthetic-{}-{}'.format(n, seed))
+    paths = base + '.net', base + '.kicad_pcb'
+    if not all(os.path.exists(p) for p in paths):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for path, text in zip(paths, generate(n, seed)):
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+    return paths
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate a synthetic KiCad design")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("-n", "--components", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    for path in write(args.directory, args.components, args.seed):
+        print(path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -26,46 +26,223 @@ from __future__ import unicode_literals
 from __future__ import division
 from __future__ import absolute_import
 
-from .bomtool import load_netlist, generate_bom, write_bom_csv
-from .xyrstool import generate_xyrs, write_xyrs_tsv
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from .bomtool import generate_bom, generate_variant_boms, write_bom, known_components
+from .xyrstool import load_pcb, generate_xyrs, write_xyrs
+from .geometry import parse_panel
+from .cache import ParseCache, load_counted
+from .output import write_outputs
+from .catalog import Catalog
+from .footprints import FootprintIndex
+from .stats import Recorder, recorded, print_report
+from .schematic import load_components
+from .watch import Project, watch
+
+
+def _variant_path(path, variant):
+    """Output path of a variant: the {variant} field of the path, or the
+    variant name added before the extension."""
+    if variant is None:
+        return path
+    if '{variant}' in path:
+        return path.format(variant=variant)
+    base, ext = os.path.splitext(path)
+    return "{}-{}{}".format(base, variant, ext)
+
+
+def _write_outputs(parser, what, write, records, paths, table, default):
+    """Write the records to all the paths in a single pass."""
+    try:
+        write_outputs(write, records, paths, table, default)
+    except Exception as e:
+        parser.error("Error writing {} file '{}': {}".format(what, "', '".join(paths), str(e)))
 
 
 def main():
+    import sys
     import argparse
+    if sys.argv[1:2] == ['batch']:
+        from . import batch
+        return batch.main(sys.argv[2:])
+    if sys.argv[1:2] == ['catalog']:
+        from . import catalog
+        return catalog.main(sys.argv[2:])
+    if sys.argv[1:2] == ['serve']:
+        from . import serve
+        return serve.main(sys.argv[2:])
+    if sys.argv[1:2] == ['diff']:
+        from . import diff
+        return diff.main(sys.argv[2:])
     parser = argparse.ArgumentParser(description="Create Bills of Materials from KiCad netlist files")
-    parser.add_argument("netlist", help="Netlist to process")
+    parser.add_argument("netlist", help="Netlist to process, or the root .kicad_sch sheet of the schematic")
     parser.add_argument("pcb", help="PCB File (used for XYRS)", nargs='?')
-    parser.add_argument("--xyrs", help="Output XYRS format", type=str, metavar="FILE")
-    parser.add_argument("--bom", help="Output BOM in csv format", type=str, metavar="FILE")
+    parser.add_argument("--xyrs", help="Output XYRS format (TSV, or .jsonl, .csv, .db after the extension;"
+                        " can be repeated)", type=str, metavar="FILE", action='append')
+    parser.add_argument("--bom", help="Output BOM in csv format (or .jsonl, .tsv, .db after the extension;"
+                        " can be repeated)", type=str, metavar="FILE", action='append')
+    parser.add_argument("--mmap", help="Memory map the netlist and PCB files instead of reading them",
+                        action='store_true')
+    parser.add_argument("--component-cache", help="Keep the generated jellybean parts in this database across runs",
+                        type=str, metavar="FILE")
+    parser.add_argument("--catalog", help="Pick the jellybean parts from this parts catalog when it has them",
+                        type=str, metavar="FILE")
+    parser.add_argument("--footprints", help="Check the footprints against the BOM line packages using the"
+                        " .pretty libraries in this directory (can be repeated)",
+                        type=str, metavar="DIR", action='append')
+    parser.add_argument("--footprint-index", help="Keep the index of the footprint libraries in this database"
+                        " (default: in the cache directory)", type=str, metavar="FILE")
+    parser.add_argument("--cache-dir", help="Reuse the parse results of unchanged inputs kept in this directory",
+                        type=str, metavar="DIR")
+    parser.add_argument("--cache-size", help="Size limit of the parse cache in MiB (default: 256)",
+                        type=int, default=256, metavar="MIB")
+    parser.add_argument("--panel", help="Repeat the XYRS placements over a panel of COLSxROWS boards",
+                        type=str, metavar="COLSxROWS")
+    parser.add_argument("--panel-step", help="Distance between the boards of the panel in mm (default: board size)",
+                        type=str, metavar="X,Y")
+    parser.add_argument("--panel-rotation", help="Rotation of each board of the panel, cycled (default: 0)",
+                        type=str, metavar="DEG[,DEG...]")
+    parser.add_argument("--profile", help="Print the time and memory used by each stage",
+                        action='store_true')
+    parser.add_argument("--stats", help="Write the time, memory and counts of each stage as JSON",
+                        type=str, metavar="FILE")
+    parser.add_argument("--watch", help="Keep running and regenerate the outputs whenever the inputs change",
+                        action='store_true')
+    parser.add_argument("--variants", help="Generate the BOM and XYRS of each assembly variant defined in this JSON file",
+                        type=str, metavar="FILE")
     args = parser.parse_args()
 
     if not args.xyrs and not args.bom:
         parser.error("No task specified")
     elif args.xyrs and not args.pcb:
         parser.error("A PCB file is needed when generating XYRS")
+    elif args.watch and (args.variants or args.profile or args.stats):
+        parser.error("--watch can't be used with --variants, --profile or --stats")
+    elif args.watch and args.netlist.endswith('.kicad_sch'):
+        parser.error("--watch needs a netlist")
 
-    try:
-        netlist = load_netlist(open(args.netlist))
-    except Exception as e:
-        parser.error("Error loading netlist '{}': {}".format(args.netlist, str(e)))
+    panel = None
+    if args.panel:
+        try:
+            panel = parse_panel(args.panel, args.panel_step, args.panel_rotation)
+        except ValueError as e:
+            parser.error("Invalid panel options: {}".format(str(e)))
 
-    bom = generate_bom(netlist)
-    if args.bom:
+    cache = None
+    if args.cache_dir:
         try:
-            bom_file = open(args.bom, 'w')
-            write_bom_csv(bom, bom_file)
+            cache = ParseCache(args.cache_dir, args.cache_size << 20)
         except Exception as e:
-            parser.error("Error writing BOM file '{}': {}".format(args.bom, str(e)))
+            parser.error("Error opening cache directory '{}': {}".format(args.cache_dir, str(e)))
 
-    if args.xyrs:
+    variants = None
+    if args.variants:
         try:
-            xyrs = generate_xyrs(open(args.pcb), bom)
+            with open(args.variants) as variants_file:
+                variants = json.load(variants_file)
+            variants = variants.get('variants', variants)
         except Exception as e:
-            parser.error("Error parsing PCB '{}': {}".format(args.pcb, str(e))) 
+            parser.error("Error loading variants '{}': {}".format(args.variants, str(e)))
+
+    recorder = None
+    if args.profile or args.stats:
+        recorder = Recorder()
+        recorder.start()
+
+    # The board doesn't depend on the netlist, parse it at the same time
+    # in another process
+    pool = pcb = None
+    # The pool is shut down however this ends, parser.error included,
+    # cancelling the board parse if it hasn't started yet
+    try:
+        if args.xyrs and not args.watch:
+            pool = ProcessPoolExecutor(max_workers=1)
+            if recorder:
+                pcb = pool.submit(recorded, load_counted, args.pcb, load_pcb, args.mmap, cache)
+            else:
+                pcb = pool.submit(load_counted, args.pcb, load_pcb, args.mmap, cache)
+
+        if args.component_cache:
+            try:
+                known_components.open(args.component_cache)
+            except Exception as e:
+                parser.error("Error opening component cache '{}': {}".format(args.component_cache, str(e)))
+
+        if args.catalog:
+            try:
+                known_components.use_catalog(Catalog(args.catalog))
+            except Exception as e:
+                parser.error("Error opening catalog '{}': {}".format(args.catalog, str(e)))
+
+        footprints = None
+        if args.footprints:
+            index_path = args.footprint_index
+            if not index_path:
+                index_path = os.path.join(args.cache_dir, 'footprints.db') if args.cache_dir else ':memory:'
+            try:
+                footprints = FootprintIndex(index_path)
+                footprints.update(args.footprints)
+            except Exception as e:
+                parser.error("Error indexing footprint libraries: {}".format(str(e)))
+
+        if args.watch:
+            project = Project(args.netlist, args.pcb if args.xyrs else None, panel, footprints)
+            print("Watching '{}'{}, press Ctrl-C to stop".format(
+                args.netlist, " and '{}'".format(args.pcb) if args.xyrs else ""))
+            watch(project, {'bom': args.bom, 'xyrs': args.xyrs})
+            known_components.close()
+            return
+
         try:
-            write_xyrs_tsv(xyrs, open(args.xyrs, 'w'))
+            netlist = load_components(args.netlist, args.mmap, cache)
         except Exception as e:
-            parser.error("Error writing XYRS file '{}': {}".format(args.xyrs, str(e)))
+            parser.error("Error loading netlist '{}': {}".format(args.netlist, str(e)))
+
+        if variants:
+            boms = generate_variant_boms(netlist, variants, footprints)
+        else:
+            boms = {None: generate_bom(netlist, footprints)}
+        known_components.close()
+        if args.bom:
+            for name, bom in sorted(boms.items()):
+                _write_outputs(parser, "BOM", write_bom, bom,
+                               [_variant_path(p, name) for p in args.bom], 'bom', 'csv')
+
+        if args.xyrs:
+            try:
+                pcb = pcb.result()
+                if recorder:
+                    pcb, pcb_stages = pcb
+                    recorder.stages.extend(pcb_stages)
+                pcb, pcb_cache = pcb
+                if cache is not None:
+                    cache.merge(pcb_cache)
+                # The board is parsed once for all the variants
+                xyrs = dict((name, generate_xyrs(pcb, bom, panel=panel))
+                            for name, bom in boms.items())
+            except Exception as e:
+                parser.error("Error parsing PCB '{}': {}".format(args.pcb, str(e)))
+            for name, variant_xyrs in sorted(xyrs.items()):
+                _write_outputs(parser, "XYRS", write_xyrs, variant_xyrs,
+                               [_variant_path(p, name) for p in args.xyrs], 'xyrs', 'tsv')
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if recorder:
+        recorder.stop()
+        report = recorder.report(component_cache=known_components.stats(),
+                                 parse_cache=cache.stats() if cache else None)
+        if args.profile:
+            print_report(report)
+        if args.stats:
+            try:
+                with open(args.stats, 'w') as stats_file:
+                    json.dump(report, stats_file, indent=2)
+            except Exception as e:
+                parser.error("Error writing stats file '{}': {}".format(args.stats, str(e)))
 
 if __name__ == "__main__":
     main()
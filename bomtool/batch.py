@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Run the BOM and XYRS generation for many projects in parallel."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from .bomtool import generate_bom, write_bom, known_components
+from .xyrstool import load_pcb, generate_xyrs, write_xyrs
+from .cache import ParseCache, load_file
+from .output import write_outputs
+from .catalog import Catalog
+from .schematic import load_components
+from .geometry import check_panel
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import toml as tomllib
+    except ImportError:
+        tomllib = None
+
+_project_paths = ['netlist', 'pcb', 'bom', 'xyrs']
+
+
+def load_manifest(path):
+    """Read the list of projects from a JSON or TOML manifest.
+
+    The manifest holds a 'projects' list (or is the list itself) of
+    tables with the 'netlist', 'pcb', 'bom' and 'xyrs' paths of each
+    project, and optionally a 'name' and the 'panel' options of
+    generate_xyrs. 'bom' and 'xyrs' can also be lists of paths, to write
+    several formats. Relative paths are taken from the directory of the
+    manifest.
+
+    """
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise RuntimeError("Reading TOML manifests needs tomllib or toml")
+        with open(path, 'rb') as f:
+            manifest = tomllib.loads(f.read().decode('utf-8'))
+    else:
+        with open(path) as f:
+            manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('projects', [])
+    base = os.path.dirname(os.path.abspath(path))
+    projects = []
+    for i, p in enumerate(manifest):
+        if not p.get('netlist'):
+            raise ValueError("Project {} has no netlist".format(i + 1))
+        p = dict(p)
+        for key in _project_paths:
+            if isinstance(p.get(key), list):
+                p[key] = [os.path.normpath(os.path.join(base, v)) for v in p[key]]
+            elif p.get(key):
+                p[key] = os.path.normpath(os.path.join(base, p[key]))
+        if p.get('panel') is not None:
+            try:
+                check_panel(p['panel'])
+            except ValueError as e:
+                raise ValueError("Project {} has invalid panel options: {}".format(i + 1, str(e)))
+        p.setdefault('name', p['netlist'])
+        projects.append(p)
+    return projects
+
+
+def _paths(paths):
+    """The output paths of a project, given as one path or a list."""
+    return paths if isinstance(paths, list) else [paths]
+
+
+def run_project(project, use_mmap=False, cache_dir=None, cache_size=256 << 20,
+                component_cache=None, catalog=None):
+    """Generate the outputs of one project, like a single bomtool run."""
+    if not project.get('bom') and not project.get('xyrs'):
+        raise ValueError("No task specified")
+    if project.get('xyrs') and not project.get('pcb'):
+        raise ValueError("A PCB file is needed when generating XYRS")
+    cache = ParseCache(cache_dir, cache_size) if cache_dir else None
+    load = lambda path, loader: load_file(path, loader, use_mmap, cache)
+
+    # Workers run many projects, leave the shared cache as it was found
+    parts = Catalog(catalog) if catalog else None
+    if parts is not None:
+        known_components.use_catalog(parts)
+    if component_cache:
+        known_components.open(component_cache)
+    try:
+        # Projects already run in parallel, parse the sheets in series
+        bom = generate_bom(load_components(project['netlist'], use_mmap, cache, jobs=1))
+    finally:
+        known_components.close()
+        if parts is not None:
+            known_components.use_catalog(None)
+            parts.close()
+    if project.get('bom'):
+        write_outputs(write_bom, bom, _paths(project['bom']), 'bom', 'csv')
+    if project.get('xyrs'):
+        xyrs = generate_xyrs(load(project['pcb'], load_pcb), bom,
+                             panel=project.get('panel'))
+        write_outputs(write_xyrs, xyrs, _paths(project['xyrs']), 'xyrs', 'tsv')
+
+
+def run_batch(projects, jobs=None, **options):
+    """Run every project on a pool of 'jobs' processes (one per core).
+
+    A failing project doesn't stop the others. Returns the list of
+    (project, exception) pairs for the ones that failed.
+
+    """
+    failures = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [(p, pool.submit(run_project, p, **options)) for p in projects]
+        for project, future in futures:
+            error = future.exception()
+            if error is not None:
+                logging.error("Project '{}' failed: {}".format(project['name'], error))
+                failures.append((project, error))
+    return failures
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bomtool batch",
+                                     description="Create the BOM and XYRS files of many projects")
+    parser.add_argument("manifest", help="JSON or TOML file listing the projects")
+    parser.add_argument("-j", "--jobs", help="Number of worker processes (default: one per core)",
+                        type=int, metavar="N")
+    parser.add_argument("--mmap", help="Memory map the netlist and PCB files instead of reading them",
+                        action='store_true')
+    parser.add_argument("--component-cache", help="Keep the generated jellybean parts in this database across runs",
+                        type=str, metavar="FILE")
+    parser.add_argument("--catalog", help="Pick the jellybean parts from this parts catalog when it has them",
+                        type=str, metavar="FILE")
+    parser.add_argument("--cache-dir", help="Reuse the parse results of unchanged inputs kept in this directory",
+                        type=str, metavar="DIR")
+    parser.add_argument("--cache-size", help="Size limit of the parse cache in MiB (default: 256)",
+                        type=int, default=256, metavar="MIB")
+    args = parser.parse_args(argv)
+
+    try:
+        projects = load_manifest(args.manifest)
+    except Exception as e:
+        parser.error("Error loading manifest '{}': {}".format(args.manifest, str(e)))
+
+    failures = run_batch(projects, args.jobs, use_mmap=args.mmap,
+                         cache_dir=args.cache_dir, cache_size=args.cache_size << 20,
+                         component_cache=args.component_cache, catalog=args.catalog)
+    print("{} of {} projects done".format(len(projects) - len(failures), len(projects)))
+    if failures:
+        sys.exit(1)
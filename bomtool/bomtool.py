@@ -28,15 +28,23 @@ from __future__ import division
 from __future__ import absolute_import
 
 from . import sexp
-from .sexp import car, cdr, cadr, findall, assoc
+from .sexp import cdr, cadr, findall, assoc
 
 from . import pngen
+from .stats import stage
+from .output import DelimitedSink, write_table
 
 import re
+import sys
+import json
+import sqlite3
 import logging
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
-from csv import DictWriter
+try:
+    intern = sys.intern
+except AttributeError:
+    intern = intern
 
 _manuf_abbr = {
     'TI': "Texas Instruments",
@@ -88,59 +96,234 @@ _known_pkgs = {
 dielectrics = ['NP0', 'C0G', 'X5R', 'X7R']
 
 class ComponentCache:
+    """Memoizes the parts generated for jellybean BOM lines.
+
+    Parts come from the catalog when one is given and it has a part
+    that fits, and are generated by the pngen rules otherwise.
+    Results are kept in a bounded in-process LRU keyed on the field
+    tuple of the BOM line and, once open() is called, in an SQLite
+    store shared across runs. Stored results are tagged with the
+    pngen rules and catalog version they were found with, entries from
+    other versions are never returned.
+    """
+
+    def __init__(self, maxsize=4096, path=None, catalog=None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.catalog = catalog
+        self.rules = self._rules_version()
+        self._lru = OrderedDict()
+        self._db = None
+        if path:
+            self.open(path)
+
+    def _rules_version(self):
+        if self.catalog is None:
+            return pngen.rules_version()
+        return pngen.rules_version() + ':' + self.catalog.version()
+
+    def use_catalog(self, catalog):
+        """Look the parts up in a catalog.Catalog before generating them,
+        or stop doing so if catalog is None."""
+        self.catalog = catalog
+        self.rules = self._rules_version()
+        self._lru.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM components WHERE rules != ?",
+                             (self.rules,))
+            self._db.commit()
+
+    def open(self, path):
+        """Back the cache with the SQLite database at path."""
+        self.close()
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS components"
+            " (key TEXT PRIMARY KEY, rules TEXT, part TEXT)")
+        # Entries generated by other rules are useless, drop them
+        self._db.execute("DELETE FROM components WHERE rules != ?",
+                         (self.rules,))
+        self._db.commit()
+
+    def commit(self):
+        """Store the parts generated since the last commit. The BOM
+        generators call it when done, so the store is never left with
+        a transaction open that blocks other processes using it."""
+        if self._db is not None:
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def invalidate(self):
+        """Forget every result, call it after changing the pngen rules."""
+        self._lru.clear()
+        self.rules = self._rules_version()
+        if self._db is not None:
+            self._db.execute("DELETE FROM components")
+            self._db.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'store_hits': self.store_hits, 'size': len(self._lru)}
+
     def get(self, key, default=None):
-        res = default
-        if key[:2] == ('RES', 'SMD'):
-            fields = list(key[2:])
-            value = parse_eng(fields.pop(0))
-            tolerance = 5
-            power = None
-            package = None
-            for f in fields:
-                if f[0] + f[-1] == "[]":
-                    package = f[1:-1]
-                elif f[-1] == '%':
-                    tolerance = float(f[:-1])
-                elif f[-1] in ['W', 'w']:
-                    power = parse_eng(f[:-1])
-            res = pngen.RC(value, tolerance, power, package)
-        if key[:2] == ('CAP', 'MLCC'):
-            fields = list(key[2:])
-            value = parse_eng(fields.pop(0))
-            tolerance = 10
-            dielectric = None
-            voltage = 16
-            package = None
-            for f in fields:
-                if f[0] + f[-1] == "[]":
-                    package = f[1:-1]
-                elif f[-1] == '%':
-                    tolerance = float(f[:-1])
-                elif f[-1] in ['V', 'v']:
-                    voltage = parse_eng(f[:-1])
-                elif f in dielectrics:
-                    dielectric = f
-            if dielectric in ['X7R', 'X5R']:
-                res = pngen.CC_XxR(value, tolerance, voltage, package, dielectric=dielectric)
+        res = self._part(key)
+        if res is None:
+            return default
+        return dict(res)
+
+    def _part(self, key):
+        """Like get, but returns the cached part itself, or None."""
+        key = tuple(key)
+        lru = self._lru
+        res = lru.pop(key, _missing)
+        if res is _missing:
+            self.misses += 1
+            res = self._load(key)
+        else:
+            self.hits += 1
+        lru[key] = res
+        if len(lru) > self.maxsize:
+            lru.popitem(last=False)
         return res
 
+    def _load(self, key):
+        if self._db is None:
+            return self._generate(key)
+        db_key = " ".join(key)
+        row = self._db.execute(
+            "SELECT part FROM components WHERE key = ? AND rules = ?",
+            (db_key, self.rules)).fetchone()
+        if row:
+            self.store_hits += 1
+            return json.loads(row[0])
+        res = self._generate(key)
+        self._db.execute("INSERT OR REPLACE INTO components VALUES (?, ?, ?)",
+                         (db_key, self.rules, json.dumps(res)))
+        return res
+
+    def _generate(self, key):
+        if tuple(key[:2]) not in _jellybean_params:
+            return None
+        params = jellybean_params(key)
+        value = params['value']
+        if value is None:
+            return None
+        if self.catalog is not None:
+            res = self.catalog.find(key[0] + ' ' + key[1], **params)
+            if res is not None:
+                return res
+        if key[0] == 'RES':
+            return pngen.RC(value, params['tolerance'], params['power'], params['package'])
+        dielectric = params['dielectric']
+        if dielectric in ('X7R', 'X5R'):
+            return pngen.CC_XxR(value, params['tolerance'], params['voltage'],
+                                params['package'], dielectric=dielectric)
+        return None
+
+# Parameters of the jellybean kinds and their defaults
+_jellybean_params = {
+    ('RES', 'SMD'): {'tolerance': 5, 'power': None, 'package': None},
+    ('CAP', 'MLCC'): {'tolerance': 10, 'voltage': 16, 'dielectric': None, 'package': None},
+}
+
 known_components = ComponentCache()
 
 
+def _intern(s):
+    return intern(s) if type(s) is str else s
+
+
+class Component(object):
+    """Compact record of a schematic component.
+
+    Holds the reference, value and footprint, and the user fields as a
+    flat (name, value, name, value, ...) tuple of interned strings, so
+    field names and repeated values like BOM lines are stored once.
+    Items are read like in a dictionary, c['ref'] or c.get('MPN').
+    """
+
+    __slots__ = ('ref', 'value', 'footprint', 'fields')
+
+    def __init__(self, ref='', value='', footprint='', fields=()):
+        self.ref = ref
+        self.value = value
+        self.footprint = footprint
+        self.fields = fields
+
+    def get(self, key, default=None):
+        fields = self.fields
+        # Later fields override earlier ones
+        for i in range(len(fields) - 2, -1, -2):
+            if fields[i] == key:
+                return fields[i + 1]
+        if key in _component_attrs:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        res = self.get(key, _missing)
+        if res is _missing:
+            raise KeyError(key)
+        return res
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def items(self):
+        res = dict(zip(_component_attrs, (self.ref, self.value, self.footprint)))
+        res.update(zip(self.fields[::2], self.fields[1::2]))
+        return res.items()
+
+    def override(self, fields):
+        """Return a copy with the given fields, like {'MPN': ...}, set."""
+        extra = []
+        for name, value in sorted(fields.items()):
+            extra += [_intern(name), _intern(value)]
+        return Component(self.ref, self.value, self.footprint,
+                         self.fields + tuple(extra))
+
+    def __repr__(self):
+        return "Component({!r})".format(dict(self.items()))
+
+    def __getstate__(self):
+        return (self.ref, self.value, self.footprint, self.fields)
+
+    def __setstate__(self, state):
+        self.ref, value, footprint, fields = state
+        self.value, self.footprint = _intern(value), _intern(footprint)
+        self.fields = tuple(_intern(f) for f in fields)
+
+_component_attrs = ('ref', 'value', 'footprint')
+_missing = object()
+
+
 def parse_comp(comp_data):
-    res = {}
-    for key in ['ref', 'value', 'footprint']:
-        res[key] = cadr(assoc(comp_data, key)) or ''
-    fields = cdr(assoc(comp_data, 'fields'))
-    for f in fields:
-        res[cadr(assoc(f, 'name'))] = f[-1]
-    return res
+    ref, value, footprint = (cadr(assoc(comp_data, key)) or ''
+                             for key in _component_attrs)
+    fields = []
+    for f in cdr(assoc(comp_data, 'fields')):
+        fields.append(_intern(cadr(assoc(f, 'name'))))
+        fields.append(_intern(f[-1]))
+    return Component(ref, _intern(value), _intern(footprint), tuple(fields))
 
 
-def load_netlist(net_file):
-    net_data = car(sexp.load(net_file))
-    comps_data = findall(cdr(assoc(net_data, 'components')), 'comp')
-    return [parse_comp(c) for c in comps_data]
+def load_netlist(net_file, use_mmap=False):
+    with stage('netlist.sexp') as info:
+        # Only the components section is needed, stop reading right after it
+        components = assoc(sexp.iterparse(net_file, keep={'components'},
+                                          use_mmap=use_mmap),
+                           'components')
+        comps_data = list(findall(cdr(components), 'comp'))
+        info['components'] = len(comps_data)
+    with stage('netlist.parse_comp', components=len(comps_data)):
+        return [parse_comp(c) for c in comps_data]
 
 _re_eng = re.compile(
     r'(?P<whole>\d*)'
@@ -160,98 +343,362 @@ _eng_suffixes = {
     'G': 1e9
 }
 
+# Distinct strings kept by the parse_eng memo, it's cleared when full
+_memo_size = 1 << 16
+_eng_memo = {}
+
+def _parse_eng(s):
+    whole, sep, decimals, suffix = _re_eng.match(s).groups()
+    if not (whole or decimals):
+        return None
+    value = float(whole + '.' + decimals)
+    if sep in _eng_suffixes:
+        return value * _eng_suffixes[sep]
+    return value * _eng_suffixes.get(suffix, 1)
+
 def parse_eng(s):
-    value = None
-    match = _re_eng.match(s)
-    if match and (match.group('whole') or match.group('decimals')):
-        value = float(match.group('whole') + '.' + match.group('decimals'))
-        if match.group('sep') in _eng_suffixes:
-            value *= _eng_suffixes[match.group('sep')]
-        else:
-            value *= _eng_suffixes.get(match.group('suffix'), 1)
+    if s in _eng_memo:
+        return _eng_memo[s]
+    if len(_eng_memo) >= _memo_size:
+        _eng_memo.clear()
+    value = _eng_memo[s] = _parse_eng(s)
     return value
 
-def parse_bomline(line):
-    # If we have multiple bom lines, recurse
-    if ';' in line:
-        bomlines = []
-        for l in line.split(';'):
-            if l.strip():
-                bomlines += parse_bomline(l.strip())
-        return bomlines
-    #
-    # Otherwise parse a single bom line
-    attrs = {}
-    fields = line.strip().split()
-    attrs['description'] = line
-    # Extract quantity if it exists (first field)
-    if fields[0][0] + fields[0][-1] == "()":
-        multiplier = fields.pop(0)[1:-1]
-        try:
-            if multiplier == "DNP":
-                attrs['mult'] = 0
-            else:
+
+class BomLineError(ValueError):
+    """A malformed BOM line, with the column of the offending field."""
+
+    def __init__(self, line, column, message):
+        ValueError.__init__(self, "{} at column {} of BOM line '{}'"
+                            .format(message, column + 1, line))
+        self.line = line
+        self.column = column
+
+
+_re_bom_field = re.compile(r'\S+')
+
+# Kinds of part taking a free text value after their second field, like
+# RES AXIAL 1k 5% 0.25W
+_valued_kinds = {
+    'RES': {'SMD', 'AXIAL'},
+    'BEAD': {'SMD', 'AXIAL'},
+    'CAP': {'MLCC', 'TANT'},
+}
+
+# Parts with part numbers generated by the pngen rules: the dielectrics
+# they are generated for (None for any), and the parameters the rules
+# use, which must then be valid
+_generated_kinds = {
+    ('RES', 'SMD'): (None, ('tolerance',)),
+    ('CAP', 'MLCC'): ({'X7R', 'X5R'}, ('tolerance', 'voltage')),
+}
+
+# Rating parameters, by the suffix of their field
+_rating_suffixes = {'W': 'power', 'w': 'power', 'V': 'voltage', 'v': 'voltage'}
+
+
+def _column(line, i):
+    """Column of the i-th field of a BOM line, for error messages."""
+    starts = [m.start() for m in _re_bom_field.finditer(line)]
+    return starts[i] if i < len(starts) else len(line)
+
+
+class _FieldError(ValueError):
+    """Invalid field of a BOM line, by its index among the fields."""
+
+    def __init__(self, index, message):
+        ValueError.__init__(self, message)
+        self.index = index
+
+
+def jellybean_params(key):
+    """Parse the fields of a jellybean part, like RES SMD 10k 1% [0603],
+    into the keyword arguments of Catalog.find.
+
+    Each field is parsed once. Fields are only checked when the pngen
+    rules generate the part (every RES SMD, X7R and X5R CAP MLCC), the
+    first invalid one the rules use raises a _FieldError. Other invalid
+    fields are taken as not given, and those of other kinds, like a
+    voltage on a resistor, are ignored.
+    """
+    if len(key) < 3:
+        raise _FieldError(len(key), "Missing the value of the part")
+    kind = (key[0], key[1])
+    params = dict(_jellybean_params[kind])
+    invalid = None
+    for i in range(3, len(key)):
+        f = key[i]
+        suffix = f[-1]
+        if f[0] == '[' and suffix == ']':
+            params['package'] = f[1:-1]
+            continue
+        if suffix == '%':
+            name = 'tolerance'
+            try:
+                value = float(f[:-1])
+            except ValueError:
+                value = None
+        else:
+            name = _rating_suffixes.get(suffix)
+            if name is None:
+                if f in dielectrics and 'dielectric' in params:
+                    params['dielectric'] = f
+                continue
+            if name not in params:
+                continue
+            value = parse_eng(f[:-1])
+        params[name] = value
+        if value is None:
+            invalid = invalid or []
+            invalid.append((i, name))
+    value = params['value'] = parse_eng(key[2])
+    if value is None or invalid:
+        generated, checked = _generated_kinds[kind]
+        if generated is None or params['dielectric'] in generated:
+            if value is None:
+                raise _FieldError(2, "Invalid value '{}'".format(key[2]))
+            for i, name in invalid:
+                # Unless a later field of the same parameter is valid
+                if name in checked and params[name] is None:
+                    raise _FieldError(i, "Invalid parameter '{}'".format(key[i]))
+    return params
+
+
+def _parse_item(line):
+    """Parse a single BOM item, see parse_bomline."""
+    fields = line.split()
+    if not fields:
+        raise BomLineError(line, 0, "Empty BOM line")
+    attrs = {'description': line}
+    # Quantity multiplier, first field
+    first = 0
+    f = fields[0]
+    if f[0] == '(' and f[-1] == ')':
+        multiplier = f[1:-1]
+        first = 1
+        if multiplier == "DNP":
+            attrs['mult'] = 0
+        else:
+            try:
                 attrs['mult'] = int(multiplier, 10)
-        except:
-            logging.error("Invalid multiplier ({})".format(multiplier))
-            
-    known_component = known_components.get(tuple(fields))
-    # Extract package if it exists (last field)
-    if fields[-1][0] + fields[-1][-1] == "[]":
-        package = fields.pop(-1)[1:-1]
-        attrs['package'] = _known_pkgs.get(package, package)
-    # Extract the attributes depending on the kind of component
+            except ValueError:
+                logging.error("Invalid multiplier ({}) at column {} of BOM line '{}'"
+                              .format(multiplier, _column(line, 0) + 1, line))
+        fields = fields[1:]
+    # known_components takes the fields with the package
+    key = fields
+    # Package, last field
+    if fields:
+        f = fields[-1]
+        if f[0] == '[' and f[-1] == ']':
+            package = f[1:-1]
+            attrs['package'] = _known_pkgs.get(package, package)
+            fields = fields[:-1]
+    if not fields:
+        raise BomLineError(line, len(line), "Missing the kind of part")
+    # The attributes depend on the kind of component
     kind = attrs['kind'] = fields[0]
-
-    if known_component:
-        attrs.update(known_component)
-    elif kind in ['RES', 'BEAD'] and cadr(fields) in ['SMD', 'AXIAL']:
-        attrs['value'] = " ".join(fields[2:])
-    elif kind == 'CAP' and cadr(fields) in ['MLCC', 'TANT']:
+    n = len(fields)
+    if n > 1 and (kind, fields[1]) in _generated_kinds:
+        # The fields are checked when the part is generated, those of
+        # the cached parts were valid
+        try:
+            part = known_components._part(key)
+        except _FieldError as e:
+            column = _column(line, first + e.index) if e.index < len(key) else len(line)
+            raise BomLineError(line, column, str(e))
+        except (TypeError, ValueError) as e:
+            raise BomLineError(line, _column(line, first),
+                               "Can't generate the part number ({})".format(e))
+        if part:
+            attrs.update(part)
+            return attrs
+    if n > 1 and fields[1] in _valued_kinds.get(kind, ()):
         attrs['value'] = " ".join(fields[2:])
-    elif len(fields) == 3:
+    elif n == 3:
         attrs['manufacturer'] = _manuf_abbr.get(fields[1], fields[1].capitalize())
         attrs['MPN'] = fields[2]
-    elif len(fields) == 2:
+    elif n == 2:
         attrs['MPN'] = fields[1]
+    return attrs
+
 
-    return [attrs]
+def parse_bomline(line):
+    """Return the list of BOM items (attribute dictionaries) of a line,
+    one per ';' separated item. Raises BomLineError for malformed lines.
+
+    Lines aren't memoized, generate_bom already parses each distinct
+    line once and the parts of the jellybean ones are cached by
+    known_components.
+
+    """
+    if ';' not in line:
+        return [_parse_item(line)]
+    items = []
+    for l in line.split(';'):
+        l = l.strip()
+        if l:
+            items.append(_parse_item(l))
+    return items
 
 
-def generate_bom(comps):
+def generate_bom(comps, footprints=None):
+    """Group the components by BOM line into the lines of the BOM.
+
+    With 'footprints', a footprints.FootprintIndex, the footprint of
+    every component is also checked against the package of its line.
+
+    """
+    with stage('generate_bom', components=len(comps)) as info:
+        if footprints is not None:
+            info['footprint_mismatches'] = len(footprints.check(comps))
+        bom = _generate_bom(comps)
+        known_components.commit()
+        info['bom_lines'] = len(bom)
+    return bom
+
+
+def _group_components(comps, log=True):
     grouped = defaultdict(list)
     for c in comps:
         if c.get('BOM', '') == '':
-            logging.error("Component '{}' has no BOM line!".format(c['ref']))
+            if log:
+                logging.error("Component '{}' has no BOM line!".format(c['ref']))
             grouped['!!MISSING!! '+c['value']].append(c)
         elif c['BOM'] == 'VIRTUAL':
-            logging.warning(
-                "Component '{}' is VIRTUAL, will be excluded from the BOM."
-                .format(c['ref']))
+            if log:
+                logging.warning(
+                    "Component '{}' is VIRTUAL, will be excluded from the BOM."
+                    .format(c['ref']))
         else:
             grouped[c['BOM']].append(c)
+    return grouped
+
+
+def _bom_lines(l, comps, dnp=False):
+    """Return the BOM lines of the components sharing the BOM line l."""
+    try:
+        bomlines = parse_bomline(l)
+    except BomLineError as e:
+        logging.error(str(e))
+        bomlines = [{'description': '!!INVALID!! ' + l}]
+    for bomline in bomlines:
+        if dnp:
+            bomline['qty'] = 'DO NOT POPULATE'
+        else:
+            bomline['qty'] = len(comps) * bomline.get('mult', 1) or 'DO NOT POPULATE'
+        bomline['refs'] = ", ".join([c['ref'] for c in comps])
+        for component in comps:
+            # Allow component attributes to override the bomline
+            if component.get('MPN'):
+                bomline['MPN'] = component['MPN']
+            if component.get('manufacturer'):
+                bomline['manufacturer'] = component['manufacturer']
+            elif component.get('Manuf'):
+                bomline['manufacturer'] = component['Manuf']
+    return bomlines
+
+
+def _generate_bom(comps, log=True):
+    grouped = _group_components(comps, log)
     bom = []
     for l in sorted(grouped.keys()):
-        bomlines = parse_bomline(l)
-        for bomline in bomlines:
-            bomline['qty'] = len(grouped[l]) * bomline.get('mult', 1) or 'DO NOT POPULATE'
-            bomline['refs'] = ", ".join([c['ref'] for c in grouped[l]])
-            for component in grouped[l]:
-                # Allow component attributes to override the bomline
-                if component.get('MPN'):
-                    bomline['MPN'] = component['MPN']
-                if component.get('manufacturer'):
-                    bomline['manufacturer'] = component['manufacturer']
-                elif component.get('Manuf'):
-                    bomline['manufacturer'] = component['Manuf']
-            bom.append(bomline)
+        bom += _bom_lines(l, grouped[l])
     return bom
 
+
+def generate_variant_boms(comps, variants, footprints=None):
+    """Generate the BOM of several assembly variants in one pass.
+
+    'variants' maps each variant name to its definition, a dictionary
+    with an optional 'dnp' list of references not to populate and an
+    optional 'overrides' dictionary mapping references to the fields
+    they change, like {'R5': {'BOM': "RES SMD 22k 1% [0603]"}}. Returns
+    a dictionary with the BOM of each variant.
+
+    The components are grouped once, and only the groups holding
+    components changed by a variant are rebuilt for it. The lines of
+    the other groups are computed once and shared by all the variants
+    (they're the same objects, so don't modify them).
+
+    'footprints' checks the footprints like in generate_bom.
+
+    """
+    with stage('generate_variant_boms', components=len(comps),
+               variants=len(variants)) as info:
+        if footprints is not None:
+            info['footprint_mismatches'] = len(footprints.check(comps))
+        grouped = _group_components(comps)
+        line_of = {}
+        for l, group in grouped.items():
+            for c in group:
+                line_of[c['ref']] = l
+        by_ref = dict((c['ref'], c) for c in comps)
+        shared = {}
+        boms = {}
+        for name, variant in variants.items():
+            dnp = set(variant.get('dnp', ()))
+            overrides = variant.get('overrides', {})
+            unknown = (dnp | set(overrides)) - set(by_ref)
+            if unknown:
+                logging.warning("Variant '{}' changes unknown components: {}"
+                                .format(name, ", ".join(sorted(unknown))))
+            changes = dict((r, by_ref[r].override(fields))
+                           for r, fields in overrides.items() if r in by_ref)
+            # The groups the changed components leave or join
+            changed = set(line_of[r] for r in dnp | set(changes) if r in line_of)
+            changed.update(_group_components(changes.values(), log=False))
+            # Regroup their components by line and DNP state, in order
+            regrouped = defaultdict(list)
+            for c in comps:
+                ref = c['ref']
+                if ref in changes:
+                    c = changes[ref]
+                elif line_of.get(ref) not in changed:
+                    continue
+                for l, group in _group_components([c], log=False).items():
+                    regrouped[(l, ref in dnp)].extend(group)
+            keys = [((l, False), None) for l in grouped if l not in changed]
+            keys += [(key, group) for key, group in regrouped.items()]
+            bom = []
+            for (l, is_dnp), group in sorted(keys, key=lambda k: k[0]):
+                if group is None:
+                    if l not in shared:
+                        shared[l] = _bom_lines(l, grouped[l])
+                    bom += shared[l]
+                else:
+                    bom += _bom_lines(l, group, is_dnp)
+            boms[name] = bom
+        known_components.commit()
+        info['bom_lines'] = sum(len(b) for b in boms.values())
+        info['shared_lines'] = sum(len(b) for b in shared.values())
+    return boms
+
+
+_re_ref = re.compile(r'(\d+)')
+
+
+def _ref_key(ref):
+    """Sort R2 before R10."""
+    return [int(p) if p.isdigit() else p for p in _re_ref.split(ref)]
+
+
+def bom_index(bom):
+    """Map every reference designator to the first BOM line using it."""
+    index = {}
+    for line in bom:
+        for ref in line['refs'].split(', '):
+            index.setdefault(ref, line)
+    return index
+
 _bom_fields = ['qty','refs', 'description', 'package', 'manufacturer', 'MPN']
 
+def write_bom(bom, sinks):
+    """Write the BOM to every output.py sink in one pass."""
+    with stage('write_bom', sinks=len(sinks)) as info:
+        info['bom_lines'] = write_table(bom, _bom_fields, sinks)
+
+
 def write_bom_csv(bom, bom_file):
-    bom_writer = DictWriter(bom_file, fieldnames=_bom_fields,
-                            extrasaction='ignore')
-    bom_writer.writeheader()
-    for b in bom:
-        bom_writer.writerow(b)
+    with stage('write_bom_csv', bom_lines=len(bom)):
+        write_table(bom, _bom_fields, [DelimitedSink(bom_file)])
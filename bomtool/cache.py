@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""On-disk cache of parse results, keyed by the content of the input."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import sys
+import mmap
+import pickle
+import hashlib
+import tempfile
+
+from . import sexp
+
+# Bump when the layout of the cache entries changes
+_format = 1
+_suffix = '.pickle'
+
+
+def parser_version(loader):
+    """Fingerprint of the code used by 'loader' to parse its input.
+
+    Made from the source of every module of the package, and of the
+    module defining the loader when it's outside of it. Loaders use
+    more than their own module (load_pcb needs sexp and geometry), so
+    editing any of them invalidates the results.
+
+    """
+    h = hashlib.sha1()
+    h.update("{} {} {}.{}".format(_format, sys.version_info[:2],
+                                  loader.__module__, loader.__name__)
+             .encode('utf-8'))
+    package = os.path.dirname(os.path.abspath(__file__))
+    paths = sorted(os.path.join(package, name) for name in os.listdir(package)
+                   if name.endswith('.py'))
+    module = os.path.abspath(sys.modules[loader.__module__].__file__)
+    if module not in paths:
+        paths.append(module)
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def load_file(path, loader, use_mmap=False, cache=None):
+    """Call 'loader' on the file at 'path', through 'cache' if given."""
+    if cache is not None:
+        return cache.load(path, loader, use_mmap=use_mmap)
+    with open(path, 'rb' if use_mmap else 'r') as f:
+        return loader(f, use_mmap=use_mmap)
+
+
+def load_counted(path, loader, use_mmap=False, cache=None):
+    """load_file for other processes, which work on their own copy of
+    'cache'. Returns the result with the hits and misses of the call,
+    to add to the original with ParseCache.merge, or None without a
+    cache."""
+    if cache is None:
+        return load_file(path, loader, use_mmap), None
+    hits, misses = cache.hits, cache.misses
+    res = load_file(path, loader, use_mmap, cache)
+    return res, {'hits': cache.hits - hits, 'misses': cache.misses - misses}
+
+
+class ParseCache:
+    """Directory of pickled parse results bounded to 'max_size' bytes.
+
+    Entries are named after the hash of the parser version and the
+    content of the input, and the least recently used ones are removed
+    when the directory grows past its limit.
+    """
+
+    def __init__(self, directory, max_size=256 << 20):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._versions = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def load(self, path, loader, use_mmap=False):
+        """Return loader(data) for the contents of the file at 'path'.
+
+        The loader is only called when no result is cached for the same
+        contents and parser version. It receives the contents as bytes,
+        or as an mmap with 'use_mmap'.
+
+        """
+        with open(path, 'rb') as f:
+            data = use_mmap and sexp._map(f) or f.read()
+        try:
+            return self.parse(data, loader)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def parse(self, data, loader):
+        """Return loader(data), cached like in load."""
+        key = self.key(data, loader)
+        res = self.get(key)
+        if res is None:
+            self.misses += 1
+            res = loader(data)
+            self.put(key, res)
+        else:
+            self.hits += 1
+        return res
+
+    def key(self, data, loader):
+        version = self._versions.get(loader)
+        if version is None:
+            version = self._versions[loader] = parser_version(loader)
+        h = hashlib.sha1(version.encode('ascii'))
+        h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _suffix)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                res = pickle.load(f)
+        except (EnvironmentError, EOFError, pickle.UnpicklingError):
+            return None
+        # Keep the modification time as the last use for the eviction
+        os.utime(path, None)
+        return res
+
+    def put(self, key, res):
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(res, f, pickle.HIGHEST_PROTOCOL)
+        # Atomic, so concurrent runs never see half written entries
+        getattr(os, 'replace', os.rename)(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries above the size limit."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(_suffix):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except EnvironmentError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except EnvironmentError:
+                pass
+            total -= size
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def merge(self, counts):
+        """Add the counts returned by load_counted."""
+        if counts:
+            self.hits += counts['hits']
+            self.misses += counts['misses']
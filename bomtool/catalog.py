@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Local catalog of manufacturer parts for the jellybean BOM lines."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import uuid
+import sqlite3
+import logging
+from csv import DictReader
+from collections import defaultdict
+
+from .bomtool import parse_eng
+
+_schema = """
+CREATE TABLE IF NOT EXISTS parts (
+    kind TEXT NOT NULL,
+    package TEXT NOT NULL,
+    dielectric TEXT NOT NULL,
+    value REAL NOT NULL,
+    tolerance REAL,
+    voltage REAL,
+    power REAL,
+    manufacturer TEXT,
+    mpn TEXT NOT NULL,
+    price REAL,
+    preferred INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS groups (
+    kind TEXT NOT NULL,
+    package TEXT NOT NULL,
+    dielectric TEXT NOT NULL,
+    PRIMARY KEY (kind, package, dielectric)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# The candidates of a kind, package, dielectric and value are visited in
+# order of preference straight from the index, which also holds their
+# ratings; the first one good enough is the answer
+_index = ("CREATE INDEX IF NOT EXISTS parts_lookup ON parts"
+          " (kind, package, dielectric, value, preferred DESC, price IS NULL, price, mpn,"
+          " tolerance, voltage, power, manufacturer)")
+
+_lookup = ("SELECT preferred, price IS NULL, price, mpn, manufacturer FROM parts"
+           " WHERE kind = ? AND package = ? AND dielectric = ? AND value = ?"
+           " AND (? IS NULL OR tolerance <= ?)"
+           " AND (? IS NULL OR voltage >= ?)"
+           " AND (? IS NULL OR power >= ?)"
+           " ORDER BY preferred DESC, price IS NULL, price, mpn LIMIT 1")
+
+
+def _value_key(value):
+    """Round away the float noise of values parsed from different
+    notations, '4k7' and '4.7k' are the same value."""
+    return float('{:.6g}'.format(value))
+
+
+def _number(s, unit=''):
+    """Parse a catalog number like '10k', '5%' or '16V', None if empty."""
+    s = s.strip()
+    if s[-1:].upper() == unit.upper():
+        s = s[:-1]
+    if not s:
+        return None
+    value = parse_eng(s)
+    if value is None:
+        raise ValueError("Invalid number '{}'".format(s))
+    return value
+
+
+class Catalog(object):
+    """Manufacturer part tables kept in an indexed SQLite database.
+
+    Parts are looked up by kind ('RES SMD', 'CAP MLCC'), package,
+    dielectric and value, and filtered by their tolerance, voltage and
+    power ratings; among the candidates the preferred and then the
+    cheapest part wins.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.executescript(_schema)
+        self._db.execute(_index)
+        self._db.commit()
+        self._load_groups()
+
+    def _load_groups(self):
+        self._groups = defaultdict(list)
+        for kind, package, dielectric in self._db.execute("SELECT * FROM groups"):
+            self._groups[kind].append((package, dielectric))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM parts").fetchone()[0]
+
+    def version(self):
+        """Identifier of the catalog contents, changes on every import."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else ''
+
+    def import_csv(self, f, name='<csv>'):
+        """Add the parts of a CSV table, returns the number of rows.
+
+        The table has 'kind', 'value' and 'mpn' columns and optionally
+        'package', 'dielectric', 'tolerance', 'voltage', 'power',
+        'manufacturer', 'price' and 'preferred' ones. Values take the
+        engineering notation of the BOM lines, '4k7' or '100nF'.
+        """
+        reader = DictReader(f)
+        reader.fieldnames = [c.strip().lower() for c in reader.fieldnames or []]
+        missing = set(['kind', 'value', 'mpn']) - set(reader.fieldnames)
+        if missing:
+            raise ValueError("Missing columns {} in {}".format(
+                ", ".join(sorted(missing)), name))
+
+        groups = set()
+
+        def rows():
+            for n, row in enumerate(reader, 2):
+                get = lambda column: (row.get(column) or '').strip()
+                try:
+                    value = _number(get('value'))
+                    if value is None or not get('mpn'):
+                        raise ValueError("Missing value or part number")
+                    part = (" ".join(get('kind').upper().split()),
+                            get('package').strip('[]'),
+                            get('dielectric').upper())
+                    groups.add(part)
+                    yield part + (_value_key(value),
+                                  _number(get('tolerance'), '%'),
+                                  _number(get('voltage'), 'V'),
+                                  _number(get('power'), 'W'),
+                                  get('manufacturer'),
+                                  get('mpn'),
+                                  float(get('price')) if get('price') else None,
+                                  1 if get('preferred').lower() in ('1', 'y', 'yes', 'true') else 0)
+                except ValueError as e:
+                    raise ValueError("{} in line {} of {}".format(e, n, name))
+
+        before = len(self)
+        # Building the index once at the end is much faster than keeping
+        # it updated for every row of a large table
+        self._db.execute("DROP INDEX IF EXISTS parts_lookup")
+        try:
+            self._db.executemany("INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 rows())
+        except Exception:
+            self._db.rollback()
+            raise
+        finally:
+            self._db.execute(_index)
+        self._db.executemany("INSERT OR IGNORE INTO groups VALUES (?, ?, ?)", groups)
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                         (uuid.uuid4().hex,))
+        self._db.commit()
+        self._load_groups()
+        return len(self) - before
+
+    def find(self, kind, value, package=None, dielectric=None, tolerance=None,
+             voltage=None, power=None):
+        """Best part of the kind and value with at most the given tolerance
+        and at least the given voltage and power ratings.
+
+        Returns a {'manufacturer', 'MPN'} dictionary like the pngen
+        generators, or None if no part fits.
+        """
+        if value is None:
+            return None
+        ratings = []
+        for wanted in (tolerance, voltage, power):
+            ratings += [wanted, wanted]
+        # One indexed lookup per package and dielectric the catalog has
+        # for the kind, those left open are tried in turn
+        best = None
+        for group in self._groups.get(kind, ()):
+            if package is not None and group[0] != package:
+                continue
+            if dielectric is not None and group[1] != dielectric:
+                continue
+            row = self._db.execute(_lookup, (kind,) + group + (_value_key(value),)
+                                   + tuple(ratings)).fetchone()
+            if row is not None and (best is None or (-row[0],) + row[1:4] < (-best[0],) + best[1:4]):
+                best = row
+        if best is None:
+            return None
+        return {'manufacturer': best[4], 'MPN': best[3]}
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bomtool catalog",
+                                     description="Import manufacturer part tables into a parts catalog")
+    parser.add_argument("catalog", help="Catalog database, created if needed")
+    parser.add_argument("tables", help="CSV part tables to import", nargs='*', metavar="CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        catalog = Catalog(args.catalog)
+    except Exception as e:
+        parser.error("Error opening catalog '{}': {}".format(args.catalog, str(e)))
+    for path in args.tables:
+        try:
+            with io.open(path, newline='', encoding='utf-8') as f:
+                logging.info("Imported {} parts from '{}'".format(
+                    catalog.import_csv(f, path), path))
+        except Exception as e:
+            parser.error("Error importing '{}': {}".format(path, str(e)))
+    print("{} parts in catalog".format(len(catalog)))
+    catalog.close()
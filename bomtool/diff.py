@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Differences between the BOMs of several revisions of a netlist kept
+in git."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import subprocess
+
+from .bomtool import load_netlist, _generate_bom, _ref_key, known_components
+from .cache import parser_version
+from .stats import stage
+
+# Fields of the normalized BOM lines, lines are matched on the first two
+_line_fields = ('description', 'MPN', 'qty', 'refs', 'manufacturer', 'package')
+
+def normalize_bom(bom):
+    """Turn the lines of generate_bom into a (digest, lines) pair.
+
+    Each line becomes a tuple of _line_fields with the references sorted,
+    and the lines are sorted, so the digest of two BOMs is the same when
+    only the order of their lines or references differs.
+    """
+    lines = []
+    for line in bom:
+        refs = [r for r in line.get('refs', '').split(', ') if r]
+        lines.append((line.get('description') or '', line.get('MPN') or '',
+                      str(line.get('qty', '')), tuple(sorted(refs, key=_ref_key)),
+                      line.get('manufacturer') or '', line.get('package') or ''))
+    lines.sort()
+    digest = hashlib.sha1(json.dumps(lines).encode('utf-8')).hexdigest()
+    return digest, lines
+
+
+def _line(line):
+    return dict(zip(_line_fields, line))
+
+
+def diff_boms(old, new):
+    """Compare two normalize_bom results.
+
+    Returns a dictionary with the 'added' and 'removed' lines and the
+    'changed' ones, lines found in both BOMs with a different quantity,
+    references, manufacturer, package or MPN. Lines are matched by
+    description and MPN, and the leftovers by description alone.
+    """
+    diff = {'added': [], 'removed': [], 'changed': []}
+    if old[0] == new[0]:
+        return diff
+
+    def index(lines):
+        by_key = {}
+        for line in lines:
+            key = line[:2]
+            n = 0
+            while key in by_key:
+                # Several lines with the same part, keep them apart
+                n += 1
+                key = line[:2] + (n,)
+            by_key[key] = line
+        return by_key
+
+    old_lines = index(old[1])
+    new_lines = index(new[1])
+    left = {}
+    for key, line in old_lines.items():
+        other = new_lines.pop(key, None)
+        if other is None:
+            left.setdefault(line[0], []).append(line)
+        elif other != line:
+            diff['changed'].append((line, other))
+    added = []
+    for key, line in sorted(new_lines.items()):
+        if left.get(line[0]):
+            diff['changed'].append((left[line[0]].pop(0), line))
+        else:
+            added.append(line)
+    diff['added'] = [_line(l) for l in added]
+    diff['removed'] = [_line(l) for lines in left.values() for l in lines]
+    diff['removed'].sort(key=lambda l: (l['description'], l['MPN']))
+    changed = []
+    for a, b in sorted(diff['changed']):
+        change = {'description': b[0], 'old': _line(a), 'new': _line(b),
+                  'fields': [f for f, x, y in zip(_line_fields, a, b) if x != y]}
+        if a[3] != b[3]:
+            refs = set(a[3])
+            change['refs_added'] = [r for r in b[3] if r not in refs]
+            refs = set(b[3])
+            change['refs_removed'] = [r for r in a[3] if r not in refs]
+        changed.append(change)
+    diff['changed'] = changed
+    return diff
+
+
+def _git(args, cwd):
+    p = subprocess.Popen(['git'] + args, cwd=cwd, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise ValueError("git {}: {}".format(args[0], err.decode('utf-8', 'replace').strip()))
+    return out.decode('utf-8')
+
+
+def expand_revisions(revisions, path):
+    """Expand the A..B ranges among the revisions into A and every
+    commit after it changing the file at 'path', oldest first."""
+    cwd = os.path.dirname(os.path.abspath(path))
+    expanded = []
+    for rev in revisions:
+        if '..' in rev and '...' not in rev:
+            start = rev.split('..')[0] or 'HEAD'
+            expanded.append(start)
+            expanded += _git(['rev-list', '--reverse', '--abbrev-commit', rev,
+                              '--', os.path.basename(path)], cwd).split()
+        else:
+            expanded.append(rev)
+    return expanded
+
+
+class RevisionBoms:
+    """BOMs of the revisions of the netlist at 'path' in its git work tree.
+
+    The BOM of each revision is generated from the netlist blob of the
+    revision and kept normalized, keyed by the blob id, the pngen rules
+    and catalog version, and the version of the code. So revisions
+    sharing a netlist are only generated once, and with a 'cache'
+    (cache.ParseCache) across runs too.
+    """
+
+    def __init__(self, path, cache=None):
+        self.path = path
+        self.cwd = os.path.dirname(os.path.abspath(path))
+        self.cache = cache
+        self.generated = 0
+        self._boms = {}
+        prefix = _git(['rev-parse', '--show-prefix'], self.cwd).strip()
+        self._spec = ':' + prefix + os.path.basename(path)
+        self._version = None
+
+    def _blobs(self, revisions):
+        """Blob id of the netlist at each revision, None where missing."""
+        p = subprocess.Popen(['git', 'cat-file', '--batch-check'], cwd=self.cwd,
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        query = "".join(rev + self._spec + "\n" for rev in revisions)
+        out, err = p.communicate(query.encode('utf-8'))
+        if p.returncode != 0:
+            raise ValueError("git cat-file: {}".format(err.decode('utf-8', 'replace').strip()))
+        blobs = []
+        for rev, line in zip(revisions, out.decode('utf-8').splitlines()):
+            fields = line.split()
+            if len(fields) == 3 and fields[1] == 'blob':
+                blobs.append(fields[0])
+            else:
+                logging.warning("'{}' not in revision '{}', its BOM is empty"
+                                .format(self.path, rev))
+                blobs.append(None)
+        return blobs
+
+    def _key(self, blob):
+        if self._version is None:
+            self._version = parser_version(load_netlist) + parser_version(normalize_bom)
+        h = hashlib.sha1("{} {} {}".format(self._version, known_components.rules, blob)
+                         .encode('utf-8'))
+        return h.hexdigest()
+
+    def _generate(self, reader, blob):
+        reader.stdin.write(blob.encode('ascii') + b"\n")
+        reader.stdin.flush()
+        header = reader.stdout.readline().split()
+        if len(header) != 3:
+            raise ValueError("git cat-file: can't read blob {}".format(blob))
+        data = reader.stdout.read(int(header[2]))
+        reader.stdout.read(1)
+        self.generated += 1
+        # Only the differences matter, don't warn about every revision
+        return normalize_bom(_generate_bom(load_netlist(data), log=False))
+
+    def get(self, revisions):
+        """Return the normalized BOM of each revision."""
+        with stage('diff.boms', revisions=len(revisions)) as info:
+            blobs = self._blobs(revisions)
+            reader = None
+            try:
+                for blob in blobs:
+                    if blob is None or blob in self._boms:
+                        continue
+                    key = self._key(blob)
+                    bom = self.cache.get(key) if self.cache is not None else None
+                    if bom is None:
+                        if reader is None:
+                            reader = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                                      cwd=self.cwd, stdin=subprocess.PIPE,
+                                                      stdout=subprocess.PIPE)
+                        bom = self._generate(reader, blob)
+                        if self.cache is not None:
+                            self.cache.put(key, bom)
+                    self._boms[blob] = bom
+            finally:
+                if reader is not None:
+                    reader.stdin.close()
+                    reader.wait()
+            info['generated'] = self.generated
+        return [self._boms[b] if b is not None else normalize_bom([]) for b in blobs]
+
+
+def diff_revisions(path, revisions, cache=None):
+    """Diff the BOMs of each revision of the netlist at 'path' against
+    the one before it. Returns a list of (old, new, diff) tuples."""
+    boms = RevisionBoms(path, cache).get(revisions)
+    with stage('diff.compare', revisions=len(revisions)):
+        return [(revisions[i], revisions[i + 1], diff_boms(boms[i], boms[i + 1]))
+                for i in range(len(revisions) - 1)]
+
+
+def _describe(line):
+    return line['description'] + (" ({})".format(line['MPN']) if line['MPN'] else "")
+
+
+def format_diff(old, new, diff):
+    """Text report of a diff_boms result."""
+    out = ["{}..{}: {} added, {} removed, {} changed".format(
+        old, new, len(diff['added']), len(diff['removed']), len(diff['changed']))]
+    for sign, lines in (('+', diff['added']), ('-', diff['removed'])):
+        for line in lines:
+            out.append("  {} {}: {} {}".format(sign, _describe(line), line['qty'],
+                                                ", ".join(line['refs'])))
+    for change in diff['changed']:
+        a, b = change['old'], change['new']
+        details = []
+        for field in change['fields']:
+            if field == 'refs':
+                details.append("refs " + " ".join(
+                    ["+" + r for r in change['refs_added']] +
+                    ["-" + r for r in change['refs_removed']]))
+            else:
+                details.append("{} {} -> {}".format(field, a[field] or "''", b[field] or "''"))
+        out.append("  ~ {}: {}".format(_describe(a), "; ".join(details)))
+    return "\n".join(out)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bomtool diff",
+                                     description="Compare the BOMs of revisions of a netlist kept in git")
+    parser.add_argument("netlist", help="Netlist in a git work tree")
+    parser.add_argument("revisions", help="Revisions to compare, each against the one before it. "
+                        "A..B stands for A and every later commit changing the netlist up to B",
+                        nargs='+', metavar="REV")
+    parser.add_argument("--json", help="Print the differences as JSON", action='store_true')
+    parser.add_argument("--catalog", help="Pick the jellybean parts from this parts catalog when it has them",
+                        type=str, metavar="FILE")
+    parser.add_argument("--cache-dir", help="Keep the BOM of each revision in this directory",
+                        type=str, metavar="DIR")
+    parser.add_argument("--cache-size", help="Size limit of the cache in MiB (default: 256)",
+                        type=int, default=256, metavar="MIB")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache_dir:
+        from .cache import ParseCache
+        try:
+            cache = ParseCache(args.cache_dir, args.cache_size << 20)
+        except Exception as e:
+            parser.error("Error opening cache directory '{}': {}".format(args.cache_dir, str(e)))
+    if args.catalog:
+        from .catalog import Catalog
+        try:
+            known_components.use_catalog(Catalog(args.catalog))
+        except Exception as e:
+            parser.error("Error opening catalog '{}': {}".format(args.catalog, str(e)))
+
+    try:
+        revisions = expand_revisions(args.revisions, args.netlist)
+        if len(revisions) < 2:
+            parser.error("At least two revisions are needed")
+        diffs = diff_revisions(args.netlist, revisions, cache)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.json:
+        json.dump([{'old': a, 'new': b, 'diff': d} for a, b, d in diffs],
+                  sys.stdout, indent=2)
+        print()
+    else:
+        for a, b, d in diffs:
+            print(format_diff(a, b, d))
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Index of the KiCad footprint libraries, to check the packages of the
+BOM lines against the footprints of the components."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import re
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from . import sexp
+from .sexp import car, findall
+from .bomtool import _known_pkgs
+from .geometry import Outlines, shapes
+from .stats import stage
+
+# KiCad 6 and later call the modules footprints
+_mod_keep = dict((head, {'pad'} | {'fp_' + s for s in shapes})
+                 for head in ('module', 'footprint'))
+
+# Footprints are stored under the path of their library, libraries of
+# the same name in different directories are kept apart
+_schema = """
+CREATE TABLE IF NOT EXISTS libraries (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS footprints (
+    library TEXT NOT NULL,
+    name TEXT NOT NULL,
+    pads INTEGER NOT NULL,
+    size_x REAL NOT NULL,
+    size_y REAL NOT NULL,
+    package TEXT NOT NULL,
+    PRIMARY KEY (library, name)
+);
+"""
+
+# Bump when the layout of the index changes, older indexes are dropped
+_schema_version = 1
+
+# Parsing a handful of files in other processes costs more than it saves
+_parallel_min = 64
+
+_re_chip = re.compile(r'(?:^|_)(\d{4})_(\d{4})Metric')
+_re_sep = re.compile(r'[-_]')
+# Exposed pads, like the 1EP of QFN-16-1EP_3x3mm
+_re_ep = re.compile(r'(\d*)EP$')
+# Families numbered after their outline, SOT-23 has 3 pins, SOT-23-5 5
+_outline_families = {'SOT', 'SOD', 'TO', 'DO'}
+
+# Imperial code of the metric chip sizes, '1608' -> '0603'
+_metric_pkgs = dict((m, code) for code, desc in _known_pkgs.items()
+                    for m in re.findall(r'(\d{4}) Metric', desc))
+
+
+def package_class(name):
+    """Package of a footprint after its name, like '0603' for
+    R_0603_1608Metric or 'SOIC-8' for SOIC-8_3.9x4.9mm_P1.27mm."""
+    chip = _re_chip.search(name)
+    if chip:
+        return chip.group(1)
+    return name.split('_')[0]
+
+
+def package_match(package, name):
+    """Check the package of a BOM line, as bom_package names it, against
+    the name of a footprint.
+
+    The name must start with the fields (split at '-' and '_') of the
+    package, followed by dimensions or variants but not by another
+    number, so [QFN-16] is a QFN-16-1EP_3x3mm but [SOT-23] isn't a
+    SOT-23-5. Returns a (mismatch, pads) pair: None or the package_class
+    of the footprint when it isn't of the package, and the pad count the
+    package implies, exposed pads included, or None when it doesn't say.
+    """
+    chip = _re_chip.search(name)
+    if chip:
+        return (None if package == chip.group(1) else chip.group(1)), None
+    wanted = _re_sep.split(package.upper())
+    fields = _re_sep.split(name.upper())
+    rest = fields[len(wanted):]
+    if fields[:len(wanted)] != wanted or (rest and rest[0].isdigit()):
+        return package_class(name), None
+    pins = None
+    if len(wanted) > 1 and wanted[-1].isdigit() and (
+            wanted[-2].isdigit() or wanted[-2] not in _outline_families):
+        pins = int(wanted[-1])
+        for f in rest:
+            ep = _re_ep.match(f)
+            if ep:
+                pins += int(ep.group(1) or 1)
+    return None, pins
+
+
+def bom_package(code):
+    """Package of the [code] of a BOM line as package_class names it."""
+    if code[-1:] in ('m', 'M') and code[:-1] in _metric_pkgs:
+        return _metric_pkgs[code[:-1]]
+    return code
+
+
+def parse_footprint(path):
+    """Pad count, courtyard size (mm) and package class of a .kicad_mod."""
+    with open(path, 'rb') as f:
+        data = car(sexp.load(f, keep=_mod_keep, depth=0))
+    # Pads sharing a number are one pin, unnumbered ones are mechanical
+    pads = set(p[1] for p in findall(data, 'pad') if len(p) > 1 and p[1] != '')
+    courtyard = Outlines('CrtYd')
+    courtyard.add(data)
+    min_x, min_y, max_x, max_y = courtyard.bounding_boxes()
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (name, len(pads), max_x[0] - min_x[0], max_y[0] - min_y[0],
+            package_class(name))
+
+
+def _parse_footprint(path):
+    try:
+        return path, parse_footprint(path)
+    except Exception as e:
+        logging.warning("Can't read footprint '{}': {}".format(path, e))
+        return path, None
+
+
+def _libraries(directories):
+    """The .pretty libraries in or among the given directories."""
+    for d in directories:
+        d = os.path.normpath(d)
+        if d.endswith('.pretty'):
+            yield d
+            continue
+        for entry in sorted(os.listdir(d)):
+            if entry.endswith('.pretty'):
+                yield os.path.join(d, entry)
+
+
+def _library_state(path):
+    """Footprint files of a library and its latest modification time."""
+    files = []
+    mtime = os.stat(path).st_mtime
+    for entry in os.listdir(path):
+        if entry.endswith('.kicad_mod'):
+            entry = os.path.join(path, entry)
+            files.append(entry)
+            mtime = max(mtime, os.stat(entry).st_mtime)
+    return files, mtime
+
+
+class FootprintIndex(object):
+    """Pad count, courtyard size and package of the footprints of a set of
+    libraries, kept in an SQLite database across runs.
+
+    update() only reads the libraries changed since they were indexed.
+    Footprints are looked up by their 'Library:Name' like in the
+    footprint field of the components.
+    """
+
+    def __init__(self, path=':memory:'):
+        self._db = sqlite3.connect(path, timeout=30)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != _schema_version:
+            # Only a cache of the libraries, read them again
+            self._db.executescript("DROP TABLE IF EXISTS libraries;"
+                                   " DROP TABLE IF EXISTS footprints;")
+            self._db.execute("PRAGMA user_version = {}".format(_schema_version))
+        self._db.executescript(_schema)
+        self._db.commit()
+        # Libraries of the last update by order of the directories
+        self._order = {}
+        self._load()
+
+    def _load(self):
+        self.libraries = set(name for name, in self._db.execute("SELECT name FROM libraries"))
+        rows = self._db.execute(
+            "SELECT libraries.path, libraries.name, footprints.name, pads, size_x, size_y, package"
+            " FROM footprints JOIN libraries ON footprints.library = libraries.path").fetchall()
+        # Of the libraries with the same name, the first one is used
+        order = self._order
+        rows.sort(key=lambda r: (order.get(r[0], len(order)), r[0]))
+        self._footprints = {}
+        for path, library, name, pads, size_x, size_y, package in rows:
+            self._footprints.setdefault((library, name), {
+                'pads': pads, 'size_x': size_x, 'size_y': size_y, 'package': package})
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return len(self._footprints)
+
+    def get(self, footprint):
+        """Attributes of the 'Library:Name' footprint, None if unknown."""
+        library, _, name = footprint.rpartition(':')
+        return self._footprints.get((library, name))
+
+    def update(self, directories, jobs=None):
+        """Index the libraries in the directories, returns the number of
+        libraries read. Libraries unchanged since the last update are
+        skipped, the footprint files of the others are parsed on a pool
+        of 'jobs' processes."""
+        with stage('footprints.index') as info:
+            stale = {}
+            self._order = {}
+            names = {}
+            for path in _libraries(directories):
+                self._order.setdefault(path, len(self._order))
+                name = os.path.basename(path)[:-len('.pretty')]
+                if names.setdefault(name, path) != path:
+                    logging.warning("Libraries '{}' and '{}' have the same name, footprints"
+                                    " are taken from the first".format(names[name], path))
+                files, mtime = _library_state(path)
+                row = self._db.execute("SELECT mtime FROM libraries WHERE path = ?",
+                                       (path,)).fetchone()
+                if row is None or row[0] != mtime:
+                    stale[path] = (files, mtime)
+            files = [f for path in sorted(stale) for f in stale[path][0]]
+            info['libraries'] = len(stale)
+            info['footprints'] = len(files)
+            if len(files) >= _parallel_min and jobs != 1:
+                with ProcessPoolExecutor(max_workers=jobs) as pool:
+                    parsed = dict(pool.map(_parse_footprint, files, chunksize=32))
+            else:
+                parsed = dict(_parse_footprint(f) for f in files)
+        for path, (files, mtime) in stale.items():
+            library = os.path.basename(path)[:-len('.pretty')]
+            self._db.execute("DELETE FROM footprints WHERE library = ?", (path,))
+            self._db.executemany("INSERT OR REPLACE INTO footprints VALUES (?, ?, ?, ?, ?, ?)",
+                                 ((path,) + parsed[f] for f in files
+                                  if parsed[f] is not None))
+            self._db.execute("INSERT OR REPLACE INTO libraries VALUES (?, ?, ?)",
+                             (path, library, mtime))
+        self._db.commit()
+        self._load()
+        return len(stale)
+
+    def check(self, comps):
+        """Warn about the components whose footprint doesn't match the
+        package of their BOM line. Returns the references of those."""
+        mismatched = []
+        for c in comps:
+            footprint = c.get('footprint') or ''
+            # Only the first item of a line is the part of the symbol
+            fields = (c.get('BOM') or '').split(';')[0].split()
+            if not footprint or not fields or fields[-1][0] + fields[-1][-1] != "[]":
+                continue
+            package = bom_package(fields[-1][1:-1])
+            attrs = self.get(footprint)
+            if attrs is None:
+                if footprint.rpartition(':')[0] in self.libraries:
+                    logging.warning("Component '{}' footprint '{}' is not in its library"
+                                    .format(c['ref'], footprint))
+                    mismatched.append(c['ref'])
+                continue
+            other, pins = package_match(package, footprint.rpartition(':')[2])
+            if other is not None:
+                problem = "is a {} package".format(other)
+            elif pins is not None and pins != attrs['pads']:
+                problem = "has {} pads".format(attrs['pads'])
+            else:
+                continue
+            logging.warning("Component '{}' footprint '{}' {} but its BOM line says [{}]"
+                            .format(c['ref'], footprint, problem, fields[-1][1:-1]))
+            mismatched.append(c['ref'])
+        return mismatched
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Batched geometry of boards: outline bounding boxes and placements.
+
+The outline primitives of every module (or of the board) are collected
+into flat arrays, and all the bounding boxes are computed in one pass
+with NumPy when it's installed, or with plain loops over the arrays
+otherwise. Placements are moved to machine coordinates, and repeated
+over a panel, the same way.
+
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+from .sexp import findall
+
+import math
+import numbers
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Shapes understood by Outlines.add, as footprint (fp_) or board (gr_)
+# graphic items
+shapes = ['line', 'rect', 'circle', 'arc', 'poly']
+_shapes = frozenset(shapes)
+
+
+def _xy(point):
+    return float(point[1]), float(point[2])
+
+
+class Outlines:
+    """Outlines drawn on 'layer' by a list of modules, as flat arrays.
+
+    The layer matches any layer containing it, so 'CrtYd' takes the
+    courtyards of both sides. Polygonal outlines are stored as their
+    vertices, circles and arcs as center, radius, start angle and sweep
+    (in degrees, in the Y-down coordinates of the board).
+    """
+
+    def __init__(self, layer='CrtYd'):
+        self.layer = layer
+        self.count = 0
+        self.rot = array('d')
+        self.pm, self.px, self.py = array('l'), array('d'), array('d')
+        self.am, self.ax, self.ay = array('l'), array('d'), array('d')
+        self.ar, self.aa, self.asweep = array('d'), array('d'), array('d')
+
+    def _point(self, x, y):
+        self.pm.append(self.count)
+        self.px.append(x)
+        self.py.append(y)
+
+    def _arc(self, center, start, sweep):
+        cx, cy = center
+        dx, dy = start[0] - cx, start[1] - cy
+        self.am.append(self.count)
+        self.ax.append(cx)
+        self.ay.append(cy)
+        self.ar.append(math.hypot(dx, dy))
+        self.aa.append(math.degrees(math.atan2(dy, dx)))
+        self.asweep.append(sweep)
+
+    def add(self, data, rot=0.0):
+        """Add the outline drawn by the items of a module (or of a board
+        for gr_ items), rotated 'rot' degrees."""
+        for item in data:
+            if (not isinstance(item, list) or not item
+                    or item[0][:3] not in ('fp_', 'gr_')
+                    or item[0][3:] not in _shapes):
+                continue
+            # A single pass over the attributes, cheaper than assoc-ing
+            # each of them
+            attrs = {}
+            for a in item:
+                if isinstance(a, list) and a:
+                    attrs.setdefault(a[0], a)
+            layer = attrs.get('layer')
+            if not layer or self.layer not in layer[1]:
+                continue
+            kind = item[0][3:]
+            if kind == 'line':
+                self._point(*_xy(attrs['start']))
+                self._point(*_xy(attrs['end']))
+            elif kind == 'rect':
+                (x0, y0), (x1, y1) = _xy(attrs['start']), _xy(attrs['end'])
+                for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1)):
+                    self._point(x, y)
+            elif kind == 'circle':
+                self._arc(_xy(attrs['center']), _xy(attrs['end']), 360.0)
+            elif kind == 'arc':
+                if 'angle' in attrs:
+                    self._arc(_xy(attrs['start']), _xy(attrs['end']),
+                              float(attrs['angle'][1]))
+                else:
+                    # Three point arcs, bounded by their points
+                    for key in ('start', 'mid', 'end'):
+                        if key in attrs:
+                            self._point(*_xy(attrs[key]))
+            else:
+                for xy in findall(attrs.get('pts', []), 'xy'):
+                    self._point(float(xy[1]), float(xy[2]))
+        self.rot.append(rot)
+        self.count += 1
+
+    def bounding_boxes(self):
+        """Return the (min_x, min_y, max_x, max_y) lists of the modules.
+
+        The boxes are axis aligned on the board, so they are computed
+        after rotating each outline by its module rotation. Modules
+        without an outline get an empty box at their origin.
+
+        """
+        if numpy is not None:
+            return self._bounding_boxes_numpy()
+        return self._bounding_boxes_array()
+
+    def _bounding_boxes_numpy(self):
+        np = numpy
+        rot = np.radians(np.frombuffer(self.rot, dtype='d'))
+        cos, sin = np.cos(rot), np.sin(rot)
+        # Points and arc centers, rotated counterclockwise on screen
+        pm = np.frombuffer(self.pm, dtype=self.pm.typecode)
+        px = np.frombuffer(self.px, dtype='d')
+        py = np.frombuffer(self.py, dtype='d')
+        xs = [px * cos[pm] + py * sin[pm]]
+        ys = [py * cos[pm] - px * sin[pm]]
+        ms = [pm]
+        am = np.frombuffer(self.am, dtype=self.am.typecode)
+        if len(am):
+            ax = np.frombuffer(self.ax, dtype='d')
+            ay = np.frombuffer(self.ay, dtype='d')
+            r = np.frombuffer(self.ar, dtype='d')
+            sweep = np.frombuffer(self.asweep, dtype='d')
+            cx = ax * cos[am] + ay * sin[am]
+            cy = ay * cos[am] - ax * sin[am]
+            start = np.frombuffer(self.aa, dtype='d') - np.degrees(rot)[am]
+            start = np.where(sweep < 0, start + sweep, start)
+            length = np.minimum(np.abs(sweep), 360.0)
+            # The extremes of an arc are its ends and the axis crossings
+            # within its sweep
+            for angle, inside in [(start, None), (start + length, None)] + [
+                    (np.full_like(start, a), np.mod(a - start, 360.0) <= length)
+                    for a in (0.0, 90.0, 180.0, 270.0)]:
+                t = np.radians(angle)
+                x, y, m = cx + r * np.cos(t), cy + r * np.sin(t), am
+                if inside is not None:
+                    x, y, m = x[inside], y[inside], m[inside]
+                xs.append(x)
+                ys.append(y)
+                ms.append(m)
+        xs, ys, ms = np.concatenate(xs), np.concatenate(ys), np.concatenate(ms)
+        min_x = np.full(self.count, np.inf)
+        min_y = np.full(self.count, np.inf)
+        max_x = np.full(self.count, -np.inf)
+        max_y = np.full(self.count, -np.inf)
+        np.minimum.at(min_x, ms, xs)
+        np.minimum.at(min_y, ms, ys)
+        np.maximum.at(max_x, ms, xs)
+        np.maximum.at(max_y, ms, ys)
+        empty = np.isinf(min_x)
+        for a in (min_x, min_y, max_x, max_y):
+            a[empty] = 0.0
+        return min_x.tolist(), min_y.tolist(), max_x.tolist(), max_y.tolist()
+
+    def _bounding_boxes_array(self):
+        inf = float('inf')
+        min_x, min_y = [inf] * self.count, [inf] * self.count
+        max_x, max_y = [-inf] * self.count, [-inf] * self.count
+        cos = [math.cos(math.radians(a)) for a in self.rot]
+        sin = [math.sin(math.radians(a)) for a in self.rot]
+
+        def extend(m, x, y):
+            if x < min_x[m]: min_x[m] = x
+            if y < min_y[m]: min_y[m] = y
+            if x > max_x[m]: max_x[m] = x
+            if y > max_y[m]: max_y[m] = y
+
+        for m, x, y in zip(self.pm, self.px, self.py):
+            extend(m, x * cos[m] + y * sin[m], y * cos[m] - x * sin[m])
+        for m, x, y, r, start, sweep in zip(self.am, self.ax, self.ay,
+                                             self.ar, self.aa, self.asweep):
+            cx, cy = x * cos[m] + y * sin[m], y * cos[m] - x * sin[m]
+            start -= self.rot[m]
+            if sweep < 0:
+                start += sweep
+            length = min(abs(sweep), 360.0)
+            angles = [start, start + length]
+            angles += [a for a in (0.0, 90.0, 180.0, 270.0)
+                       if (a - start) % 360.0 <= length]
+            for a in angles:
+                t = math.radians(a)
+                extend(m, cx + r * math.cos(t), cy + r * math.sin(t))
+        for m in range(self.count):
+            if min_x[m] == inf:
+                min_x[m] = min_y[m] = max_x[m] = max_y[m] = 0.0
+        return min_x, min_y, max_x, max_y
+
+
+# Exact cosine and sine of the rotations allowed for panel copies
+_quarter_turns = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}
+
+
+def panel_copies(width, height, cols=1, rows=1, rotations=(0,), step=None):
+    """Offsets and rotations of the boards of a cols x rows panel.
+
+    Returns a list of (dx, dy, angle) per board, by rows from the lower
+    left corner. 'rotations' are cycled over the boards and must be
+    multiples of 90 degrees. The default 'step' between boards is the
+    largest board footprint once rotated, so none overlap.
+
+    """
+    angles = []
+    for i in range(cols * rows):
+        angle = rotations[i % len(rotations)] % 360
+        if angle not in _quarter_turns:
+            raise ValueError("Panel rotations must be multiples of 90 degrees")
+        angles.append(int(angle))
+    if step is None:
+        turned = any(a in (90, 270) for a in angles)
+        step = (max(width, height) if turned else width,
+                max(width, height) if turned else height)
+    return [(step[0] * (i % cols), step[1] * (i // cols), angle)
+            for i, angle in enumerate(angles)]
+
+
+def parse_panel(panel, step=None, rotations=None):
+    """panel_copies options from their text form, 'COLSxROWS', 'X,Y'
+    and 'DEG[,DEG...]'. Raises ValueError when they're not valid."""
+    cols, rows = (int(n) for n in panel.lower().split('x'))
+    options = {'cols': cols, 'rows': rows}
+    if step:
+        options['step'] = tuple(float(n) for n in step.split(','))
+    if rotations:
+        options['rotations'] = [float(n) for n in rotations.split(',')]
+    return check_panel(options)
+
+
+def _is_number(n):
+    return isinstance(n, numbers.Real) and not isinstance(n, bool)
+
+
+def check_panel(options):
+    """Check a dictionary of panel_copies options, like the 'panel' of
+    a batch project, raising ValueError when they're not valid."""
+    try:
+        for n in (options.get('cols', 1), options.get('rows', 1)):
+            if not isinstance(n, numbers.Integral) or isinstance(n, bool) or n < 1:
+                raise ValueError("A panel needs at least one column and one row of whole boards")
+        step = options.get('step')
+        if step is not None and (len(step) != 2 or not all(_is_number(n) for n in step)):
+            raise ValueError("The panel step is an X,Y pair")
+        rotations = options.get('rotations', (0,))
+        if (not rotations or not all(_is_number(a) for a in rotations)
+                or any(a % 90 for a in rotations)):
+            raise ValueError("Panel rotations must be multiples of 90 degrees")
+        panel_copies(1, 1, **options)
+    except TypeError as e:
+        raise ValueError(str(e))
+    return options
+
+
+def place(xs, ys, rots, outline, copies=((0, 0, 0),)):
+    """Convert board positions to machine coordinates, for each copy.
+
+    'xs', 'ys' and 'rots' are the positions (in mm, Y down) and
+    rotations of the placements, 'outline' the (min_x, min_y, max_x,
+    max_y) box of the board. The machine coordinates are in mils, Y up,
+    from the lower left corner of the board. Each (dx, dy, angle) copy
+    is rotated around that corner, moved back to the first quadrant and
+    offset by (dx, dy) mm. Returns the X, Y and rotation lists of all
+    the copies one after another.
+
+    """
+    min_x, min_y, max_x, max_y = outline
+    width, height = max_x - min_x, max_y - min_y
+    shifts = {0: (0, 0), 90: (height, 0), 180: (width, height), 270: (0, width)}
+    if numpy is not None:
+        np = numpy
+        x = np.asarray(xs, dtype='d') - min_x
+        y = max_y - np.asarray(ys, dtype='d')
+        rot = np.asarray(rots, dtype='d')
+        cos = np.array([[_quarter_turns[a][0]] for dx, dy, a in copies])
+        sin = np.array([[_quarter_turns[a][1]] for dx, dy, a in copies])
+        ox = np.array([[dx + shifts[a][0]] for dx, dy, a in copies])
+        oy = np.array([[dy + shifts[a][1]] for dx, dy, a in copies])
+        angle = np.array([[a] for dx, dy, a in copies])
+        mx = (x * cos - y * sin + ox) / 0.0254
+        my = (x * sin + y * cos + oy) / 0.0254
+        # Keep the rotations of unturned copies as they are in the board
+        mrot = np.where(angle == 0, rot, np.mod(rot + angle, 360.0))
+        return mx.ravel().tolist(), my.ravel().tolist(), mrot.ravel().tolist()
+    mx, my, mrot = [], [], []
+    for dx, dy, a in copies:
+        cos, sin = _quarter_turns[a]
+        ox, oy = dx + shifts[a][0], dy + shifts[a][1]
+        for x, y, rot in zip(xs, ys, rots):
+            x, y = x - min_x, max_y - y
+            mx.append((x * cos - y * sin + ox) / 0.0254)
+            my.append((x * sin + y * cos + oy) / 0.0254)
+            mrot.append((rot + a) % 360.0 if a else rot)
+    return mx, my, mrot
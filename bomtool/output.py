@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Streaming writers for the BOM and XYRS tables.
+
+Records are turned into tuples in the column order of the table and
+handed to every sink a chunk at a time, so several formats are written
+in one pass over the records.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import csv
+import json
+import sqlite3
+from itertools import islice
+
+# Rows handed to the sinks at a time
+_chunk_rows = 1024
+
+_encode = json.JSONEncoder(check_circular=False).encode
+
+
+class DelimitedSink(object):
+    """CSV rows in a file, comma separated by default or with any other
+    csv dialect like excel_tab."""
+
+    def __init__(self, f, dialect=csv.excel, owned=False):
+        self.file = f
+        self.owned = owned
+        self._writer = csv.writer(f, dialect)
+
+    def start(self, columns):
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self, ok=True):
+        if self.owned:
+            self.file.close()
+
+
+class JsonLinesSink(object):
+    """One JSON object per line, with the columns as keys."""
+
+    def __init__(self, f, owned=False):
+        self.file = f
+        self.owned = owned
+        self.columns = None
+
+    def start(self, columns):
+        self.columns = columns
+
+    def write(self, rows):
+        columns = self.columns
+        self.file.write("".join([_encode(dict(zip(columns, row))) + "\n"
+                                 for row in rows]))
+
+    def close(self, ok=True):
+        if self.owned:
+            self.file.close()
+
+
+class SqliteSink(object):
+    """Rows of a table in an SQLite database, replacing its previous
+    contents, for tools importing the BOM from there. The table is
+    replaced in a single transaction, kept only when closed with 'ok'."""
+
+    def __init__(self, path, table):
+        self.table = table
+        self._db = sqlite3.connect(path, timeout=30)
+        self._insert = None
+
+    def start(self, columns):
+        quoted = ['"{}"'.format(c.replace('"', '""')) for c in columns]
+        table = '"{}"'.format(self.table.replace('"', '""'))
+        # sqlite3 doesn't open transactions for the table changes itself
+        self._db.execute("BEGIN")
+        self._db.execute("DROP TABLE IF EXISTS {}".format(table))
+        self._db.execute("CREATE TABLE {} ({})".format(table, ", ".join(quoted)))
+        self._insert = "INSERT INTO {} VALUES ({})".format(
+            table, ", ".join("?" * len(columns)))
+
+    def write(self, rows):
+        self._db.executemany(self._insert, rows)
+
+    def close(self, ok=True):
+        if ok:
+            self._db.commit()
+        else:
+            self._db.rollback()
+        self._db.close()
+
+
+_formats = {
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+    '.xyrs': 'tsv',
+    '.jsonl': 'jsonl',
+    '.db': 'sqlite',
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+}
+
+
+def open_sink(path, table, default='csv'):
+    """Sink writing the table to path, in the format of its extension
+    (see _formats) or the 'default' one. SQLite sinks write a table
+    named 'table'."""
+    kind = _formats.get(os.path.splitext(path)[1].lower(), default)
+    if kind == 'sqlite':
+        return SqliteSink(path, table)
+    f = open(path, 'w')
+    if kind == 'jsonl':
+        return JsonLinesSink(f, owned=True)
+    return DelimitedSink(f, csv.excel_tab if kind == 'tsv' else csv.excel,
+                         owned=True)
+
+
+def table_rows(records, columns):
+    """The records (dictionaries) as tuples of the columns, with '' for
+    the missing ones."""
+    blanks = ('',) * len(columns)
+    for r in records:
+        yield tuple(map(r.get, columns, blanks))
+
+
+def write_table(records, columns, sinks):
+    """Write the records to every sink, returns the number of rows."""
+    for sink in sinks:
+        sink.start(columns)
+    rows = table_rows(records, columns)
+    count = 0
+    while True:
+        chunk = list(islice(rows, _chunk_rows))
+        if not chunk:
+            return count
+        for sink in sinks:
+            sink.write(chunk)
+        count += len(chunk)
+
+
+def write_outputs(write, records, paths, table, default='csv'):
+    """Write the records to every path in a single pass, with
+    write(records, sinks) like write_bom. The directories of the paths
+    are made if missing, and the sinks are closed even on errors, the
+    SQLite ones without their changes."""
+    sinks = []
+    ok = False
+    try:
+        for path in paths:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            sinks.append(open_sink(path, table, default))
+        write(records, sinks)
+        ok = True
+    finally:
+        for sink in sinks:
+            sink.close(ok)
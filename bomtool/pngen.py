@@ -1,3 +1,5 @@
+import hashlib
+
 
 def RC(value, tolerance=5.0, power=None, package="0603",pkgcode="07"):
     res = {"manufacturer": "Yageo"}
@@ -38,3 +40,21 @@ def CC_XxR(value, tolerance=10, voltage=16, package='0603', pkgcode='R', dielect
     t_str = 'K'
     res["MPN"] = "CC{}{}{}{}{}BB{}".format(package, t_str, pkgcode, dielectric, v_str, c_str)
     return res
+
+
+# Generators and tables whose behaviour decides the generated part numbers
+_rules = [RC, CC_XxR, _cc_voltages]
+
+
+def rules_version():
+    """Fingerprint of the part number rules, changes whenever they do."""
+    h = hashlib.sha1()
+    for rule in _rules:
+        code = getattr(rule, '__code__', None)
+        if code is None:
+            h.update(repr(sorted(rule.items())).encode('utf-8'))
+        else:
+            h.update(code.co_code)
+            h.update(repr((code.co_consts, code.co_names,
+                           rule.__defaults__)).encode('utf-8'))
+    return h.hexdigest()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Read the components of a design straight from its KiCad 6 (and later)
+hierarchical schematic, without exporting a netlist first."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import sexp
+from .sexp import cadr, findall, assoc
+from .bomtool import Component, load_netlist, _intern, _ref_key
+from .cache import load_file, load_counted
+from .stats import stage
+
+# Only the placed symbols, the sheets and the instance data are read,
+# the symbol library cache, wires and graphics are skipped
+_sch_keep = {
+    'uuid': None,
+    'symbol': {'uuid': None, 'property': set(), 'instances': None},
+    'sheet': {'uuid': None, 'property': set()},
+    'symbol_instances': None,
+}
+
+# Properties that aren't netlist fields
+_attributes = {'Reference': 'ref', 'Value': 'value', 'Footprint': 'footprint'}
+_not_fields = set(_attributes) | {'Datasheet'}
+
+# Sheets parsed in a pool of processes once this many are read at once
+_parallel_min = 8
+
+
+def _instance_paths(instances):
+    """Map the sheet paths of the (instances (project (path ...)))
+    of a symbol to their (ref, value, footprint)."""
+    paths = {}
+    for project in findall(instances[1:], 'project'):
+        for path in findall(project, 'path'):
+            paths[path[1]] = tuple(cadr(assoc(path, a)) for a in ('reference', 'value', 'footprint'))
+    return paths
+
+
+def parse_sheet(sch_file, use_mmap=False):
+    """Parse the symbols and sub-sheets of a single schematic file.
+
+    Returns a dictionary with the 'uuid' of the sheet, its 'symbols'
+    as (uuid, ref, value, footprint, fields, instances) tuples, where
+    'fields' is flat like in Component and 'instances' maps the sheet
+    paths of the symbol to its (ref, value, footprint) there, its
+    'sheets' as (uuid, file) pairs and the 'symbol_instances' of the
+    KiCad 6 root sheets, mapping the full paths of the symbols to their
+    (ref, value, footprint).
+    """
+    sheet = {'uuid': None, 'symbols': [], 'sheets': [], 'symbol_instances': {}}
+    for e in sexp.iterparse(sch_file, keep=_sch_keep, use_mmap=use_mmap):
+        head = e[0]
+        if head == 'symbol':
+            attrs = {'ref': '', 'value': '', 'footprint': ''}
+            fields = []
+            for prop in findall(e, 'property'):
+                name, value = prop[1], prop[2] if len(prop) > 2 else ''
+                if name in _attributes:
+                    attrs[_attributes[name]] = value
+                elif name not in _not_fields and value != '':
+                    fields += [name, value]
+            instances = assoc(e, 'instances')
+            sheet['symbols'].append((cadr(assoc(e, 'uuid')), attrs['ref'], attrs['value'],
+                                     attrs['footprint'], tuple(fields),
+                                     _instance_paths(instances) if instances else {}))
+        elif head == 'sheet':
+            props = dict((p[1], p[2]) for p in findall(e, 'property') if len(p) > 2)
+            sheet['sheets'].append((cadr(assoc(e, 'uuid')),
+                                    props.get('Sheetfile', props.get('Sheet file'))))
+        elif head == 'uuid':
+            sheet['uuid'] = e[1]
+        elif head == 'symbol_instances':
+            for path in findall(e[1:], 'path'):
+                sheet['symbol_instances'][path[1]] = tuple(
+                    cadr(assoc(path, a)) for a in ('reference', 'value', 'footprint'))
+    return sheet
+
+
+def _load_sheet(path, cache):
+    return load_file(path, parse_sheet, cache=cache)
+
+
+def _sheet_file(parent, name):
+    if not name:
+        raise ValueError("Sheet in '{}' has no file".format(parent))
+    return os.path.normpath(os.path.join(os.path.dirname(parent), name))
+
+
+def _parse_sheets(root, jobs, cache):
+    """Parse every distinct sheet file of the hierarchy once, level by
+    level, those of a level in parallel when there are many."""
+    sheets = {}
+    pending = [root]
+    pool = None
+    try:
+        while pending:
+            todo = sorted(set(pending) - set(sheets))
+            if len(todo) >= _parallel_min and jobs != 1:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=jobs)
+                parsed = []
+                n = len(todo)
+                for sheet, counts in pool.map(load_counted, todo, [parse_sheet] * n,
+                                              [False] * n, [cache] * n):
+                    if cache is not None:
+                        cache.merge(counts)
+                    parsed.append(sheet)
+            else:
+                parsed = (_load_sheet(path, cache) for path in todo)
+            sheets.update(zip(todo, parsed))
+            pending = [_sheet_file(path, name) for path in todo
+                       for uuid, name in sheets[path]['sheets']]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return sheets
+
+
+def _templates(sheet):
+    """A component for each symbol of a sheet, shared by its instances."""
+    return [Component(ref, _intern(value), _intern(footprint),
+                      tuple(_intern(f) for f in fields))
+            for uuid, ref, value, footprint, fields, instances in sheet['symbols']]
+
+
+def load_schematic(path, jobs=None, cache=None):
+    """Return the components of the hierarchical schematic whose root
+    sheet is at 'path', like load_netlist does for its netlist.
+
+    Each distinct sheet file is parsed once, on a pool of 'jobs'
+    processes when there are many, and through 'cache' (a
+    cache.ParseCache) if given. Every instance of a sheet reuses the
+    components of its symbols with the reference, and the value and
+    footprint when they change, of that instance. Symbols of the same
+    reference, the units of a part, make a single component. Power
+    symbols and flags (#PWR01...) are left out.
+    """
+    path = os.path.normpath(path)
+    with stage('schematic.sheets') as info:
+        sheets = _parse_sheets(path, jobs, cache)
+        info['files'] = len(sheets)
+    with stage('schematic.instances') as info:
+        root = sheets[path]
+        # KiCad 7 and later keep the instances in the symbols, under
+        # paths starting with the root sheet uuid, KiCad 6 in the root
+        # sheet, under the paths of the symbols from below the root
+        prefix = '/' + root['uuid'] if root['uuid'] else ''
+        legacy = root['symbol_instances']
+        templates = {}
+        comps = {}
+        stack = [(path, '', (path,))]
+        info['sheets'] = 0
+        while stack:
+            sheet_path, instance, ancestors = stack.pop()
+            info['sheets'] += 1
+            sheet = sheets[sheet_path]
+            if sheet_path not in templates:
+                templates[sheet_path] = _templates(sheet)
+            for symbol, c in zip(sheet['symbols'], templates[sheet_path]):
+                uuid, instances = symbol[0], symbol[5]
+                annotation = instances.get(prefix + instance) or legacy.get(instance + '/' + uuid)
+                if annotation:
+                    ref, value, footprint = annotation
+                    c = Component(ref or c.ref, _intern(value) if value else c.value,
+                                  _intern(footprint) if footprint else c.footprint, c.fields)
+                if c.ref.startswith('#'):
+                    continue
+                other = comps.get(c.ref)
+                if other is None or c.ref.endswith('?'):
+                    comps.setdefault(c.ref, []).append(c)
+                else:
+                    # Another unit of the part, keep the fields it adds
+                    names = set(other[0].fields[::2])
+                    extra = [f for i in range(0, len(c.fields), 2) if c.fields[i] not in names
+                             for f in c.fields[i:i + 2]]
+                    if extra:
+                        other[0] = Component(other[0].ref, other[0].value, other[0].footprint,
+                                             other[0].fields + tuple(extra))
+            for uuid, name in reversed(sheet['sheets']):
+                child = _sheet_file(sheet_path, name)
+                if child in ancestors:
+                    raise ValueError("Sheet '{}' includes itself".format(child))
+                stack.append((child, instance + '/' + uuid, ancestors + (child,)))
+        res = [c for ref in sorted(comps, key=_ref_key) for c in comps[ref]]
+        info['components'] = len(res)
+    return res
+
+
+def load_components(path, use_mmap=False, cache=None, jobs=None):
+    """Components of the netlist at 'path', or of the schematic if it
+    is a .kicad_sch file."""
+    if path.endswith('.kicad_sch'):
+        return load_schematic(path, jobs, cache)
+    return load_file(path, load_netlist, use_mmap, cache)
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Local HTTP service generating BOMs and XYRS files, so other tools
+don't pay for a new bomtool process on every request.
+
+    GET  /bom?netlist=PATH[&format=FMT]
+    POST /bom[?format=FMT]                  (the netlist as the body)
+    GET  /xyrs?netlist=PATH&pcb=PATH[&format=FMT][&panel=COLSxROWS...]
+    POST /xyrs, /bom                        (multipart/form-data)
+    GET  /stats
+
+Multipart requests carry the 'netlist' and 'pcb' files as uploads, or
+their paths and the options as plain fields. FMT is any output format,
+csv, tsv, jsonl or db (SQLite), by default csv for the BOM and tsv for
+the XYRS. The work runs on a pool of processes, and requests for the
+same inputs and options arriving while one is being computed share its
+result.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import re
+import sys
+import json
+import time
+import stat
+import signal
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from .bomtool import load_netlist, generate_bom, write_bom, known_components
+from .xyrstool import load_pcb, generate_xyrs, write_xyrs
+from .cache import ParseCache
+from .catalog import Catalog
+from .geometry import parse_panel
+from .output import write_outputs
+
+_content_types = {
+    'csv': 'text/csv; charset=utf-8',
+    'tsv': 'text/tab-separated-values; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'db': 'application/vnd.sqlite3',
+}
+_default_format = {'bom': 'csv', 'xyrs': 'tsv'}
+_reasons = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+            411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+# Latencies kept for the percentiles of /stats
+_latency_window = 1024
+# The first expression of each input, anything else would parse to an
+# empty BOM or board
+_roots = {'netlist': 'export', 'pcb': 'kicad_pcb'}
+_re_root = re.compile(br'(?:\xef\xbb\xbf)?\s*\(\s*([^\s()"]*)')
+# Status of the input paths that can't be read, 400 unless listed
+_read_statuses = {FileNotFoundError: 404, PermissionError: 403}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+# Set up in each worker process by _init_worker
+_cache = None
+_component_cache = None
+
+
+def _init_worker(catalog, component_cache, cache_dir, cache_size):
+    global _cache, _component_cache
+    if catalog:
+        known_components.use_catalog(Catalog(catalog))
+    # Only opened around each render, the workers share the database
+    # with each other and with other bomtool runs
+    _component_cache = component_cache
+    if cache_dir:
+        _cache = ParseCache(cache_dir, cache_size)
+
+
+def _parse(data, loader):
+    return loader(data) if _cache is None else _cache.parse(data, loader)
+
+
+def render(what, netlist, pcb=None, fmt=None, panel=None):
+    """The 'bom' or 'xyrs' output of the netlist and board contents in
+    the given format, as bytes. Runs in the worker processes."""
+    fmt = fmt or _default_format[what]
+    comps = _parse(netlist, load_netlist)
+    if _component_cache:
+        known_components.open(_component_cache)
+    try:
+        bom = generate_bom(comps)
+    finally:
+        known_components.close()
+    if what == 'bom':
+        records, write = bom, write_bom
+    else:
+        records, write = generate_xyrs(_parse(pcb, load_pcb), bom, panel=panel), write_xyrs
+    # Through a file, so every format is written exactly like bomtool does
+    fd, path = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(fd)
+    try:
+        write_outputs(write, records, [path], what)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def _timed_render(*args):
+    start = time.time()
+    res = render(*args)
+    return res, time.time() - start
+
+
+def _header_params(value):
+    """The main value of a header like Content-Type and its parameters."""
+    parts = value.split(';')
+    params = {}
+    for p in parts[1:]:
+        name, _, v = p.strip().partition('=')
+        params[name.lower()] = v.strip('"')
+    return parts[0].strip().lower(), params
+
+
+def parse_multipart(body, boundary):
+    """Map the field names of a multipart/form-data body to their
+    (is_upload, data) pairs."""
+    fields = {}
+    for part in body.split(b'--' + boundary.encode('latin-1'))[1:]:
+        if part.startswith(b'--'):
+            break
+        head, _, data = part.partition(b'\r\n\r\n')
+        if data.endswith(b'\r\n'):
+            data = data[:-2]
+        params = None
+        for line in head.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-disposition':
+                params = _header_params(value)[1]
+        if params is None or 'name' not in params:
+            raise HTTPError(400, "Multipart field without a name")
+        fields[params['name']] = ('filename' in params, data)
+    return fields
+
+
+async def _read_request(reader, max_body):
+    """Read one request, returns None when the client is done."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        raise HTTPError(411, "Chunked uploads aren't supported, send a Content-Length")
+    length = int(headers.get('content-length') or 0)
+    if length > max_body:
+        raise HTTPError(413, "Request bodies are limited to {} bytes".format(max_body))
+    body = await reader.readexactly(length) if length else b''
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+    return method, target, headers, body, keep_alive
+
+
+def _percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'count': len(values), 'mean': sum(values) / len(values),
+            'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': values[-1]}
+
+
+class Server(object):
+    """The service, with a pool of 'jobs' worker processes.
+
+    'worker_options' are the _init_worker arguments: the catalog, the
+    component cache and the parse cache directory and size used by the
+    workers.
+    """
+
+    def __init__(self, jobs=None, max_body=256 << 20, worker_options=(None, None, None, 0)):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_body = max_body
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                        initargs=worker_options)
+        self.started = time.time()
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.computed = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._latencies = dict((name, deque(maxlen=_latency_window))
+                               for name in ('bom', 'xyrs', 'compute'))
+
+    def close(self):
+        self.pool.shutdown()
+
+    async def handle(self, reader, writer):
+        """Serve the requests of a connection."""
+        self.connections += 1
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await _read_request(reader, self.max_body)
+                    if request is None:
+                        break
+                    method, target, headers, body, keep_alive = request
+                    self.requests += 1
+                    status, content_type, payload = await self.dispatch(method, target, headers, body)
+                except HTTPError as e:
+                    status, content_type, payload = e.status, 'text/plain; charset=utf-8', str(e).encode('utf-8')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    logging.exception("Error serving request")
+                    status, content_type, payload = 500, 'text/plain; charset=utf-8', str(e).encode('utf-8')
+                if status != 200:
+                    self.errors += 1
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n"
+                             "Connection: {}\r\n\r\n".format(
+                                 status, _reasons.get(status, ''), content_type, len(payload),
+                                 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        path = url.path.rstrip('/')
+        if path == '/stats':
+            if method != 'GET':
+                raise HTTPError(405, "Use GET")
+            return 200, 'application/json', json.dumps(self.stats(), indent=2).encode('utf-8')
+        if path not in ('/bom', '/xyrs'):
+            raise HTTPError(404, "Unknown endpoint '{}'".format(url.path))
+        if method not in ('GET', 'POST'):
+            raise HTTPError(405, "Use GET or POST")
+        start = time.time()
+        what = path[1:]
+        options = dict(parse_qsl(url.query))
+        files = {}
+        content_type, params = _header_params(headers.get('content-type', ''))
+        if method == 'POST' and content_type == 'multipart/form-data':
+            for name, (upload, data) in parse_multipart(body, params.get('boundary', '')).items():
+                if upload:
+                    files[name] = data
+                else:
+                    options[name] = data.decode('utf-8')
+        elif method == 'POST':
+            files['netlist'] = body
+        for name in ('netlist', 'pcb') if what == 'xyrs' else ('netlist',):
+            if name not in files:
+                if not options.get(name):
+                    raise HTTPError(400, "No {} given".format(name))
+                files[name] = await self._read(options[name])
+            _check_root(name, files[name])
+        fmt = options.get('format', _default_format[what]).lower().lstrip('.')
+        if fmt not in _content_types:
+            raise HTTPError(400, "Unknown format '{}', use one of {}".format(
+                fmt, ", ".join(sorted(_content_types))))
+        panel = None
+        if what == 'xyrs' and options.get('panel'):
+            try:
+                panel = parse_panel(options['panel'], options.get('panel-step'),
+                                    options.get('panel-rotation'))
+            except ValueError as e:
+                raise HTTPError(400, "Invalid panel options: {}".format(str(e)))
+        payload = await self.compute(what, files['netlist'], files.get('pcb'), fmt, panel)
+        self._latencies[what].append(time.time() - start)
+        return 200, _content_types[fmt], payload
+
+    async def _read(self, path):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, _read_file, path)
+        except EnvironmentError as e:
+            status = _read_statuses.get(type(e), 400)
+            raise HTTPError(status, "Can't read '{}': {}".format(path, e.strerror or str(e)))
+
+    async def compute(self, what, netlist, pcb, fmt, panel):
+        """Run render on the pool, or wait for the run of the same
+        request already in flight."""
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(None, _request_key, what, netlist, pcb, fmt, panel)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = loop.run_in_executor(self.pool, _timed_render, what, netlist, pcb, fmt, panel)
+            self._in_flight[key] = future
+            self.computed += 1
+            future.add_done_callback(lambda f: self._finished(key, f))
+        else:
+            self.coalesced += 1
+        # A client going away doesn't cancel the run the others wait for
+        # Malformed inputs fail with ValueError (sexp syntax, encoding)
+        # or LookupError (missing items)
+        try:
+            return (await asyncio.shield(future))[0]
+        except (ValueError, LookupError) as e:
+            raise HTTPError(400, "Can't parse the inputs: {}".format(str(e)))
+
+    def _finished(self, key, future):
+        del self._in_flight[key]
+        if not future.cancelled() and future.exception() is None:
+            self._latencies['compute'].append(future.result()[1])
+
+    def stats(self):
+        in_flight = len(self._in_flight)
+        return {
+            'uptime': time.time() - self.started,
+            'workers': self.jobs,
+            'connections': self.connections,
+            'requests': self.requests,
+            'errors': self.errors,
+            'computed': self.computed,
+            'coalesced': self.coalesced,
+            'in_flight': in_flight,
+            'queue_depth': max(0, in_flight - self.jobs),
+            'latency': dict((name, _percentiles(list(values)))
+                            for name, values in self._latencies.items()),
+        }
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _check_root(name, data):
+    match = _re_root.match(data)
+    if match is None or match.group(1).decode('latin-1') != _roots[name]:
+        raise HTTPError(400, "The {} isn't a KiCad {} file, it doesn't start with '({}'"
+                        .format(name, name, _roots[name]))
+
+
+def _request_key(what, netlist, pcb, fmt, panel):
+    h = hashlib.sha1(json.dumps([what, fmt, panel], sort_keys=True).encode('utf-8'))
+    for data in (netlist, pcb or b''):
+        h.update(hashlib.sha1(data).digest())
+    return h.hexdigest()
+
+
+async def _serve(server, host, port, unix):
+    if unix:
+        if os.path.exists(unix) and stat.S_ISSOCK(os.stat(unix).st_mode):
+            os.remove(unix)
+        listener = await asyncio.start_unix_server(server.handle, path=unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    # Stop cleanly, closing the pool, on Ctrl-C or when terminated
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
+    try:
+        async with listener:
+            await stop
+    finally:
+        if unix:
+            os.remove(unix)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bomtool serve",
+                                     description="Serve BOMs and XYRS files over HTTP to local tools")
+    parser.add_argument("--host", help="Address to listen on (default: 127.0.0.1)", default='127.0.0.1')
+    parser.add_argument("--port", help="Port to listen on (default: 8080)", type=int, default=8080)
+    parser.add_argument("--unix", help="Listen on this Unix socket instead", type=str, metavar="PATH")
+    parser.add_argument("--jobs", help="Number of worker processes (default: one per core)",
+                        type=int, metavar="N")
+    parser.add_argument("--max-upload", help="Size limit of the requests in MiB (default: 256)",
+                        type=int, default=256, metavar="MIB")
+    parser.add_argument("--catalog", help="Pick the jellybean parts from this parts catalog when it has them",
+                        type=str, metavar="FILE")
+    parser.add_argument("--component-cache", help="Keep the generated jellybean parts in this database across runs",
+                        type=str, metavar="FILE")
+    parser.add_argument("--cache-dir", help="Reuse the parse results of unchanged inputs kept in this directory",
+                        type=str, metavar="DIR")
+    parser.add_argument("--cache-size", help="Size limit of the parse cache in MiB (default: 256)",
+                        type=int, default=256, metavar="MIB")
+    args = parser.parse_args(argv)
+
+    if args.catalog:
+        try:
+            Catalog(args.catalog).close()
+        except Exception as e:
+            parser.error("Error opening catalog '{}': {}".format(args.catalog, str(e)))
+    server = Server(args.jobs, args.max_upload << 20,
+                    (args.catalog, args.component_cache, args.cache_dir, args.cache_size << 20))
+    print("Serving on {}, press Ctrl-C to stop".format(
+        args.unix or "http://{}:{}".format(args.host, args.port)))
+    sys.stdout.flush()
+    try:
+        asyncio.run(_serve(server, args.host, args.port, args.unix))
+    except EnvironmentError as e:
+        parser.error("Can't listen: {}".format(str(e)))
+    finally:
+        server.close()
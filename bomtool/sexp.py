@@ -26,31 +26,396 @@ from __future__ import unicode_literals
 from __future__ import division
 from __future__ import absolute_import
 
+import io
+import re
+import mmap
+from itertools import islice
 from string import whitespace
 
 _atom_end = set('()"\'') | set(whitespace)
 _escapes = {'n': '\n', 'r': '\r', 't': '\t'}
 
+_ws = re.escape(whitespace)
+_string = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_token = ('[' + _ws + r']*'
+          r'([()\']|"[^"\\]*(?:\\.[^"\\]*)*["\\]?|[^()"\'' + _ws + ']+)')
+# Patterns used to skip over whole elements without tokenizing them
+_element = r'\([^()"]*(?:' + _string + r'[^()"]*)*\)'
+for _ in range(8):
+    _element = (r'\([^()"]*(?:(?:' + _string + '|' + _element + r')[^()"]*)*\)')
+_paren = r'[^()"]*(?:' + _string + r'[^()"]*)*([()])'
+
+_re_escape = re.compile(r'\\(.)', re.S)
+_chunk_size = 1 << 20
+_quote = ('quote',)
+# Atoms that need quotes when not quoting everything
+_needs_quotes = re.compile('[' + re.escape(''.join(sorted(_atom_end))) + ']').search
+_dump_pieces = 1 << 14
+
+
+class _Syntax(object):
+    """Compiled patterns and token markers for str or bytes input."""
+
+    def __init__(self, conv):
+        self.token = re.compile(conv(_token), re.S)
+        self.string = re.compile(conv(_string + r'\Z'), re.S)
+        self.element = re.compile(conv(_element), re.S)
+        self.paren = re.compile(conv(_paren), re.S)
+        self.tokens_end = set(conv('()\'' + whitespace))
+        # Iterating bytes gives the integer values that t[0] returns
+        self.open, self.close, self.dquote, self.quote, self.backslash = \
+            conv('()"\'\\')
+
+
+_text_syntax = _Syntax(lambda s: s)
+_bytes_syntax = _Syntax(lambda s: s.encode('ascii'))
 
 try:
     _str_types = (str, unicode)
 except:
     _str_types = (str,)
+_text_type = type('')
 
 
 def contains_any(lst, s):
     return True in [c in lst for c in s]
 
 
-# Based on a Gist by Paul Bonser (pib)
-# https://gist.github.com/pib/240957
-def loads(s):
-    """Interpret a string containing one or more s-expressions.
+def _unescape(m):
+    return _escapes.get(m.group(1), m.group(1))
 
-    Returns a list of objects, so loads("(1 2) a") will return
-    [[1, 2], 'a'] and loads("(1,2,3)") will return [[1,2,3]].
+
+def _decode(atoms, t):
+    """Decode an atom read as bytes, sharing one str between equal atoms."""
+    a = atoms.get(t)
+    if a is None:
+        a = atoms[t] = t.decode('utf-8')
+    return a
+
+
+def _unescape_string(atoms, t):
+    if atoms is not None:
+        t = t.decode('utf-8')
+    return _re_escape.sub(_unescape, t)
+
+
+def _atom(syntax, atoms, t):
+    """The value of the atom token t, unquoted if it's a string, like
+    _parse and _build read it."""
+    if t[0] == syntax.dquote:
+        t = t[1:-1]
+        if syntax.backslash in t:
+            return _unescape_string(atoms, t)
+    if atoms is not None:
+        return _decode(atoms, t)
+    return t
+
+
+class _Reader(object):
+    """Window over the input, either a whole string or a file read in chunks.
+
+    Input given as bytes (or a buffer like an mmap) is parsed as UTF-8,
+    only the atoms that end up in the result are decoded. Lists are
+    created with 'node' when given.
+
+    """
+
+    def __init__(self, source, chunk_size=_chunk_size, atoms=None, node=None):
+        self.chunk_size = chunk_size
+        self.node = node
+        if hasattr(source, 'read') and not isinstance(source, mmap.mmap):
+            self._read = source.read
+            self.data = source.read(chunk_size)
+            self.final = not self.data
+        else:
+            self.data = source
+            self.final = True
+        if isinstance(self.data, _text_type):
+            self.syntax = _text_syntax
+            self.atoms = None
+        else:
+            self.syntax = _bytes_syntax
+            self.atoms = {} if atoms is None else atoms
+
+    def fill(self, pos, size=0):
+        """Discard the data before 'pos' and read the next chunk.
+
+        At least 'size' characters are read if available. Returns the
+        new offset of 'pos', which is always 0.
+
+        """
+        chunk = self._read(max(size, self.chunk_size))
+        if not chunk:
+            self.final = True
+        self.data = self.data[pos:] + chunk
+        return 0
+
+    def sub(self, start, end):
+        """Return a reader over data[start:end]."""
+        return _Reader(self.data[start:end], atoms=self.atoms, node=self.node)
+
+
+def _tokenize(reader):
+    """Split the input into lists of tokens, one window at a time.
+
+    Tokens are single parens and quotes, atoms and complete strings
+    (still between double quotes). Windows never split a token.
+
+    """
+    syntax = reader.syntax
+    findall, tokens_end = syntax.token.findall, syntax.tokens_end
+    pos, window = 0, reader.chunk_size
+    while True:
+        data = reader.data
+        length = len(data)
+        end = min(pos + window, length)
+        at_end = end == length
+        final = at_end and reader.final
+        tokens = findall(data, pos, end)
+        if tokens:
+            last = tokens[-1]
+            if last[0] == syntax.dquote and not syntax.string.match(last):
+                partial = True
+            else:
+                partial = not final and data[end - 1] not in tokens_end
+            if partial:
+                if final:
+                    raise ValueError("Unterminated string")
+                tokens.pop()
+                end -= len(last)
+            if tokens:
+                yield tokens
+        if final:
+            return
+        elif at_end:
+            pos = reader.fill(end)
+        elif end == pos:
+            # A single token larger than the window, widen it
+            window *= 2
+        else:
+            pos = end
+
+
+def _parse(reader, depth=0, stream=False):
+    """Build the s-expressions read from 'reader'.
+
+    Yields the top level expressions once the input is exhausted. When
+    'stream' is set every element nested 'depth' levels deep is yielded
+    as soon as it is complete instead, and its ancestors are discarded.
+
+    """
+    syntax, atoms, node = reader.syntax, reader.atoms, reader.node
+    OPEN, CLOSE, DQUOTE, QUOTE, BACKSLASH = (
+        syntax.open, syntax.close, syntax.dquote, syntax.quote, syntax.backslash)
+    stack, cur, quotes = [], [], []
+    for tokens in _tokenize(reader):
+        for t in tokens:
+            c = t[0]
+            if c == OPEN:
+                stack.append(cur)
+                cur = [] if node is None else node()
+                continue
+            elif c == CLOSE:
+                if not stack:
+                    raise ValueError("Unbalanced ')'")
+                if quotes and quotes[-1] == len(stack):
+                    quotes.pop()
+                if stream and len(stack) <= depth:
+                    if len(stack) == depth:
+                        for e in cur:
+                            yield e
+                else:
+                    stack[-1].append(cur)
+                cur = stack.pop()
+            elif c == DQUOTE:
+                t = t[1:-1]
+                if BACKSLASH in t:
+                    t = _unescape_string(atoms, t)
+                elif atoms is not None:
+                    t = atoms.get(t) or _decode(atoms, t)
+                cur.append(t)
+            elif c == QUOTE:
+                stack.append(cur)
+                cur = [_quote]
+                quotes.append(len(stack))
+                continue
+            else:
+                cur.append(t if atoms is None else atoms.get(t) or _decode(atoms, t))
+            # A quoted expression ends with its first element
+            if quotes and quotes[-1] == len(stack):
+                quotes.pop()
+                if stream and len(stack) <= depth:
+                    if len(stack) == depth:
+                        for e in cur:
+                            yield e
+                else:
+                    stack[-1].append(cur)
+                cur = stack.pop()
+        if stream and len(stack) >= depth:
+            frame = stack[depth] if len(stack) > depth else cur
+            for e in frame:
+                yield e
+            del frame[:]
+    if stack:
+        raise ValueError("Unexpected end of input, {} unclosed '('"
+                         .format(len(stack)))
+    if not stream or depth == 0:
+        for e in cur:
+            yield e
+
+
+def _element_end(syntax, data, pos):
+    """Return the offset right after the list starting at 'pos'.
+
+    Returns None when the list is not complete in 'data'.
+
+    """
+    m = syntax.element.match(data, pos)
+    if m:
+        return m.end()
+    # Nested deeper than the element pattern handles, count the parens
+    level = 0
+    while True:
+        m = syntax.paren.match(data, pos)
+        if m is None:
+            return None
+        pos = m.end()
+        if m.group(1)[0] == syntax.open:
+            level += 1
+        else:
+            level -= 1
+            if not level:
+                return pos
+
+
+def _build(reader, start, end):
+    """Build the list spanning data[start:end], which must be complete."""
+    syntax, atoms, node = reader.syntax, reader.atoms, reader.node
+    OPEN, CLOSE, DQUOTE, QUOTE, BACKSLASH = (
+        syntax.open, syntax.close, syntax.dquote, syntax.quote, syntax.backslash)
+    stack, cur = [], []
+    for t in syntax.token.findall(reader.data, start, end):
+        c = t[0]
+        if c == OPEN:
+            stack.append(cur)
+            cur = [] if node is None else node()
+        elif c == CLOSE:
+            stack[-1].append(cur)
+            cur = stack.pop()
+        elif c == DQUOTE:
+            t = t[1:-1]
+            if BACKSLASH in t:
+                t = _unescape_string(atoms, t)
+            elif atoms is not None:
+                t = atoms.get(t) or _decode(atoms, t)
+            cur.append(t)
+        elif c == QUOTE:
+            return next(_parse(reader.sub(start, end)))
+        else:
+            cur.append(t if atoms is None else atoms.get(t) or _decode(atoms, t))
+    return cur[0]
+
+
+def _parse_filtered(reader, depth, keep, stream=False):
+    """Like _parse, but only keep the lists 'depth' levels deep whose
+    first atom is in 'keep'.
+
+    Lists that are not kept are skipped by matching their parens,
+    without building them. 'keep' can also be a dictionary mapping the
+    kept names to a nested 'keep' applied to the children of the list,
+    or to None to keep it whole.
 
     """
+    syntax, atoms, node = reader.syntax, reader.atoms, reader.node
+    match = syntax.token.match
+    stack, cur, pos = [], [], 0
+    while True:
+        data = reader.data
+        m = match(data, pos)
+        if m is None or (m.end() == len(data) and not reader.final):
+            if reader.final:
+                break
+            pos = reader.fill(pos)
+            continue
+        t = m.group(1)
+        c = t[0]
+        if c == syntax.open:
+            if len(stack) < depth:
+                stack.append(cur)
+                cur = [] if node is None else node()
+                pos = m.end()
+                continue
+            start = m.end() - 1
+            end = _element_end(syntax, data, start)
+            if end is None:
+                if reader.final:
+                    raise ValueError("Unexpected end of input")
+                # Read at least as much again, to stay linear on big lists
+                pos = reader.fill(start, len(data) - start)
+                continue
+            pos = end
+            head = _atom(syntax, atoms, match(data, start + 1).group(1))
+            if head not in keep:
+                continue
+            sub = keep.get(head) if isinstance(keep, dict) else None
+            if sub is None:
+                e = _build(reader, start, end)
+            else:
+                e = next(_parse_filtered(reader.sub(start, end), 1, sub))
+            if stream:
+                yield e
+            else:
+                cur.append(e)
+            continue
+        elif c == syntax.close:
+            if not stack:
+                raise ValueError("Unbalanced ')'")
+            if not stream:
+                stack[-1].append(cur)
+            cur = stack.pop()
+        elif c == syntax.quote:
+            raise ValueError("Quoted expressions can't be filtered")
+        else:
+            if c == syntax.dquote and not syntax.string.match(t):
+                raise ValueError("Unterminated string")
+            t = _atom(syntax, atoms, t)
+            if not stream:
+                cur.append(t)
+            elif len(stack) == depth:
+                yield t
+        pos = m.end()
+    if stack:
+        raise ValueError("Unexpected end of input, {} unclosed '('"
+                         .format(len(stack)))
+    if not stream:
+        for e in cur:
+            yield e
+
+
+def _prune(lst, depth, keep):
+    """Filter an already built list the same way _parse_filtered does."""
+    if depth:
+        return [_prune(e, depth - 1, keep) if type(e) == list else e
+                for e in lst]
+    res = []
+    for e in lst:
+        if type(e) != list:
+            res.append(e)
+        elif e and type(e[0]) in _str_types and e[0] in keep:
+            sub = keep.get(e[0]) if isinstance(keep, dict) else None
+            res.append(e if sub is None else _prune(e, 0, sub))
+    return res
+
+
+def _loads_regex(s):
+    """Tokenizer based parser, scans whole atoms and strings at once."""
+    return list(_parse(_Reader(s)))
+
+
+# Based on a Gist by Paul Bonser (pib)
+# https://gist.github.com/pib/240957
+def _loads_char(s):
+    """Character by character parser, kept as a reference implementation."""
 
     stack, i, length = [[]], 0, len(s)
     while i < length:
@@ -94,9 +459,121 @@ def loads(s):
     return stack.pop()
 
 
-def load(f):
-    """Load s-exps from a file-like object, see loads for options"""
-    return loads(f.read())
+engines = {
+    'regex': _loads_regex,
+    'char': _loads_char,
+}
+
+
+def _map(f):
+    """Memory map the file object 'f', returns None if it can't be mapped."""
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError, io.UnsupportedOperation):
+        # Not a real file, or an empty one
+        return None
+
+
+def _read_all(reader, depth, keep):
+    if keep is None:
+        return list(_parse(reader))
+    return list(_parse_filtered(reader, depth, keep))
+
+
+def _to_nodes(lst, node):
+    return node(_to_nodes(x, node) if type(x) == list else x for x in lst)
+
+
+def loads(s, engine='regex', keep=None, depth=1, node=None):
+    """Interpret a string containing one or more s-expressions.
+
+    Returns a list of objects, so loads("(1 2) a") will return
+    [[1, 2], 'a'] and loads("(1,2,3)") will return [[1,2,3]].
+
+    The 'engine' option selects the parser implementation, one of the
+    keys of the 'engines' dictionary. All of them produce the same
+    output for well formed input.
+
+    When 'keep' is given only the lists nested 'depth' levels deep
+    whose first atom is in 'keep' are returned, e.g.
+    loads(pcb, keep={'module'}) drops the tracks and zones of a board.
+    'keep' can also be a dictionary mapping each kept name to a nested
+    filter for its children (or None to keep all of them), like
+    {'module': {'at', 'layer'}}. The regex engine skips the lists left
+    out without building them.
+
+    's' can also be UTF-8 encoded bytes or any buffer holding them,
+    like an mmap. The regex engine then scans the buffer in place and
+    only decodes the atoms it keeps, storing each distinct one once.
+
+    'node' is the list type used for the parsed expressions, like Node.
+
+    """
+    try:
+        parse = engines[engine]
+    except KeyError:
+        raise ValueError("Unknown s-expression engine '{}'".format(engine))
+    if engine == 'regex':
+        return _read_all(_Reader(s, node=node), depth, keep)
+    if not isinstance(s, _text_type):
+        s = s[:].decode('utf-8')
+    res = parse(s)
+    if keep is not None:
+        res = _prune(res, depth, keep)
+    if node is not None:
+        res = list(_to_nodes(res, node))
+    return res
+
+
+def load(f, engine='regex', keep=None, depth=1, node=None, use_mmap=False):
+    """Load s-exps from a file-like object, see loads for options
+
+    With 'use_mmap' the file (which should be opened in binary mode) is
+    memory mapped and parsed in place instead of read into memory.
+
+    """
+    data = use_mmap and _map(f)
+    if data:
+        try:
+            return loads(data, engine, keep, depth, node)
+        finally:
+            data.close()
+    elif engine != 'regex':
+        return loads(f.read(), engine, keep, depth, node)
+    return _read_all(_Reader(f, node=node), depth, keep)
+
+
+def _iterparse(reader, depth, keep, mapped=None):
+    try:
+        if keep is None:
+            for e in _parse(reader, depth, stream=True):
+                yield e
+        else:
+            for e in _parse_filtered(reader, depth, keep, stream=True):
+                yield e
+    finally:
+        if mapped:
+            mapped.close()
+
+
+def iterparse(f, depth=1, keep=None, node=None, chunk_size=_chunk_size,
+              use_mmap=False):
+    """Incrementally parse s-exps from a file-like object.
+
+    The file is read 'chunk_size' characters at a time and every
+    element nested 'depth' levels deep is yielded as soon as it is
+    closed, so iterparse(f) yields the same items as car(load(f)) for
+    a file like "(kicad_pcb (version 4) (module ...) ...)". Only the
+    element being built is kept in memory.
+
+    'keep' filters the yielded lists like in loads, 'node' is the list
+    type to use and 'use_mmap' maps the file like in load.
+
+    """
+    data = use_mmap and _map(f)
+    if data:
+        return _iterparse(_Reader(data, node=node), depth, keep, data)
+    return _iterparse(_Reader(f, chunk_size, node=node), depth, keep)
 
 
 def dumps(sexpr, retarded=True):
@@ -106,26 +583,183 @@ def dumps(sexpr, retarded=True):
     convention of not quoting anything without spaces or brackets.
 
     """
+    out = io.StringIO()
+    dump(sexpr, out, retarded)
+    return out.getvalue()
 
-    if type(sexpr) == list:
-        return "(" + " ".join((dumps(s, retarded) for s in sexpr)) + ")"
-    elif (retarded and sexpr and type(sexpr) == str
-          and not contains_any(sexpr, _atom_end)):
-        return sexpr
-    elif type(sexpr) == str:
-        return '"{}"'.format(sexpr.replace('\\', '\\\\').replace('"', '\\"'))
-    else:
-        return repr(sexpr)
+
+def _quote_atom(a, retarded):
+    if retarded and a and not _needs_quotes(a):
+        return a
+    return '"{}"'.format(a.replace('\\', '\\\\').replace('"', '\\"'))
 
 
 def dump(sexpr, f, retarded=True):
-    """Write the given s-exp to file, takes the same options as dumps."""
-    f.write(dumps(sexpr, retarded))
+    """Write the given s-exp to file, takes the same options as dumps.
+
+    The tree is walked without recursion, so it can be nested as deep
+    as it takes, and written in chunks of about _dump_pieces atoms
+    instead of being built into one string first. A file opened in
+    binary mode gets UTF-8.
+
+    """
+    if isinstance(f, (io.RawIOBase, io.BufferedIOBase)):
+        write = lambda s: f.write(s.encode('utf-8'))
+    else:
+        write = f.write
+    out = []
+    append = out.append
+    # Atoms repeat a lot (layers, widths, nets), format each one once
+    formatted = {}
+    stack = []
+    it = iter((sexpr,))
+    sep = False
+    while True:
+        if len(out) >= _dump_pieces:
+            write(''.join(out))
+            del out[:]
+            if len(formatted) >= _dump_pieces:
+                formatted.clear()
+        for e in it:
+            if sep:
+                append(' ')
+            if isinstance(e, _list_types):
+                append('(')
+                stack.append(it)
+                it = iter(e)
+                sep = False
+                break
+            if type(e) == str:
+                a = formatted.get(e)
+                if a is None:
+                    a = formatted[e] = _quote_atom(e, retarded)
+                append(a)
+            else:
+                append(repr(e))
+            sep = True
+        else:
+            if not stack:
+                break
+            append(')')
+            it = stack.pop()
+            sep = True
+    write(''.join(out))
+
+
+# Shorter nodes are scanned and copied by the helpers below like plain
+# lists, an index or a view wouldn't pay for itself
+_index_min = 16
+_no_index = ({}, 0)
+
+
+class Node(list):
+    """List that indexes its children by their first atom.
+
+    The index is built on the first assoc/findall lookup and extended
+    as the node grows, so repeated lookups don't scan the list again.
+    cdr() of a Node returns a NodeView instead of a copy. Pass
+    node=Node to the load functions to build the tree out of Nodes.
+
+    """
+
+    __slots__ = ('_index',)
+
+    def _positions(self, key):
+        index, length = getattr(self, '_index', _no_index)
+        if length != len(self):
+            if not length or length > len(self):
+                index, length = {}, 0
+            for i in range(length, len(self)):
+                x = self[i]
+                if type(x) is not _text_type:
+                    if not x or not isinstance(x, list) or isinstance(x[0], list):
+                        continue
+                    x = x[0]
+                if x in index:
+                    index[x].append(i)
+                else:
+                    index[x] = [i]
+            self._index = index, len(self)
+        return index.get(key, ())
+
+    def assoc(self, key, start=0):
+        for i in self._positions(key):
+            if i >= start:
+                return self[i]
+        return []
+
+    def findall(self, key, start=0):
+        return (self[i] for i in self._positions(key) if i >= start)
+
+    def _invalidate(method):
+        def wrapper(self, *args, **kwargs):
+            self._index = {}, 0
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    # Growing the list is handled by _positions, anything else resets the index
+    __setitem__ = _invalidate(list.__setitem__)
+    __delitem__ = _invalidate(list.__delitem__)
+    insert = _invalidate(list.insert)
+    pop = _invalidate(list.pop)
+    remove = _invalidate(list.remove)
+    reverse = _invalidate(list.reverse)
+    sort = _invalidate(list.sort)
+    clear = _invalidate(list.clear)
+    __imul__ = _invalidate(list.__imul__)
+    del _invalidate
+
+
+class NodeView(object):
+    """Read only view of the tail of a Node, as returned by cdr()."""
+
+    __slots__ = ('node', 'start')
+
+    def __init__(self, node, start):
+        self.node = node
+        self.start = start
+
+    def __len__(self):
+        return max(len(self.node) - self.start, 0)
+
+    def __iter__(self):
+        return islice(self.node, self.start, None)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.node[self.start:][i]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("NodeView index out of range")
+        return self.node[self.start + i]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def assoc(self, key):
+        return self.node.assoc(key, self.start)
+
+    def findall(self, key):
+        return self.node.findall(key, self.start)
+
+
+_list_types = (list, NodeView)
 
 
 def car(lst):
     """Return the first element of a list."""
-    if type(lst) != list or len(lst) == 0:
+    if type(lst) is not list and not isinstance(lst, _list_types) or len(lst) == 0:
         return lst
     else:
         return lst[0]
@@ -133,21 +767,31 @@ def car(lst):
 
 def cdr(lst):
     """Return the rest of the list."""
+    if isinstance(lst, Node) and len(lst) >= _index_min:
+        return NodeView(lst, 1)
+    elif isinstance(lst, NodeView):
+        return NodeView(lst.node, lst.start + 1)
     return lst[1:]
 
 
 def cadr(lst):
     """Return the second item of a list."""
+    if isinstance(lst, Node):
+        return lst[1] if len(lst) > 1 else []
     return car(cdr(lst))
 
 
 def findall(lst, name):
     """Find all associative cells with the same key."""
+    if isinstance(lst, (Node, NodeView)) and len(lst) >= _index_min:
+        return lst.findall(name)
     return (x for x in lst if car(x) == name)
 
 
 def assoc(lst, key):
     """Returns the first cell with a given key in an associative array."""
+    if isinstance(lst, (Node, NodeView)) and len(lst) >= _index_min:
+        return lst.assoc(key)
     for itm in lst:
         if car(itm) == key:
             return itm
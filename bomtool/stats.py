@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Hook points around the stages of bomtool, and a recorder of them.
+
+The loaders and generators run their work inside stage(), which calls
+the subscribed callbacks when the stage starts and ends:
+
+    def callback(event, name, info):
+        ...
+
+    stats.subscribe(callback)
+
+'event' is 'start' or 'end', 'name' the name of the stage and 'info' a
+dictionary with the element counts of the stage (like 'components' or
+'modules') and, at the end, its wall 'time' in seconds (from
+time.perf_counter). Without
+subscribers a stage costs a single check.
+
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_subscribers = []
+
+
+def subscribe(callback):
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+@contextmanager
+def stage(name, **info):
+    """Run the body as stage 'name', the body can add counts to info."""
+    if not _subscribers:
+        yield info
+        return
+    for callback in list(_subscribers):
+        callback('start', name, info)
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        info['time'] = time.perf_counter() - start
+        for callback in list(_subscribers):
+            callback('end', name, info)
+
+
+class Recorder:
+    """Records the stages run while it's active, with their peak memory.
+
+    Memory is traced with tracemalloc while recording. The peak of each
+    stage is the most memory allocated while it ran, nested stages
+    included, over what was allocated when it started.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.peak = 0
+        self._start = None
+        self._tracing = False
+        # [memory at the start, peak so far] of the running stages
+        self._memory = []
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        subscribe(self)
+
+    def stop(self):
+        unsubscribe(self)
+        self.time = time.perf_counter() - self._start
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if self._tracing:
+            tracemalloc.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __call__(self, event, name, info):
+        if event == 'start':
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is reset for the stage, keep the one so far for
+            # the total and the enclosing stage
+            self.peak = max(self.peak, peak)
+            if self._memory:
+                self._memory[-1][1] = max(self._memory[-1][1], peak)
+            self._memory.append([current, 0])
+            tracemalloc.reset_peak()
+        else:
+            start, peak = self._memory.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            self.peak = max(self.peak, peak)
+            if self._memory:
+                self._memory[-1][1] = max(self._memory[-1][1], peak)
+            record = {'stage': name, 'peak_memory': peak - start}
+            record.update(info)
+            self.stages.append(record)
+
+    def report(self, **extra):
+        """Return the recorded stages as a JSON serializable dict."""
+        res = {'time': self.time, 'peak_memory': self.peak, 'stages': self.stages}
+        res.update(extra)
+        return res
+
+
+def recorded(f, *args, **kwargs):
+    """Call f under a Recorder, returns its result and recorded stages.
+
+    Used to collect the stages run in other processes.
+
+    """
+    with Recorder() as recorder:
+        res = f(*args, **kwargs)
+    return res, recorder.stages
+
+
+def print_report(report, out=sys.stderr):
+    for s in report['stages']:
+        counts = ", ".join("{} {}".format(v, k) for k, v in sorted(s.items())
+                           if k not in ('stage', 'time', 'peak_memory'))
+        print("{:<24} {:9.3f} s {:9.1f} MB  {}".format(
+            s['stage'], s['time'], s['peak_memory'] / 1e6, counts), file=out)
+    print("{:<24} {:9.3f} s {:9.1f} MB".format(
+        'total', report['time'], report['peak_memory'] / 1e6), file=out)
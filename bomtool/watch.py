@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Keep the BOM and XYRS of a project up to date while its files change."""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import os
+import re
+import time
+import logging
+
+from . import sexp
+from .bomtool import (load_netlist, parse_comp, bom_index, _group_components,
+                      _bom_lines, write_bom, known_components)
+from .xyrstool import (_pcb_keep, board_outline, parse_modules, load_pcb,
+                       generate_xyrs, write_xyrs)
+from .output import write_outputs
+
+_re_head = re.compile(br'[^\s()]+')
+
+# Bytes compared at a time when looking for the changes of a file
+_block = 1 << 16
+
+
+def _split(data, start, end, depth):
+    """Split data[start:end], the contents of a list, at its children
+    indented 'depth' levels like KiCad writes them (two spaces a level
+    up to KiCad 7, a tab after that).
+
+    Returns the text before the first child and the text of each child,
+    without its opening bracket. A child that doesn't parse on its own
+    means the file wasn't written by KiCad.
+    """
+    body = data[start:end]
+    marker = b'\n' + b'\t' * depth + b'('
+    if marker not in body:
+        marker = b'\n' + b'  ' * depth + b'('
+    pieces = body.split(marker)
+    return pieces[0], pieces[1:]
+
+
+def split_components(data):
+    """The components of the text of a netlist, see _split. Returns None
+    if it has no components section."""
+    start = data.find(b'(components')
+    if start < 0:
+        return None
+    # The section ends before the next one, or the end of the netlist
+    following = re.compile(br'\n(?:\t|  )\(').search(data, start)
+    end = data.rfind(b')', start, following.start() if following else data.rfind(b')'))
+    if end < 0:
+        return None
+    return _split(data, start + len(b'(components'), end, 2)
+
+
+def _common_prefix(a, b):
+    """Length of the common start of two byte strings."""
+    n = min(len(a), len(b))
+    i = 0
+    # Compare blocks, then narrow down the first one that differs
+    while i < n and a[i:i + _block] == b[i:i + _block]:
+        i += _block
+    lo, hi = min(i, n), min(i + _block, n)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[i:mid] == b[i:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a, b, limit):
+    """Length of the common end of two byte strings, at most limit."""
+    la, lb = len(a), len(b)
+    i = 0
+    while i < limit:
+        n = min(_block, limit - i)
+        if a[la - i - n:la - i] != b[lb - i - n:lb - i]:
+            break
+        i += n
+    lo, hi = i, min(i + _block, limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la - mid:la - i] == b[lb - mid:lb - i]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class BoardText(object):
+    """The parsed items of a board by their place in its text.
+
+    The text is split at its top level items, found by the indentation
+    KiCad writes (two spaces up to KiCad 7, a tab after that). When the
+    board is loaded again only the items in the span of text that
+    changed are parsed, the others are moved along. Raises ValueError
+    for text that can't be split like that, parse it whole then.
+    """
+
+    def __init__(self):
+        self.data = None
+        self.marker = None
+        self.head = []
+        self.pieces_start = 0
+        # [start, items, module placements] of the items kept
+        self.pieces = []
+
+    def load(self, data):
+        """Parse a new version of the text, returns it like load_pcb."""
+        marker = b'\n\t(' if b'\n\t(' in data[:1 << 16] else b'\n  ('
+        old = self.data
+        if old is None or marker != self.marker:
+            self._load_all(data, marker)
+        else:
+            p = _common_prefix(old, data)
+            q = _common_suffix(old, data, min(len(old), len(data)) - p)
+            delta = len(data) - len(old)
+            # Whole pieces before the change, and after it if the change
+            # doesn't reach the last one
+            lo = data.rfind(marker, 0, p)
+            hi = data.find(marker, len(data) - q)
+            end = data.rfind(b')')
+            if lo < 0 or lo < self.pieces_start or end <= lo:
+                self._load_all(data, marker)
+            else:
+                before = [pc for pc in self.pieces if pc[0] < lo]
+                after = []
+                if hi >= 0:
+                    after = [[pc[0] + delta] + pc[1:] for pc in self.pieces
+                             if pc[0] >= hi - delta]
+                self.pieces = (before + self._parse(data, lo, hi if hi >= 0 else end, marker)
+                               + after)
+                self.data = data
+        items = self.head + [i for pc in self.pieces for i in pc[1]]
+        return {'outline': board_outline(items),
+                'modules': [m for pc in self.pieces for m in pc[2]]}
+
+    def _load_all(self, data, marker):
+        start = data.find(b'(kicad_pcb')
+        end = data.rfind(b')')
+        if start < 0 or end < start or data[:start].strip():
+            raise ValueError("Not a board")
+        first = data.find(marker, start, end)
+        if first < 0:
+            first = end
+        head = sexp.loads(data[start + len(b'(kicad_pcb'):first],
+                          keep=_pcb_keep, depth=0)
+        # Only when the items aren't on lines of their own
+        if any(i[0] == 'module' for i in head):
+            raise ValueError("Not split at its items")
+        self.pieces = self._parse(data, first, end, marker)
+        self.head = head
+        self.pieces_start = first
+        self.marker = marker
+        self.data = data
+
+    def _parse(self, data, start, end, marker):
+        """Parse the pieces of data[start:end], which starts with a marker."""
+        pieces = data[start:end].split(marker)
+        if pieces[0]:
+            raise ValueError("Not at an item")
+        parsed = []
+        pos = start
+        for piece in pieces[1:]:
+            head = _re_head.match(piece)
+            if head and head.group().decode('utf-8') in _pcb_keep:
+                items = sexp.loads(b'(' + piece, keep=_pcb_keep, depth=0)
+                if items:
+                    parsed.append([pos, items, []])
+            pos += len(marker) + len(piece)
+        # The placements of all the new modules are parsed in one batch
+        raw = [[i for i in pc[1] if i[0] == 'module'] for pc in parsed]
+        placements = iter(parse_modules([m for modules in raw for m in modules]))
+        for pc, modules in zip(parsed, raw):
+            pc[2].extend(next(placements) for m in modules)
+        return parsed
+
+
+class Project(object):
+    """The parsed netlist and board of a project, and their outputs.
+
+    update() re-reads the files modified since the last call. Board
+    items are parsed again only when their text changed, and the BOM
+    lines only for the groups of components that changed.
+    """
+
+    def __init__(self, netlist, pcb=None, panel=None, footprints=None):
+        self.netlist = netlist
+        self.pcb = pcb
+        self.panel = panel
+        self.footprints = footprints
+        self.bom = None
+        self.xyrs = None
+        self.board = None
+        self._stamps = {}
+        self._components = {}
+        self._board = BoardText()
+        self._outline = None
+        self._rows = {}
+        self._groups = {}
+        self._states = {}
+
+    def _modified(self, path):
+        st = os.stat(path)
+        stamp = (st.st_mtime, st.st_size)
+        if self._stamps.get(path) == stamp:
+            return False
+        self._stamps[path] = stamp
+        return True
+
+    def update(self):
+        """Reload the modified files, returns the names ('bom', 'xyrs') of
+        the outputs that changed."""
+        changed = set()
+        if self._modified(self.netlist):
+            bom = self._update_bom(self._load_netlist())
+            if bom != self.bom:
+                self.bom = bom
+                changed.add('bom')
+        board_changed = False
+        if self.pcb and self._modified(self.pcb):
+            self.board = self._load_board()
+            board_changed = True
+        if self.pcb and (board_changed or changed):
+            xyrs = self._update_xyrs()
+            if xyrs != self.xyrs:
+                self.xyrs = xyrs
+                changed.add('xyrs')
+        return changed
+
+    def _update_bom(self, comps):
+        states = dict((c['ref'], c.__getstate__()) for c in comps)
+        # Only report the problems of what changed, not every time
+        fresh = [c for c in comps if self._states.get(c['ref']) != states[c['ref']]]
+        _group_components(fresh)
+        if self.footprints is not None:
+            self.footprints.check(fresh)
+        self._states = states
+
+        groups = {}
+        bom = []
+        for l, group in sorted(_group_components(comps, log=False).items()):
+            key = tuple(states[c['ref']] for c in group)
+            cached = self._groups.get(l)
+            if cached is None or cached[0] != key:
+                cached = (key, _bom_lines(l, group))
+            groups[l] = cached
+            bom += cached[1]
+        self._groups = groups
+        known_components.commit()
+        return bom
+
+    def _load_netlist(self):
+        with open(self.netlist, 'rb') as f:
+            data = f.read()
+        pieces = split_components(data)
+        if pieces is not None and not pieces[0].strip():
+            try:
+                return self._parse_components(pieces[1])
+            except ValueError:
+                pass
+        # Not split right, parse it whole and start over
+        comps = load_netlist(io.BytesIO(data))
+        self._components = {}
+        return comps
+
+    def _parse_components(self, pieces):
+        parsed = {}
+        comps = []
+        for piece in pieces:
+            got = parsed.get(piece) or self._components.get(piece)
+            if got is None:
+                got = [parse_comp(c) for c in sexp.loads(b'(' + piece, keep={'comp'}, depth=0)]
+            parsed[piece] = got
+            comps += got
+        self._components = parsed
+        return comps
+
+    def _load_board(self):
+        with open(self.pcb, 'rb') as f:
+            data = f.read()
+        try:
+            return self._board.load(data)
+        except ValueError:
+            # Not split right, parse it whole and start over. A broken
+            # board (caught half written?) keeps the last state to diff
+            # the next one against
+            board = load_pcb(io.BytesIO(data))
+            self._board = BoardText()
+            return board
+
+    def _update_xyrs(self):
+        """The XYRS of the board, with the rows of the modules whose
+        placement and BOM line didn't change taken from the last one."""
+        board = self.board
+        index = bom_index(self.bom)
+        refs = [m.get('ref', '') for m in board['modules']]
+        if (self.panel or self.xyrs is None or board['outline'] != self._outline
+                or len(set(refs)) != len(refs)):
+            stale = board['modules']
+        else:
+            stale = [m for m, ref in zip(board['modules'], refs)
+                     if ref not in self._rows or self._rows[ref][0] is not m
+                     or self._rows[ref][1] is not index.get(ref)]
+        xyrs = generate_xyrs({'outline': board['outline'], 'modules': stale},
+                             self.bom, panel=self.panel)
+        self._outline = board['outline']
+        if stale is board['modules']:
+            self._rows = {}
+            if self.panel:
+                return xyrs
+        # Without a panel the designators are the references
+        fresh = dict((row['#Designator'], row) for row in xyrs)
+        rows = {}
+        for m, ref in zip(board['modules'], refs):
+            cached = self._rows.get(ref)
+            if cached is None or cached[0] is not m or cached[1] is not index.get(ref):
+                cached = (m, index.get(ref), fresh.get(ref))
+            rows[ref] = cached
+        self._rows = rows
+        return [rows[ref][2] for ref in refs if rows[ref][2] is not None]
+
+
+def watch(project, outputs, interval=0.2):
+    """Regenerate the outputs of a project whenever its files change,
+    until interrupted. 'outputs' maps 'bom' and 'xyrs' to the lists of
+    paths to write them to."""
+    writers = {'bom': write_bom, 'xyrs': write_xyrs}
+    try:
+        while True:
+            start = time.time()
+            try:
+                changed = project.update()
+                for what in sorted(changed):
+                    if outputs.get(what):
+                        write_outputs(writers[what], getattr(project, what), outputs[what],
+                                      what, 'csv' if what == 'bom' else 'tsv')
+            except Exception as e:
+                logging.error("Error updating the project: {}".format(e))
+                changed = ()
+            if changed:
+                print("Updated {} in {:.0f} ms".format(
+                    " and ".join(what.upper() for what in sorted(changed)),
+                    (time.time() - start) * 1000))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
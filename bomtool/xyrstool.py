@@ -28,14 +28,32 @@ from __future__ import division
 from __future__ import absolute_import
 
 from . import sexp
-from .sexp import car, cdr, cadr, findall, assoc
+from .sexp import cadr, findall, assoc
+from .bomtool import bom_index
+from .stats import stage
+from .geometry import Outlines, shapes, panel_copies, place
+from .output import DelimitedSink, write_table
 
-import re
 import logging
 
-from csv import DictWriter, excel_tab
+from csv import excel_tab
 
-def parse_module(data):
+# The parts of the board used by parse_module and board_outline,
+# everything else is skipped
+_pcb_keep = {
+    'module': {'layer', 'at', 'fp_text'} | {'fp_' + s for s in shapes},
+}
+_pcb_keep.update(('gr_' + s, None) for s in shapes)
+
+
+def module_ref(data):
+    for t in findall(data, 'fp_text'):
+        if t[1] == 'reference':
+            return t[2]
+    return ''
+
+
+def _parse_placement(data):
     m = {}
     layer = cadr(assoc(data, 'layer'))
     if layer == "F.Cu":
@@ -54,62 +72,138 @@ def parse_module(data):
             m['rot'] = float(xyrot[3])
         else:
             m['rot'] = 0.0
-    lines = (l for l in findall(data, 'fp_line') if 'CrtYd' in cadr(assoc(l, 'layer')))
-    max_x, max_y = 0, 0
-    min_x, min_y = 0, 0
-    for line in lines:
-        start = assoc(line, 'start')
-        end = assoc(line, 'end')
-        for point in (start, end):
-            x = float(point[1])
-            y = float(point[2])
-            if x < min_x: min_x = x
-            if y < min_y: min_y = y
-            if x > max_x: max_x = x
-            if y > max_y: max_y = y
-    m["size_x"] = 2*min(max_x, -min_x)
-    m["size_y"] = 2*min(max_y, -min_y)
     return m
 
 
-def generate_xyrs(pcb_file, bom):
-    pcb_data = car(sexp.load(pcb_file))
-    raw_modules = list(findall(pcb_data, 'module'))
-    modules = [parse_module(m) for m in raw_modules]
-    xyrs = []
-    for m in modules:
-        #XXX Discard virtual components earlier!
-        xyrs_line = {}
-        bomline = None
-        for line in bom:
-            if m.get('ref', '') in line['refs'].split(', '):
-                bomline = line
-                break
+def parse_modules(raw_modules):
+    """Parse a list of modules, with their courtyards sized in one batch."""
+    modules = []
+    courtyards = Outlines('CrtYd')
+    for data in raw_modules:
+        m = _parse_placement(data)
+        courtyards.add(data, m.get('rot', 0.0))
+        modules.append(m)
+    min_x, min_y, max_x, max_y = courtyards.bounding_boxes()
+    for i, m in enumerate(modules):
+        m["size_x"] = max_x[i] - min_x[i]
+        m["size_y"] = max_y[i] - min_y[i]
+    return modules
+
+
+def parse_module(data):
+    return parse_modules([data])[0]
+
+
+def board_outline(items):
+    """Bounding box of the Edge.Cuts drawings among the board items."""
+    edges = Outlines('Edge.Cuts')
+    edges.add(items)
+    return tuple(b[0] for b in edges.bounding_boxes())
+
+
+def _read_board(pcb_file, use_mmap=False):
+    return list(sexp.iterparse(pcb_file, keep=_pcb_keep, use_mmap=use_mmap))
+
+
+def load_pcb(pcb_file, use_mmap=False):
+    """Parse the outline of the board and the placement of its modules."""
+    with stage('pcb.sexp') as info:
+        items = _read_board(pcb_file, use_mmap)
+        raw_modules = list(findall(items, 'module'))
+        info['items'] = len(items)
+    with stage('pcb.parse_module', modules=len(raw_modules)):
+        return {'outline': board_outline(items),
+                'modules': parse_modules(raw_modules)}
+
+
+def _not_in_bom(ref):
+    logging.warning(
+        "Component '{}' not in the BOM."
+        .format(ref))
+
+
+def generate_xyrs(pcb, bom, use_mmap=False, panel=None):
+    """Join the modules of the board to the BOM lines placing them.
+
+    'pcb' is either the board file or its parsed contents from
+    load_pcb. Positions are given from the lower left corner of the
+    board outline. With 'panel', a dictionary of panel_copies options,
+    the placements are repeated for every board of the panel and their
+    designators numbered after it, like R1_2 for R1 in the second board.
+
+    """
+    with stage('generate_xyrs', bom_lines=len(bom)) as info:
+        xyrs = _generate_xyrs(pcb, bom, use_mmap, panel)
+        info['placements'] = len(xyrs)
+    return xyrs
+
+
+def _generate_xyrs(pcb, bom, use_mmap, panel):
+    refs = bom_index(bom)
+    if not isinstance(pcb, dict):
+        items = _read_board(pcb, use_mmap)
+        # Look the BOM line up first, so virtual components and the ones
+        # missing from the BOM are discarded before parsing their geometry
+        raw_modules = []
+        for data in findall(items, 'module'):
+            if module_ref(data) in refs:
+                raw_modules.append(data)
+            else:
+                _not_in_bom(module_ref(data))
+        pcb = {'outline': board_outline(items),
+               'modules': parse_modules(raw_modules)}
+    placed = []
+    for m in pcb['modules']:
+        bomline = refs.get(m.get('ref', ''))
         if not bomline:
-            logging.warning(
-                "Component '{}' not in the BOM."
-                .format(m['ref']))
+            _not_in_bom(m.get('ref', ''))
         else:
+            placed.append((m, bomline))
+
+    outline = pcb['outline']
+    copies = ((0, 0, 0),)
+    if panel:
+        copies = panel_copies(outline[2] - outline[0], outline[3] - outline[1],
+                              **panel)
+    # All the placements of all the copies are transformed at once
+    xs, ys, rots = place([m.get('xpos', 0.0) for m, bomline in placed],
+                         [m.get('ypos', 0.0) for m, bomline in placed],
+                         [m.get('rot', 0) for m, bomline in placed],
+                         outline, copies)
+    xyrs = []
+    i = 0
+    for n, (dx, dy, angle) in enumerate(copies):
+        for m, bomline in placed:
+            size_x, size_y = m.get('size_x', 0.0), m.get('size_y', 0.0)
+            if angle in (90, 270):
+                size_x, size_y = size_y, size_x
+            xyrs_line = {}
             xyrs_line['#Designator'] = m.get('ref', '')
-            xyrs_line['X-Loc'] = round(m.get('xpos', 0.0) / 0.0254, 2) #XXX the board lower X bound must be added
-            xyrs_line['Y-Loc'] = -round(m.get('ypos', 0.0) / 0.0254, 2) # XXX the board upper Y bound must be added
-            xyrs_line['Rotation'] = m.get('rot', 0)
+            if len(copies) > 1:
+                xyrs_line['#Designator'] += '_{}'.format(n + 1)
+            xyrs_line['X-Loc'] = round(xs[i], 2)
+            xyrs_line['Y-Loc'] = round(ys[i], 2)
+            xyrs_line['Rotation'] = rots[i]
             xyrs_line['Side'] = m.get('side', 1)
             xyrs_line['Type'] = 1 # XXX implement properly (read attr smd?)
-            xyrs_line['X-Size'] = round(m.get('size_x', 0.0) / 0.0254,2)
-            xyrs_line['Y-Size'] = round(m.get('size_y', 0.0) / 0.0254,2)
+            xyrs_line['X-Size'] = round(size_x / 0.0254,2)
+            xyrs_line['Y-Size'] = round(size_y / 0.0254,2)
             xyrs_line['Value'] = bomline['description']
             xyrs_line['Footprint'] = bomline.get('package', '')
             xyrs_line['Populate'] = 1 if bomline['qty'] != "DO NOT POPULATE" else 0
             xyrs_line['MPN'] = bomline.get('MPN', '')
             xyrs.append(xyrs_line)
+            i += 1
     return xyrs
 
 _xyrs_fields = ['#Designator', 'X-Loc', 'Y-Loc', 'Rotation', 'Side', 'Type', 'X-Size', 'Y-Size', 'Value', 'Footprint', 'Populate', 'MPN']
 
+def write_xyrs(xyrs, sinks):
+    """Write the XYRS placements to every output.py sink in one pass."""
+    with stage('write_xyrs', sinks=len(sinks)) as info:
+        info['placements'] = write_table(xyrs, _xyrs_fields, sinks)
+
+
 def write_xyrs_tsv(xyrs, xyrs_file):
-    xyrs_writer = DictWriter(xyrs_file, fieldnames=_xyrs_fields, dialect=excel_tab,
-                             extrasaction='ignore')
-    xyrs_writer.writeheader()
-    for r in xyrs:
-        xyrs_writer.writerow(r)
+    with stage('write_xyrs_tsv', placements=len(xyrs)):
+        write_table(xyrs, _xyrs_fields, [DelimitedSink(xyrs_file, excel_tab)])
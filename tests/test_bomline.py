@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import random
+import logging
+
+import pytest
+
+from bomtool import pngen
+from bomtool.sexp import cadr
+from bomtool.bomtool import (parse_bomline, BomLineError, dielectrics,
+                             _known_pkgs, _manuf_abbr, _re_eng, _eng_suffixes)
+
+
+# The BOM line parser as it was before BOM lines were compiled, the
+# reference for the lines it accepted
+
+
+def _old_parse_eng(s):
+    value = None
+    match = _re_eng.match(s)
+    if match and (match.group('whole') or match.group('decimals')):
+        value = float(match.group('whole') + '.' + match.group('decimals'))
+        if match.group('sep') in _eng_suffixes:
+            value *= _eng_suffixes[match.group('sep')]
+        else:
+            value *= _eng_suffixes.get(match.group('suffix'), 1)
+    return value
+
+
+def _old_known_component(key):
+    res = None
+    if key[:2] == ('RES', 'SMD'):
+        fields = list(key[2:])
+        value = _old_parse_eng(fields.pop(0))
+        tolerance = 5
+        power = None
+        package = None
+        for f in fields:
+            if f[0] + f[-1] == "[]":
+                package = f[1:-1]
+            elif f[-1] == '%':
+                tolerance = float(f[:-1])
+            elif f[-1] in ['W', 'w']:
+                power = _old_parse_eng(f[:-1])
+        res = pngen.RC(value, tolerance, power, package)
+    if key[:2] == ('CAP', 'MLCC'):
+        fields = list(key[2:])
+        value = _old_parse_eng(fields.pop(0))
+        tolerance = 10
+        dielectric = None
+        voltage = 16
+        package = None
+        for f in fields:
+            if f[0] + f[-1] == "[]":
+                package = f[1:-1]
+            elif f[-1] == '%':
+                tolerance = float(f[:-1])
+            elif f[-1] in ['V', 'v']:
+                voltage = _old_parse_eng(f[:-1])
+            elif f in dielectrics:
+                dielectric = f
+        if dielectric in ['X7R', 'X5R']:
+            res = pngen.CC_XxR(value, tolerance, voltage, package, dielectric=dielectric)
+    return res
+
+
+def _old_parse_bomline(line):
+    if ';' in line:
+        bomlines = []
+        for l in line.split(';'):
+            if l.strip():
+                bomlines += _old_parse_bomline(l.strip())
+        return bomlines
+    attrs = {}
+    fields = line.strip().split()
+    attrs['description'] = line
+    if fields[0][0] + fields[0][-1] == "()":
+        multiplier = fields.pop(0)[1:-1]
+        try:
+            if multiplier == "DNP":
+                attrs['mult'] = 0
+            else:
+                attrs['mult'] = int(multiplier, 10)
+        except:
+            pass
+    known_component = _old_known_component(tuple(fields))
+    if fields[-1][0] + fields[-1][-1] == "[]":
+        package = fields.pop(-1)[1:-1]
+        attrs['package'] = _known_pkgs.get(package, package)
+    kind = attrs['kind'] = fields[0]
+    if known_component:
+        attrs.update(known_component)
+    elif kind in ['RES', 'BEAD'] and cadr(fields) in ['SMD', 'AXIAL']:
+        attrs['value'] = " ".join(fields[2:])
+    elif kind == 'CAP' and cadr(fields) in ['MLCC', 'TANT']:
+        attrs['value'] = " ".join(fields[2:])
+    elif len(fields) == 3:
+        attrs['manufacturer'] = _manuf_abbr.get(fields[1], fields[1].capitalize())
+        attrs['MPN'] = fields[2]
+    elif len(fields) == 2:
+        attrs['MPN'] = fields[1]
+    return [attrs]
+
+
+_tokens = [
+    ['(2)', '(DNP)', '(x)', ''],
+    ['RES', 'CAP', 'BEAD', 'IC', 'SOCKET'],
+    ['SMD', 'AXIAL', 'MLCC', 'TANT', 'TI', 'ST', '[0603]'],
+    ['10k', '4k7', '100n', '1u', '2R2', '0', 'x', '[0603]', 'NE555'],
+]
+_params = ['1%', '0.5%', 'a%', '%', '1/4W', '0.25W', 'aW', '16V', '6.3v', 'aV', 'V',
+           'X7R', 'X5R', 'C0G', 'NP0', '[0402]', '[1206]', 'foo']
+
+
+def _random_line(rng):
+    fields = [rng.choice(choices) for choices in _tokens]
+    if rng.random() < 0.5:
+        # Mostly the parts with generated part numbers
+        fields[1:3] = rng.choice([['RES', 'SMD'], ['CAP', 'MLCC']])
+    fields += rng.sample(_params, rng.randint(0, 4))
+    if rng.random() < 0.2:
+        fields = fields[:rng.randint(0, len(fields))]
+    line = " ".join(f for f in fields if f)
+    if rng.random() < 0.1:
+        line += "; IC TI NE555"
+    return line
+
+
+@pytest.mark.parametrize('line', [
+    'RES SMD 10k [0402] aV',
+    'RES SMD 10k aW 1% [0603]',
+    'CAP MLCC 10k aV 1/4W',
+    'CAP MLCC X 10k X7R C0G',
+    'CAP MLCC 100n C0G X7R 16V [0603]',
+    '(2) RES SMD 4k7 [0603]; (DNP) IC TI NE555',
+])
+def test_same_items_as_before(line):
+    assert parse_bomline(line) == _old_parse_bomline(line)
+
+
+def test_random_lines_same_items_as_before():
+    logging.disable(logging.ERROR)
+    try:
+        rng = random.Random(1)
+        for i in range(5000):
+            line = _random_line(rng)
+            try:
+                expected = _old_parse_bomline(line)
+            except Exception:
+                # Malformed lines now raise a BomLineError, or are taken
+                # as free text when no part number is generated
+                try:
+                    parse_bomline(line)
+                except BomLineError:
+                    pass
+                continue
+            assert parse_bomline(line) == expected, line
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+@pytest.mark.parametrize('line, column', [
+    ('', 0),
+    ('(2)', 3),
+    ('RES SMD', 7),
+    ('RES SMD x 1% [0603]', 8),
+    ('RES SMD 10k a% [0603]', 12),
+    ('CAP MLCC 10n X7R aV [0603]', 17),
+])
+def test_malformed_lines(line, column):
+    # Twice, the invalid parts aren't cached
+    for i in range(2):
+        with pytest.raises(BomLineError) as e:
+            parse_bomline(line)
+        assert e.value.column == column
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import sys
+import importlib
+
+import pytest
+
+from bomtool import cache
+from bomtool.cache import ParseCache, parser_version, load_counted
+from bomtool.bomtool import load_netlist
+
+loader_source = '''
+calls = []
+
+def load(data, use_mmap=False):
+    if hasattr(data, 'read'):
+        data = data.read()
+    calls.append(data)
+    return {'length': len(data)}
+'''
+
+
+@pytest.fixture
+def loader_module(tmpdir, monkeypatch):
+    """A loader defined outside the package, in a module the tests edit."""
+    tmpdir.join('loader_module.py').write(loader_source)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    module = importlib.import_module('loader_module')
+    yield module
+    del sys.modules['loader_module']
+
+
+def test_hits_and_misses(tmpdir, loader_module):
+    parse_cache = ParseCache(str(tmpdir.join('cache')))
+    load = loader_module.load
+    assert parse_cache.parse(b'abc', load) == {'length': 3}
+    assert parse_cache.parse(b'abc', load) == {'length': 3}
+    assert parse_cache.parse(b'abcd', load) == {'length': 4}
+    assert loader_module.calls == [b'abc', b'abcd']
+    assert parse_cache.stats() == {'hits': 1, 'misses': 2}
+    # Kept across runs
+    parse_cache = ParseCache(str(tmpdir.join('cache')))
+    assert parse_cache.parse(b'abc', load) == {'length': 3}
+    assert parse_cache.stats() == {'hits': 1, 'misses': 0}
+
+
+def test_invalidated_by_parser_changes(tmpdir, loader_module):
+    directory = str(tmpdir.join('cache'))
+    load = loader_module.load
+    version = parser_version(load)
+    ParseCache(directory).parse(b'abc', load)
+    # Editing the module of the loader changes the parser version
+    tmpdir.join('loader_module.py').write(loader_source + '\n# Edited\n')
+    assert parser_version(load) != version
+    parse_cache = ParseCache(directory)
+    parse_cache.parse(b'abc', load)
+    assert parse_cache.stats() == {'hits': 0, 'misses': 1}
+    assert len(loader_module.calls) == 2
+
+
+def test_invalidated_by_format_changes(tmpdir, loader_module, monkeypatch):
+    directory = str(tmpdir.join('cache'))
+    load = loader_module.load
+    ParseCache(directory).parse(b'abc', load)
+    monkeypatch.setattr(cache, '_format', cache._format + 1)
+    parse_cache = ParseCache(directory)
+    parse_cache.parse(b'abc', load)
+    assert parse_cache.stats() == {'hits': 0, 'misses': 1}
+
+
+def test_package_version():
+    # Loaders of the package depend on all of its modules
+    assert parser_version(load_netlist) == parser_version(load_netlist)
+    assert len(parser_version(load_netlist)) == 40
+
+
+def test_broken_entries(tmpdir, loader_module):
+    directory = tmpdir.join('cache')
+    parse_cache = ParseCache(str(directory))
+    load = loader_module.load
+    parse_cache.parse(b'abc', load)
+    for name in os.listdir(str(directory)):
+        directory.join(name).write_binary(b'\x80\x04broken')
+    assert parse_cache.parse(b'abc', load) == {'length': 3}
+    assert parse_cache.stats() == {'hits': 0, 'misses': 2}
+
+
+def test_evict(tmpdir, loader_module):
+    directory = str(tmpdir.join('cache'))
+    parse_cache = ParseCache(directory, max_size=0)
+    parse_cache.parse(b'abc', loader_module.load)
+    assert os.listdir(directory) == []
+
+
+def test_load_counted(tmpdir, loader_module):
+    path = tmpdir.join('input')
+    path.write_binary(b'abc')
+    parse_cache = ParseCache(str(tmpdir.join('cache')))
+    res, counts = load_counted(str(path), loader_module.load, cache=parse_cache)
+    assert res == {'length': 3}
+    assert counts == {'hits': 0, 'misses': 1}
+    # Counted in another process, with its own copy of the cache
+    worker_cache = ParseCache(str(tmpdir.join('cache')))
+    res, counts = load_counted(str(path), loader_module.load, cache=worker_cache)
+    parse_cache.merge(counts)
+    assert parse_cache.stats() == {'hits': 1, 'misses': 1}
+    assert load_counted(str(path), loader_module.load) == ({'length': 3}, None)
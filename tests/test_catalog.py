@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+
+import pytest
+
+from bomtool import pngen
+from bomtool.catalog import Catalog
+from bomtool.bomtool import ComponentCache
+
+table = '''Kind,Value,Package,Dielectric,Tolerance,Voltage,Power,Manufacturer,MPN,Price,Preferred
+RES SMD,4k7,0603,,1%,,0.1W,Yageo,RC0603FR-074K7L,0.002,
+RES SMD,4.7k,0603,,1%,,0.1W,Vishay,CRCW06034K70FKEA,0.001,
+RES SMD,4.7k,0603,,5%,,0.1W,Yageo,RC0603JR-074K7L,0.0005,
+RES SMD,4k7,0402,,1%,,0.063W,Yageo,RC0402FR-074K7L,0.001,yes
+CAP MLCC,100n,0603,X7R,10%,50V,,Murata,GRM188R71H104KA93D,0.004,
+CAP MLCC,100nF,0603,X7R,10%,16V,,Samsung,CL10B104KO8NNNC,0.002,
+'''
+
+
+@pytest.fixture
+def catalog(tmpdir):
+    catalog = Catalog(str(tmpdir.join('catalog.db')))
+    assert catalog.import_csv(io.StringIO(table)) == 6
+    yield catalog
+    catalog.close()
+
+
+def test_find(catalog):
+    # The cheapest fitting part, 4k7 and 4.7k are the same value
+    assert catalog.find('RES SMD', 4700.0, package='0603', tolerance=1) == {
+        'manufacturer': 'Vishay', 'MPN': 'CRCW06034K70FKEA'}
+    assert catalog.find('RES SMD', 4700.0, package='0603', tolerance=5)['MPN'] == 'RC0603JR-074K7L'
+    # Preferred parts win, of any package when it's not given
+    assert catalog.find('RES SMD', 4700.0, tolerance=1)['MPN'] == 'RC0402FR-074K7L'
+    assert catalog.find('RES SMD', 4700.0, package='0603', power=0.25) is None
+    assert catalog.find('RES SMD', 4700.0, package='0805') is None
+    assert catalog.find('RES SMD', 1000.0) is None
+    assert catalog.find('RES SMD', None) is None
+    assert catalog.find('CAP MLCC', 100e-9, package='0603', dielectric='X7R',
+                        voltage=25)['MPN'] == 'GRM188R71H104KA93D'
+    assert catalog.find('CAP MLCC', 100e-9, voltage=16)['MPN'] == 'CL10B104KO8NNNC'
+    assert catalog.find('CAP MLCC', 100e-9, dielectric='X5R') is None
+
+
+def test_version(catalog, tmpdir):
+    version = catalog.version()
+    assert version
+    # Kept when reopened, changed by every import
+    reopened = Catalog(str(tmpdir.join('catalog.db')))
+    assert reopened.version() == version
+    reopened.close()
+    catalog.import_csv(io.StringIO('kind,value,mpn\nRES SMD,1k,X\n'))
+    assert catalog.version() != version
+    assert len(catalog) == 7
+
+
+def test_invalid_tables(catalog):
+    with pytest.raises(ValueError) as e:
+        catalog.import_csv(io.StringIO('kind,value\nRES SMD,1k\n'), 'parts.csv')
+    assert str(e.value) == "Missing columns mpn in parts.csv"
+    with pytest.raises(ValueError) as e:
+        catalog.import_csv(io.StringIO('kind,value,mpn\nRES SMD,1k,A\nRES SMD,x,B\n'),
+                           'parts.csv')
+    assert str(e.value) == "Invalid number 'x' in line 3 of parts.csv"
+    # Nothing of a table with errors is imported
+    assert len(catalog) == 6
+
+
+def test_component_cache(catalog):
+    cache = ComponentCache(catalog=catalog)
+    part = cache.get(('RES', 'SMD', '4k7', '1%', '[0603]'))
+    assert part == {'manufacturer': 'Vishay', 'MPN': 'CRCW06034K70FKEA'}
+    # Generated by the pngen rules when the catalog has no part that fits
+    part = cache.get(('RES', 'SMD', '10k', '1%', '[0603]'))
+    assert part == pngen.RC(10e3, 1, None, '0603')
+    part = cache.get(('CAP', 'MLCC', '100n', '25V', 'X7R', '[0603]'))
+    assert part == {'manufacturer': 'Murata', 'MPN': 'GRM188R71H104KA93D'}
+    cache.use_catalog(None)
+    part = cache.get(('RES', 'SMD', '4k7', '1%', '[0603]'))
+    assert part == pngen.RC(4.7e3, 1, None, '0603')
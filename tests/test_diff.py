@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import os
+import subprocess
+
+import pytest
+
+from bomtool.diff import (normalize_bom, diff_boms, expand_revisions, RevisionBoms,
+                          diff_revisions, format_diff)
+from bomtool.cache import ParseCache
+
+r10k = "RES SMD 10k 1% [0603]"
+r22k = "RES SMD 22k 1% [0603]"
+
+
+def line(description, refs, **fields):
+    res = {'description': description, 'refs': refs, 'qty': len(refs.split(', '))}
+    res.update(fields)
+    return res
+
+
+def test_normalize_bom():
+    a = normalize_bom([line(r10k, 'R10, R2'), line(r22k, 'R1')])
+    b = normalize_bom([line(r22k, 'R1'), line(r10k, 'R2, R10')])
+    assert a == b
+    assert a[1][0][3] == ('R2', 'R10')
+    assert diff_boms(a, b) == {'added': [], 'removed': [], 'changed': []}
+
+
+def test_diff_boms():
+    old = normalize_bom([line(r10k, 'R1, R2'), line(r22k, 'R3'),
+                         line('IC TI NE555', 'U1', MPN='NE555DR'),
+                         line('CONN JST XH-2', 'J1')])
+    new = normalize_bom([line(r10k, 'R1, R4'), line(r22k, 'R3', manufacturer='Yageo'),
+                         line('IC TI NE555', 'U1', MPN='NE555PWR'),
+                         line('CAP MLCC 100n [0603]', 'C1')])
+    diff = diff_boms(old, new)
+    assert [l['description'] for l in diff['added']] == ['CAP MLCC 100n [0603]']
+    assert [l['description'] for l in diff['removed']] == ['CONN JST XH-2']
+    changes = dict((c['description'], c) for c in diff['changed'])
+    assert sorted(changes) == ['IC TI NE555', r10k, r22k]
+    assert changes[r10k]['fields'] == ['refs']
+    assert (changes[r10k]['refs_added'], changes[r10k]['refs_removed']) == (['R4'], ['R2'])
+    assert changes[r22k]['fields'] == ['manufacturer']
+    # Matched by description once the MPN changed
+    assert changes['IC TI NE555']['fields'] == ['MPN']
+    report = format_diff('v1', 'v2', diff)
+    assert report.splitlines()[0] == "v1..v2: 1 added, 1 removed, 3 changed"
+    assert "  ~ {}: refs +R4 -R2".format(r10k) in report
+
+
+def netlist(parts):
+    comps = "".join('\n    (comp (ref {})\n      (value x)\n      (fields\n'
+                    '        (field (name BOM) "{}")))'.format(ref, bom) for ref, bom in parts)
+    return '(export (version D)\n  (components{})\n)\n'.format(comps)
+
+
+class Repo(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.env = dict(os.environ, GIT_AUTHOR_NAME='Test', GIT_AUTHOR_EMAIL='test@example.com',
+                        GIT_COMMITTER_NAME='Test', GIT_COMMITTER_EMAIL='test@example.com')
+        self.git('init', '-q')
+
+    def git(self, *args):
+        return subprocess.check_output(('git',) + args, cwd=self.path, env=self.env)
+
+    def commit(self, name, text, message):
+        path = os.path.join(self.path, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+        self.git('add', name)
+        self.git('commit', '-q', '-m', message)
+        return self.git('rev-parse', '--short', 'HEAD').decode('ascii').strip()
+
+
+@pytest.fixture
+def repo(tmpdir):
+    try:
+        repo = Repo(str(tmpdir))
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("Needs git")
+    revs = [repo.commit('hw/board.net', netlist([('R1', r10k), ('R2', r10k)]), 'v1'),
+            repo.commit('hw/board.net', netlist([('R1', r10k), ('R2', r22k)]), 'v2'),
+            repo.commit('README', 'Board\n', 'docs'),
+            repo.commit('hw/board.net', netlist([('R1', r10k), ('R2', r10k)]), 'v3')]
+    return repo, revs
+
+
+def test_expand_revisions(repo):
+    repo, revs = repo
+    path = os.path.join(repo.path, 'hw', 'board.net')
+    # Only the commits changing the netlist
+    assert expand_revisions([revs[0] + '..' + revs[3]], path) == [revs[0], revs[1], revs[3]]
+    assert expand_revisions([revs[0], 'HEAD'], path) == [revs[0], 'HEAD']
+
+
+def test_diff_revisions(repo, tmpdir):
+    repo, revs = repo
+    path = os.path.join(repo.path, 'hw', 'board.net')
+    diffs = diff_revisions(path, revs)
+    assert [(a, b) for a, b, d in diffs] == [(revs[0], revs[1]), (revs[1], revs[2]),
+                                            (revs[2], revs[3])]
+    first = diffs[0][2]
+    assert [l['description'] for l in first['added']] == [r22k]
+    assert first['changed'][0]['refs_removed'] == ['R2']
+    assert diffs[1][2] == {'added': [], 'removed': [], 'changed': []}
+    assert diffs[2][2]['removed'] == first['added']
+
+
+def test_shared_blobs(repo, tmpdir):
+    repo, revs = repo
+    path = os.path.join(repo.path, 'hw', 'board.net')
+    cache = ParseCache(str(tmpdir.join('cache')))
+    boms = RevisionBoms(path, cache)
+    res = boms.get(revs)
+    # v1 and v3 have the same netlist, and so does the docs commit
+    assert res[0] == res[3] and res[1] == res[2]
+    assert boms.generated == 2
+    # The next runs take them from the cache
+    boms = RevisionBoms(path, ParseCache(str(tmpdir.join('cache'))))
+    assert boms.get(revs) == res
+    assert boms.generated == 0
+
+
+def test_missing_netlist(repo, caplog):
+    repo, revs = repo
+    first = repo.commit('other.net', netlist([]), 'other')
+    path = os.path.join(repo.path, 'hw', 'board.net')
+    repo.git('rm', '-q', '--cached', 'hw/board.net')
+    repo.git('commit', '-q', '-m', 'removed')
+    diff = diff_revisions(path, [first, 'HEAD'])[0][2]
+    assert "not in revision 'HEAD', its BOM is empty" in caplog.text
+    assert sorted(l['description'] for l in diff['removed']) == [r10k]
+    with pytest.raises(ValueError):
+        expand_revisions(['nonexistent..HEAD'], path)
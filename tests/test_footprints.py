@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import logging
+import sqlite3
+
+import pytest
+
+from bomtool.bomtool import Component
+from bomtool.footprints import FootprintIndex, package_match, bom_package
+
+
+def footprint(name, pads, size=(2, 1)):
+    return ('(footprint "{}" (layer "F.Cu")\n'.format(name)
+            + "".join('  (pad "{}" smd rect (at {} 0) (size 0.3 0.6) (layers "F.Cu"))\n'
+                      .format(p, i) for i, p in enumerate(pads))
+            + '  (fp_rect (start -{0} -{1}) (end {0} {1}) (layer "F.CrtYd"))\n'
+              .format(size[0] / 2, size[1] / 2)
+            + ')\n')
+
+
+def library(directory, name, footprints):
+    lib = directory.mkdir(name + '.pretty')
+    for fp, pads in footprints:
+        lib.join(fp + '.kicad_mod').write(footprint(fp, pads))
+    return lib
+
+
+def pins(n):
+    return [str(i) for i in range(1, n + 1)]
+
+
+@pytest.mark.parametrize('package, name, res', [
+    ('QFN-16', 'QFN-16-1EP_3x3mm_P0.5mm', (None, 17)),
+    ('qfn-16', 'QFN-16-1EP_3x3mm_P0.5mm', (None, 17)),
+    ('QFN-16', 'QFN-20-1EP_4x4mm_P0.5mm', ('QFN-20-1EP', None)),
+    ('DFN-8', 'DFN-8-2EP_3x3mm_P0.65mm', (None, 10)),
+    ('SOIC-8', 'SOIC-8_3.9x4.9mm_P1.27mm', (None, 8)),
+    ('SOT-23', 'SOT-23', (None, None)),
+    ('SOT-23', 'SOT-23-5', ('SOT-23-5', None)),
+    ('SOT-23-5', 'SOT-23-5_HandSoldering', (None, 5)),
+    ('TO-220-3', 'TO-220-3_Vertical', (None, 3)),
+    ('0603', 'R_0603_1608Metric', (None, None)),
+    ('0805', 'R_0603_1608Metric', ('0603', None)),
+])
+def test_package_match(package, name, res):
+    assert package_match(package, name) == res
+
+
+def test_bom_package():
+    assert bom_package('1608M') == '0603'
+    assert bom_package('0603') == '0603'
+
+
+def check(index, footprint, bom):
+    return index.check([Component('U1', '', footprint, ('BOM', bom))])
+
+
+def test_check(tmpdir):
+    library(tmpdir, 'Parts', [('QFN-16-1EP_3x3mm_P0.5mm', pins(17)),
+                              ('SOT-23', pins(3)),
+                              ('SOIC-8_3.9x4.9mm_P1.27mm', pins(7)),
+                              ('R_0603_1608Metric', pins(2))])
+    index = FootprintIndex()
+    assert index.update([str(tmpdir)]) == 1
+    assert len(index) == 4
+    assert index.get('Parts:SOT-23')['pads'] == 3
+    assert check(index, 'Parts:QFN-16-1EP_3x3mm_P0.5mm', 'IC TI TPS62130 [QFN-16]') == []
+    assert check(index, 'Parts:SOT-23', 'IC TI LMV321 [SOT-23]') == []
+    assert check(index, 'Parts:SOT-23', 'IC TI LMV321 [SOT-23-5]') == ['U1']
+    assert check(index, 'Parts:R_0603_1608Metric', 'RES SMD 10k [1608M]') == []
+    assert check(index, 'Parts:R_0603_1608Metric', 'RES SMD 10k [0805]') == ['U1']
+    # A footprint whose pads don't match its name
+    assert check(index, 'Parts:SOIC-8_3.9x4.9mm_P1.27mm', 'IC TI NE555 [SOIC-8]') == ['U1']
+    assert check(index, 'Parts:SOT-666', 'IC TI LMV321 [SOT-666]') == ['U1']
+    # Not indexed or without a package
+    assert check(index, 'Other:SOT-23', 'IC TI LMV321 [SOT-23-5]') == []
+    assert check(index, 'Parts:SOT-23', 'IC TI LMV321') == []
+
+
+def test_same_library_names(tmpdir, caplog):
+    first = library(tmpdir.mkdir('project'), 'Mine', [('SOT-23', pins(3))])
+    second = library(tmpdir.mkdir('shared'), 'Mine', [('SOT-23', pins(4)),
+                                                      ('SOIC-8', pins(8))])
+    path = str(tmpdir.join('index.db'))
+    index = FootprintIndex(path)
+    with caplog.at_level(logging.WARNING):
+        assert index.update([str(first), str(second)]) == 2
+    assert "have the same name" in caplog.text
+    # Both are kept, the first one is used
+    assert len(index) == 2
+    assert index.get('Mine:SOT-23')['pads'] == 3
+    assert index.get('Mine:SOIC-8')['pads'] == 8
+    index.close()
+    index = FootprintIndex(path)
+    assert index.update([str(second), str(first)]) == 0
+    assert index.get('Mine:SOT-23')['pads'] == 4
+    index.close()
+
+
+def test_updates(tmpdir):
+    lib = library(tmpdir, 'Parts', [('SOT-23', pins(3))])
+    path = str(tmpdir.join('index.db'))
+    index = FootprintIndex(path)
+    assert index.update([str(tmpdir)]) == 1
+    assert index.update([str(tmpdir)]) == 0
+    index.close()
+    lib.join('SOIC-8.kicad_mod').write(footprint('SOIC-8', pins(8)))
+    lib.setmtime(lib.mtime() + 10)
+    index = FootprintIndex(path)
+    assert index.update([str(lib)]) == 1
+    assert index.get('Parts:SOIC-8')['pads'] == 8
+    index.close()
+
+
+def test_old_index(tmpdir):
+    path = str(tmpdir.join('index.db'))
+    db = sqlite3.connect(path)
+    db.executescript("CREATE TABLE libraries (path TEXT PRIMARY KEY, name TEXT, mtime REAL);"
+                     "INSERT INTO libraries VALUES ('/x/Parts.pretty', 'Parts', 1);")
+    db.close()
+    # Dropped and read again
+    index = FootprintIndex(path)
+    assert index.libraries == set()
+    library(tmpdir, 'Parts', [('SOT-23', pins(3))])
+    assert index.update([str(tmpdir)]) == 1
+    index.close()
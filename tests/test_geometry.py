@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+
+import pytest
+
+from bomtool import geometry, xyrstool
+from bomtool.geometry import panel_copies, parse_panel, check_panel, place
+
+
+@pytest.fixture(params=['numpy', 'loops'])
+def engine(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(geometry, 'numpy', None)
+    return request.param
+
+
+def test_panel_copies():
+    assert panel_copies(10, 20, cols=3) == [(0, 0, 0), (10, 0, 0), (20, 0, 0)]
+    assert panel_copies(10, 20, cols=2, rows=2, step=(12, 25)) == [
+        (0, 0, 0), (12, 0, 0), (0, 25, 0), (12, 25, 0)]
+    # Spaced for the largest footprint once rotated
+    assert panel_copies(10, 20, cols=2, rows=2, rotations=(0, 90.0)) == [
+        (0, 0, 0), (20, 0, 90), (0, 20, 0), (20, 20, 90)]
+    assert panel_copies(10, 20, rotations=(-90,)) == [(0, 0, 270)]
+    with pytest.raises(ValueError):
+        panel_copies(10, 20, rotations=(90.5,))
+
+
+def test_place(engine):
+    outline = (0, 0, 10, 20)
+    copies = [(0, 0, 0), (100, 0, 90), (0, 100, 180), (100, 100, 270)]
+    xs, ys, rots = place([1.0], [2.0], [45.0], outline, copies)
+    # (1, 18) mm from the lower left corner of the board, turned around
+    # it and moved back to the first quadrant, then offset
+    expected = [(1, 18), (100 + 2, 1), (9, 100 + 2), (100 + 18, 100 + 9)]
+    assert xs == pytest.approx([x / 0.0254 for x, y in expected])
+    assert ys == pytest.approx([y / 0.0254 for x, y in expected])
+    assert rots == pytest.approx([45, 135, 225, 315])
+
+
+def test_panel_xyrs(engine):
+    pcb = io.StringIO(
+        '(kicad_pcb (version 20171130)\n'
+        '  (gr_rect (start 0 0) (end 10 20) (layer Edge.Cuts) (width 0.05))\n'
+        '  (module R_0603 (layer F.Cu) (at 1 2)\n'
+        '    (fp_text reference R1 (at 0 -1.43) (layer F.SilkS))\n'
+        '    (fp_rect (start -1 -0.5) (end 1 0.5) (layer F.CrtYd) (width 0.05))))\n')
+    bom = [{'qty': 1, 'refs': 'R1', 'description': 'RES SMD 10k 1% [0603]'}]
+    xyrs = xyrstool.generate_xyrs(pcb, bom, panel={'cols': 2, 'rotations': [0, 90]})
+    assert [p['#Designator'] for p in xyrs] == ['R1_1', 'R1_2']
+    assert [(p['X-Loc'], p['Y-Loc'], p['Rotation']) for p in xyrs] == [
+        (round(1 / 0.0254, 2), round(18 / 0.0254, 2), 0),
+        (round(22 / 0.0254, 2), round(1 / 0.0254, 2), 90)]
+    # The courtyard turns with the board
+    assert [(p['X-Size'], p['Y-Size']) for p in xyrs] == [
+        (round(2 / 0.0254, 2), round(1 / 0.0254, 2)),
+        (round(1 / 0.0254, 2), round(2 / 0.0254, 2))]
+
+
+def test_parse_panel():
+    assert parse_panel('2X3') == {'cols': 2, 'rows': 3}
+    assert parse_panel('2x1', '12.5,30', '0,180') == {
+        'cols': 2, 'rows': 1, 'step': (12.5, 30.0), 'rotations': [0.0, 180.0]}
+    for args in [('2',), ('2x1.5',), ('0x1',), ('2x1', '12.5'), ('2x1', None, '45')]:
+        with pytest.raises(ValueError):
+            parse_panel(*args)
+
+
+@pytest.mark.parametrize('options', [
+    {'cols': 2.0},
+    {'rows': True},
+    {'cols': 0},
+    {'cols': '2'},
+    {'step': (1,)},
+    {'step': (1, 'a')},
+    {'rotations': [90.5]},
+    {'rotations': ['90']},
+    {'rotations': []},
+    {'angle': 90},
+])
+def test_check_panel_invalid(options):
+    with pytest.raises(ValueError):
+        check_panel(options)
+
+
+def test_check_panel():
+    options = {'cols': 2, 'rows': 2, 'step': [30, 40.5], 'rotations': [0, 90.0, -180]}
+    assert check_panel(options) is options
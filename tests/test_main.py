@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bomtool.__main__ as cli
+
+netlist = '''(export (version D)
+  (components
+    (comp (ref R1)
+      (value 10k)
+      (fields
+        (field (name BOM) "RES SMD 10k 1% [0603]")))))
+'''
+
+board = '''(kicad_pcb (version 20171130)
+  (gr_rect (start 0 0) (end 10 10) (layer Edge.Cuts) (width 0.05))
+  (module R_0603 (layer F.Cu) (at 1 2)
+    (fp_text reference R1 (at 0 0) (layer F.SilkS))))
+'''
+
+
+class Pool(ThreadPoolExecutor):
+    """The board parse pool, in threads, remembering how it was shut down."""
+
+    pools = []
+
+    def __init__(self, max_workers=None):
+        ThreadPoolExecutor.__init__(self, max_workers)
+        self.shut_down = None
+        self.pools.append(self)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = {'wait': wait, 'cancel_futures': cancel_futures}
+        ThreadPoolExecutor.shutdown(self, wait, cancel_futures=cancel_futures)
+
+
+@pytest.fixture
+def run(tmpdir, monkeypatch):
+    tmpdir.join('t.net').write(netlist)
+    tmpdir.join('t.kicad_pcb').write(board)
+    monkeypatch.setattr(cli, 'ProcessPoolExecutor', Pool)
+    monkeypatch.setattr(Pool, 'pools', [])
+    monkeypatch.chdir(tmpdir)
+
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['bomtool'] + list(args))
+        cli.main()
+    return run
+
+
+def test_outputs(run, tmpdir):
+    run('t.net', 't.kicad_pcb', '--bom', 'bom.csv', '--xyrs', 'out/t.xyrs')
+    assert 'RES SMD 10k 1% [0603]' in tmpdir.join('bom.csv').read()
+    assert tmpdir.join('out', 't.xyrs').read().splitlines()[1].startswith('R1\t')
+    assert Pool.pools[0].shut_down == {'wait': True, 'cancel_futures': True}
+
+
+@pytest.mark.parametrize('args', [
+    ['--catalog', 'missing/catalog.db'],
+    ['--component-cache', 'missing/parts.db'],
+])
+def test_errors_stop_the_board_parse(run, args):
+    with pytest.raises(SystemExit):
+        run('t.net', 't.kicad_pcb', '--xyrs', 't.xyrs', *args)
+    assert Pool.pools[0].shut_down == {'wait': True, 'cancel_futures': True}
+
+
+def test_missing_netlist(run):
+    with pytest.raises(SystemExit):
+        run('missing.net', 't.kicad_pcb', '--xyrs', 't.xyrs')
+    assert Pool.pools[0].shut_down is not None
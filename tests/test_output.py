@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import csv
+import json
+import sqlite3
+
+import pytest
+
+from bomtool import output
+from bomtool.output import (DelimitedSink, JsonLinesSink, SqliteSink, open_sink,
+                            table_rows, write_table, write_outputs)
+
+columns = ['qty', 'refs', 'MPN']
+records = [{'qty': 2, 'refs': 'R1, R2', 'MPN': 'RC0603FR-0710KL'},
+           {'qty': 1, 'refs': 'U1', 'description': 'IC TI NE555'},
+           {'qty': 'DO NOT POPULATE', 'refs': 'J1', 'MPN': 'a "quoted", part'}]
+rows = [(2, 'R1, R2', 'RC0603FR-0710KL'), (1, 'U1', ''),
+        ('DO NOT POPULATE', 'J1', 'a "quoted", part')]
+
+
+def write(records, sinks):
+    write_table(records, columns, sinks)
+
+
+def failing(records):
+    for r in records:
+        yield r
+    raise RuntimeError("No more records")
+
+
+def sqlite_rows(path, table='bom'):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute('SELECT * FROM "{}"'.format(table)).fetchall()
+    finally:
+        db.close()
+
+
+def test_table_rows():
+    assert list(table_rows(records, columns)) == rows
+
+
+def test_write_table(monkeypatch):
+    # Several chunks, handed to every sink
+    monkeypatch.setattr(output, '_chunk_rows', 2)
+    files = [io.StringIO(), io.StringIO()]
+    sinks = [DelimitedSink(files[0]), JsonLinesSink(files[1])]
+    assert write_table(records, columns, sinks) == 3
+    assert list(csv.reader(io.StringIO(files[0].getvalue()))) == (
+        [columns] + [[str(v) for v in row] for row in rows])
+    assert [json.loads(l) for l in files[1].getvalue().splitlines()] == [
+        dict(zip(columns, row)) for row in rows]
+
+
+def test_formats(tmpdir):
+    paths = [str(tmpdir.join(name))
+             for name in ('bom.csv', 'bom.TSV', 'bom.xyrs', 'bom.jsonl', 'bom.db', 'bom.txt')]
+    write_outputs(write, records, paths, 'bom')
+    with open(paths[0], newline='') as f:
+        assert list(csv.reader(f))[1] == ['2', 'R1, R2', 'RC0603FR-0710KL']
+    for path in paths[1:3]:
+        with open(path, newline='') as f:
+            assert list(csv.reader(f, csv.excel_tab))[2] == ['1', 'U1', '']
+    with open(paths[3]) as f:
+        assert json.loads(f.readline()) == dict(zip(columns, rows[0]))
+    assert sqlite_rows(paths[4]) == rows
+    # The default format for other extensions
+    with open(paths[5], newline='') as f:
+        assert f.readline() == 'qty,refs,MPN\r\n'
+    sink = open_sink(paths[5], 'bom', 'jsonl')
+    assert isinstance(sink, JsonLinesSink)
+    sink.close()
+
+
+def test_directories(tmpdir):
+    path = str(tmpdir.join('out', 'v1', 'bom.csv'))
+    write_outputs(write, records, [path], 'bom')
+    assert tmpdir.join('out', 'v1', 'bom.csv').check()
+
+
+def test_sqlite_replaced(tmpdir):
+    path = str(tmpdir.join('bom.db'))
+    write_outputs(write, records, [path], 'bom')
+    write_outputs(write, records[:1], [path], 'bom')
+    assert sqlite_rows(path) == rows[:1]
+    # Other tables are kept
+    write_outputs(write, records, [path], 'xyrs')
+    assert sqlite_rows(path) == rows[:1]
+    assert sqlite_rows(path, 'xyrs') == rows
+
+
+def test_sqlite_failed_write(tmpdir, monkeypatch):
+    monkeypatch.setattr(output, '_chunk_rows', 1)
+    path = str(tmpdir.join('bom.db'))
+    write_outputs(write, records[:1], [path], 'bom')
+    with pytest.raises(RuntimeError):
+        write_outputs(write, failing(records), [path, str(tmpdir.join('bom.csv'))], 'bom')
+    # The previous table is left as it was
+    assert sqlite_rows(path) == rows[:1]
+
+
+def test_sqlite_sink_close(tmpdir):
+    path = str(tmpdir.join('bom.db'))
+    sink = SqliteSink(path, 'bom')
+    write_table(records, columns, [sink])
+    sink.close(ok=False)
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT name FROM sqlite_master").fetchall() == []
+    db.close()
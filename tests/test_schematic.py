@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import pytest
+
+from bomtool import schematic
+from bomtool.schematic import load_schematic, load_components
+from bomtool.cache import ParseCache
+
+root_uuid = '00000000-0000-0000-0000-000000000001'
+
+
+def symbol(uuid, ref, value, fields=(), instances=()):
+    """A placed symbol, 'instances' are (path, ref) pairs in the KiCad 7
+    format, or (path, ref, value) ones."""
+    out = ['  (symbol (lib_id "Device:{}") (at 10 10 0) (unit 1)\n'.format(ref[0]),
+           '    (uuid {})\n'.format(uuid),
+           '    (property "Reference" "{}" (at 0 0 0))\n'.format(ref),
+           '    (property "Value" "{}" (at 0 0 0))\n'.format(value),
+           '    (property "Footprint" "" (at 0 0 0))\n',
+           '    (property "Datasheet" "~" (at 0 0 0))\n']
+    out += ['    (property "{}" "{}" (at 0 0 0))\n'.format(*f) for f in fields]
+    if instances:
+        out.append('    (instances (project "demo"\n')
+        for instance in instances:
+            out.append('      (path "{}" (reference "{}") (unit 1){})\n'.format(
+                instance[0], instance[1],
+                ' (value "{}")'.format(instance[2]) if len(instance) > 2 else ''))
+        out.append('    ))\n')
+    out.append('  )\n')
+    return ''.join(out)
+
+
+def sheet(uuid, name, file):
+    return ('  (sheet (at 50 50) (size 20 20) (uuid {})\n'
+            '    (property "Sheetname" "{}" (at 0 0 0))\n'
+            '    (property "Sheetfile" "{}" (at 0 0 0)))\n').format(uuid, name, file)
+
+
+def schematic_file(uuid, items, extra=''):
+    return ('(kicad_sch (version 20230121) (generator eeschema)\n  (uuid {})\n'
+            '  (lib_symbols (symbol "Device:R" (property "Reference" "R" (at 0 0 0))))\n'
+            '{}  (wire (pts (xy 0 0) (xy 10 0)))\n{})\n').format(uuid, "".join(items), extra)
+
+
+r10k = ('BOM', 'RES SMD 10k 1% [0603]')
+c100n = ('BOM', 'CAP MLCC 100n 16V X7R [0603]')
+
+
+@pytest.fixture
+def kicad7(tmpdir):
+    """A root sheet with two instances of a channel sheet, which has a
+    filter sub-sheet."""
+    r = '/' + root_uuid
+    tmpdir.join('root.kicad_sch').write(schematic_file(root_uuid, [
+        symbol('u1a', 'U?', 'NE5532', [('BOM', 'IC TI NE5532')], [(r, 'U1')]),
+        symbol('u1b', 'U?', 'NE5532', [('MPN', 'NE5532DR')], [(r, 'U1')]),
+        symbol('pwr', '#PWR?', 'GND', [], [(r, '#PWR01')]),
+        sheet('s1', 'ch1', 'channel.kicad_sch'),
+        sheet('s2', 'ch2', 'channel.kicad_sch')]))
+    tmpdir.join('channel.kicad_sch').write(schematic_file('ch', [
+        symbol('r', 'R?', '10k', [r10k], [(r + '/s1', 'R1'), (r + '/s2', 'R2', '22k')]),
+        sheet('f', 'filter', 'sub/filter.kicad_sch')]))
+    tmpdir.mkdir('sub').join('filter.kicad_sch').write(schematic_file('filter', [
+        symbol('c', 'C?', '100n', [c100n], [(r + '/s1/f', 'C1'), (r + '/s2/f', 'C2')])]))
+    return str(tmpdir.join('root.kicad_sch'))
+
+
+expected = [('C1', '100n', c100n), ('C2', '100n', c100n),
+            ('R1', '10k', r10k), ('R2', '22k', r10k),
+            ('U1', 'NE5532', ('BOM', 'IC TI NE5532', 'MPN', 'NE5532DR'))]
+
+
+def components(comps):
+    return [(c.ref, c.value, c.fields) for c in comps]
+
+
+def test_hierarchy(kicad7):
+    assert components(load_schematic(kicad7)) == expected
+    # Read like netlists
+    comps = load_components(kicad7)
+    assert components(comps) == expected
+    assert comps[2]['BOM'] == r10k[1]
+
+
+def test_kicad6(tmpdir):
+    # The instances of every symbol are kept in the root sheet, under the
+    # paths from below it
+    instances = ('  (symbol_instances\n'
+                 '    (path "/s1/r" (reference "R1") (unit 1) (value "10k") (footprint ""))\n'
+                 '    (path "/s2/r" (reference "R2") (unit 1) (value "22k") (footprint ""))\n'
+                 '    (path "/s1/f/c" (reference "C1") (unit 1) (value "100n") (footprint ""))\n'
+                 '    (path "/s2/f/c" (reference "C2") (unit 1) (value "100n") (footprint ""))\n'
+                 '    (path "/u1a" (reference "U1") (unit 1) (value "NE5532") (footprint ""))\n'
+                 '    (path "/u1b" (reference "U1") (unit 2) (value "NE5532") (footprint ""))\n'
+                 '    (path "/pwr" (reference "#PWR01") (unit 1) (value "GND") (footprint ""))\n'
+                 '  )\n')
+    tmpdir.join('root.kicad_sch').write(schematic_file(root_uuid, [
+        symbol('u1a', 'U?', 'NE5532', [('BOM', 'IC TI NE5532')]),
+        symbol('u1b', 'U?', 'NE5532', [('MPN', 'NE5532DR')]),
+        symbol('pwr', '#PWR?', 'GND'),
+        sheet('s1', 'ch1', 'channel.kicad_sch'),
+        sheet('s2', 'ch2', 'channel.kicad_sch')], instances))
+    tmpdir.join('channel.kicad_sch').write(schematic_file('ch', [
+        symbol('r', 'R?', '10k', [r10k]),
+        sheet('f', 'filter', 'filter.kicad_sch')]))
+    tmpdir.join('filter.kicad_sch').write(schematic_file('filter', [
+        symbol('c', 'C?', '100n', [c100n])]))
+    assert components(load_schematic(str(tmpdir.join('root.kicad_sch')))) == expected
+
+
+def test_parallel(kicad7, monkeypatch, tmpdir):
+    monkeypatch.setattr(schematic, '_parallel_min', 1)
+    cache = ParseCache(str(tmpdir.join('cache')))
+    assert components(load_schematic(kicad7, jobs=2, cache=cache)) == expected
+    # The counts of the workers are added to the cache
+    assert cache.stats() == {'hits': 0, 'misses': 3}
+    assert components(load_schematic(kicad7, jobs=2, cache=cache)) == expected
+    assert cache.stats() == {'hits': 3, 'misses': 3}
+
+
+def test_unannotated(tmpdir):
+    tmpdir.join('root.kicad_sch').write(schematic_file(root_uuid, [
+        symbol('a', 'R?', '10k', [r10k]), symbol('b', 'R?', '1k', [r10k])]))
+    assert [c.ref for c in load_schematic(str(tmpdir.join('root.kicad_sch')))] == ['R?', 'R?']
+
+
+def test_recursive(tmpdir):
+    tmpdir.join('root.kicad_sch').write(schematic_file(root_uuid, [
+        sheet('s1', 'loop', 'loop.kicad_sch')]))
+    tmpdir.join('loop.kicad_sch').write(schematic_file('loop', [
+        sheet('s2', 'again', 'loop.kicad_sch')]))
+    with pytest.raises(ValueError):
+        load_schematic(str(tmpdir.join('root.kicad_sch')))
+
+
+def test_sheet_without_file(tmpdir):
+    tmpdir.join('root.kicad_sch').write(schematic_file(root_uuid, [
+        '  (sheet (uuid s1) (property "Sheetname" "x" (at 0 0 0)))\n']))
+    with pytest.raises(ValueError):
+        load_schematic(str(tmpdir.join('root.kicad_sch')))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bomtool import serve
+
+netlist = b'''(export (version D)
+  (components
+    (comp (ref R1)
+      (value 10k)
+      (footprint Resistor_SMD:R_0603_1608Metric)
+      (fields
+        (field (name BOM) "RES SMD 10k 1% [0603]")))))
+'''
+
+
+class Writer(object):
+
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def _request(server, raw):
+    reader = asyncio.StreamReader()
+    reader.feed_data(raw)
+    reader.feed_eof()
+    writer = Writer()
+    await server.handle(reader, writer)
+    head, _, body = writer.data.partition(b'\r\n\r\n')
+    return int(head.split()[1]), body
+
+
+def request(server, method, target, body=b''):
+    raw = "{} {} HTTP/1.1\r\nConnection: close\r\nContent-Length: {}\r\n\r\n".format(
+        method, target, len(body)).encode('latin-1') + body
+    return asyncio.run(_request(server, raw))
+
+
+@pytest.fixture
+def server():
+    server = serve.Server(jobs=1)
+    # Rendering in threads, so the tests can hold it back
+    server.pool.shutdown()
+    server.pool = ThreadPoolExecutor(max_workers=2)
+    yield server
+    server.close()
+
+
+def test_bom(server, tmpdir):
+    path = tmpdir.join('t.net')
+    path.write_binary(netlist)
+    status, body = request(server, 'GET', '/bom?netlist=' + str(path))
+    assert status == 200
+    assert b'RES SMD 10k 1% [0603]' in body
+    status, body = request(server, 'POST', '/bom?format=jsonl', netlist)
+    assert status == 200
+    assert b'"R1"' in body
+
+
+@pytest.mark.parametrize('method, target, body, status', [
+    ('GET', '/nothing', b'', 404),
+    ('PUT', '/bom', b'', 405),
+    ('GET', '/bom', b'', 400),
+    ('GET', '/bom?netlist=/nonexistent/t.net', b'', 404),
+    ('GET', '/bom?netlist=/', b'', 400),
+    ('POST', '/bom?format=xls', netlist, 400),
+    ('POST', '/bom', b'RES SMD 10k', 400),
+    ('POST', '/bom', b'(kicad_pcb (version 20171130))', 400),
+    ('POST', '/bom', b'(export (components (comp (ref R1)', 400),
+    ('POST', '/xyrs?pcb=/nonexistent/t.kicad_pcb', netlist, 404),
+])
+def test_error_statuses(server, method, target, body, status):
+    assert request(server, method, target, body)[0] == status
+    assert server.errors == 1
+
+
+def test_unreadable(server, monkeypatch):
+    def read_file(path):
+        raise PermissionError(13, "Permission denied", path)
+    monkeypatch.setattr(serve, '_read_file', read_file)
+    assert request(server, 'GET', '/bom?netlist=t.net')[0] == 403
+
+
+def test_invalid_panel(server, tmpdir):
+    path = tmpdir.join('t.kicad_pcb')
+    path.write_binary(b'(kicad_pcb (version 20171130))')
+    status, body = request(server, 'POST', '/xyrs?panel=2x2.5&pcb=' + str(path), netlist)
+    assert status == 400
+    assert body.startswith(b'Invalid panel options')
+
+
+def test_coalesced(server, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    render = serve._timed_render
+
+    def held(*args):
+        started.set()
+        release.wait(10)
+        return render(*args)
+    monkeypatch.setattr(serve, '_timed_render', held)
+
+    async def run():
+        same = [asyncio.ensure_future(server.dispatch('POST', '/bom', {}, netlist))
+                for i in range(3)]
+        other = asyncio.ensure_future(server.dispatch('POST', '/bom?format=tsv', {}, netlist))
+        while server.computed + server.coalesced < 4:
+            await asyncio.sleep(0.01)
+        assert server.stats()['in_flight'] == 2
+        release.set()
+        return await asyncio.gather(*same), await other
+    same, other = asyncio.run(run())
+    assert started.is_set()
+    assert server.computed == 2
+    assert server.coalesced == 2
+    assert same[0] == same[1] == same[2]
+    assert same[0][2] != other[2]
+    assert server.stats()['in_flight'] == 0
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import pytest
+
+from bomtool.sexp import Node, assoc, findall, loads, engines, _index_min
+
+
+def _node():
+    # Long enough for assoc to use the index
+    return Node([Node(['a', 1]), Node(['b', 2]), Node(['a', 3])] +
+                [Node(['x', i]) for i in range(_index_min)])
+
+
+def _refill(n):
+    n.extend([Node(['b', 0]), Node(['a', 4]), Node(['c', 5])] +
+             [Node(['x', i]) for i in range(_index_min)])
+
+
+# Each mutation and the cells assoc should then find for 'a' and 'b'
+_mutations = [
+    ('setitem', lambda n: n.__setitem__(0, Node(['b', 0])), ['a', 3], ['b', 0]),
+    ('setslice', lambda n: n.__setitem__(slice(0, 2), [Node(['b', 0])]), ['a', 3], ['b', 0]),
+    ('delitem', lambda n: n.__delitem__(0), ['a', 3], ['b', 2]),
+    ('insert', lambda n: n.insert(0, Node(['b', 0])), ['a', 1], ['b', 0]),
+    ('pop', lambda n: n.pop(0), ['a', 3], ['b', 2]),
+    ('remove', lambda n: n.remove(n[0]), ['a', 3], ['b', 2]),
+    ('reverse', lambda n: n.reverse(), ['a', 3], ['b', 2]),
+    ('sort', lambda n: n.sort(key=lambda c: (c[0] == 'x', -c[1])), ['a', 3], ['b', 2]),
+    ('clear', lambda n: (n.clear(), _refill(n)), ['a', 4], ['b', 0]),
+    ('imul', lambda n: _refill(n.__imul__(0)), ['a', 4], ['b', 0]),
+    ('append', lambda n: n.append(Node(['c', 4])), ['a', 1], ['b', 2]),
+    ('extend', lambda n: n.extend([Node(['b', 4])]), ['a', 1], ['b', 2]),
+    ('iadd', lambda n: n.__iadd__([Node(['c', 4])]), ['a', 1], ['b', 2]),
+]
+
+
+@pytest.mark.parametrize('name, mutate, a, b', _mutations, ids=[m[0] for m in _mutations])
+def test_node_index_follows_mutations(name, mutate, a, b):
+    n = _node()
+    # Build the index before changing the node
+    assert assoc(n, 'a') == ['a', 1]
+    mutate(n)
+    assert assoc(n, 'a') == a
+    assert assoc(n, 'b') == b
+    assert list(findall(n, 'a')) == [c for c in n if c[0] == 'a']
+
+
+@pytest.mark.parametrize('engine', sorted(engines))
+@pytest.mark.parametrize('data', [str, lambda s: s.encode('utf-8')], ids=['str', 'bytes'])
+def test_keep_matches_quoted_heads(engine, data):
+    s = '(pcb ("at" 1) (at 2) ("a\\"t" 3) (layer F) ("layer" (x "y") (z)))'
+    assert loads(data(s), engine, keep={'at': None, 'layer': {'x'}}) == [
+        ['pcb', ['at', '1'], ['at', '2'], ['layer', 'F'], ['layer', ['x', 'y']]]]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import time
+
+from bomtool import stats
+from bomtool.stats import stage, Recorder, print_report
+
+
+def test_events():
+    events = []
+
+    def callback(event, name, info):
+        events.append((event, name, sorted(info)))
+    stats.subscribe(callback)
+    try:
+        with stage('load', files=1) as info:
+            info['components'] = 2
+    finally:
+        stats.unsubscribe(callback)
+    assert events == [('start', 'load', ['files']),
+                      ('end', 'load', ['components', 'files', 'time'])]
+    # Without subscribers
+    with stage('load') as info:
+        pass
+    assert info == {}
+
+
+def test_nested_peaks():
+    with Recorder() as recorder:
+        with stage('outer'):
+            big = bytearray(8 << 20)
+            del big
+            with stage('inner'):
+                small = bytearray(1 << 20)
+                del small
+            time.sleep(0.01)
+    inner, outer = recorder.stages
+    assert (inner['stage'], outer['stage']) == ('inner', 'outer')
+    assert (1 << 20) * 0.9 < inner['peak_memory'] < 2 << 20
+    # The inner stage doesn't hide the peak of the outer one before it
+    assert outer['peak_memory'] >= 8 << 20
+    assert recorder.peak >= 8 << 20
+    assert outer['time'] >= 0.01 and outer['time'] > inner['time']
+    report = recorder.report(files=1)
+    assert report['files'] == 1 and report['time'] >= outer['time']
+    out = io.StringIO()
+    print_report(report, out)
+    assert [l.split()[0] for l in out.getvalue().splitlines()] == ['inner', 'outer', 'total']
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import logging
+
+from bomtool.bomtool import Component, generate_bom, generate_variant_boms
+from bomtool.__main__ import _variant_path
+
+r10k = "RES SMD 10k 1% [0603]"
+r22k = "RES SMD 22k 1% [0603]"
+opamp = "IC TI LMV321"
+
+
+def components():
+    lines = [('R1', r10k), ('R2', r10k), ('R3', r10k), ('R4', r22k), ('U1', opamp),
+             ('H1', 'VIRTUAL')]
+    return [Component(ref, '', '', ('BOM', line)) for ref, line in lines]
+
+
+def lines(bom):
+    return [(l['description'], l['refs'], l['qty']) for l in bom]
+
+
+def test_base():
+    comps = components()
+    boms = generate_variant_boms(comps, {'full': {}})
+    assert boms['full'] == generate_bom(comps)
+
+
+def test_overrides():
+    comps = components()
+    overrides = {'R2': {'BOM': r22k}, 'U1': {'MPN': 'LMV321IDBVR'}}
+    boms = generate_variant_boms(comps, {'alt': {'overrides': overrides}})
+    changed = [c.override(overrides[c['ref']]) if c['ref'] in overrides else c
+               for c in comps]
+    assert boms['alt'] == generate_bom(changed)
+    assert lines(boms['alt']) == [
+        (opamp, 'U1', 1), (r10k, 'R1, R3', 2), (r22k, 'R2, R4', 2)]
+    assert boms['alt'][0]['MPN'] == 'LMV321IDBVR'
+
+
+def test_dnp():
+    boms = generate_variant_boms(components(), {'lite': {'dnp': ['R2', 'U1']}})
+    assert lines(boms['lite']) == [
+        (opamp, 'U1', 'DO NOT POPULATE'),
+        (r10k, 'R1, R3', 2),
+        (r10k, 'R2', 'DO NOT POPULATE'),
+        (r22k, 'R4', 1)]
+
+
+def test_shared_lines():
+    variants = {'full': {}, 'lite': {'dnp': ['R2']},
+                'alt': {'overrides': {'R1': {'BOM': r22k}}}}
+    boms = generate_variant_boms(components(), variants)
+    # The lines no variant changes are generated once
+    r22k_line = [l for l in boms['full'] if l['description'] == r22k][0]
+    assert any(l is r22k_line for l in boms['lite'])
+    assert not any(l is r22k_line for l in boms['alt'])
+    assert lines(boms['alt']) == [
+        (opamp, 'U1', 1), (r10k, 'R2, R3', 2), (r22k, 'R1, R4', 2)]
+
+
+def test_unknown_components(caplog):
+    with caplog.at_level(logging.WARNING):
+        boms = generate_variant_boms(components(), {'v': {'dnp': ['R9'],
+                                                          'overrides': {'C1': {'BOM': r10k}}}})
+    assert "Variant 'v' changes unknown components: C1, R9" in caplog.text
+    assert boms['v'] == generate_bom(components())
+
+
+def test_variant_path():
+    assert _variant_path('out/bom.csv', None) == 'out/bom.csv'
+    assert _variant_path('out/bom.csv', 'lite') == 'out/bom-lite.csv'
+    assert _variant_path('out/{variant}/bom.csv', 'lite') == 'out/lite/bom.csv'
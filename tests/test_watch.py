@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import io
+import os
+
+import pytest
+
+from bomtool import watch
+from bomtool.watch import Project
+from bomtool.bomtool import load_netlist, generate_bom
+from bomtool.xyrstool import generate_xyrs
+
+lines = {'R': "RES SMD {}k 1% [0603]", 'C': "CAP MLCC 100n 16V X7R [0603]"}
+
+
+def netlist(parts):
+    out = ['(export (version D)\n  (design\n    (tool "Eeschema 5.1.5"))\n  (components']
+    for ref, value in parts:
+        out.append('\n    (comp (ref {})\n      (value {})\n      (fields\n'
+                   '        (field (name BOM) "{}")))'
+                   .format(ref, value, lines[ref[0]].format(value)))
+    out.append(')\n  (nets\n    (net (code 1) (name GND)))\n)\n')
+    return ''.join(out)
+
+
+def board(modules, indent='  '):
+    out = ['(kicad_pcb (version 20171130) (host pcbnew 5.1.5)\n',
+           indent + '(general (thickness 1.6))\n',
+           indent + '(gr_rect (start 0 0) (end 50 40) (layer Edge.Cuts) (width 0.05))\n']
+    for ref, x, y in modules:
+        out.append(indent + '(module R_0603 (layer F.Cu) (at {} {})\n'.format(x, y)
+                   + indent * 2 + '(fp_text reference {} (at 0 -1.43) (layer F.SilkS))\n'.format(ref)
+                   + indent * 2 + '(fp_rect (start -1 -0.5) (end 1 0.5) (layer F.CrtYd) (width 0.05)))\n')
+    out.append(indent + '(segment (start 0 0) (end 1 1) (width 0.25) (layer F.Cu) (net 1))\n)\n')
+    return ''.join(out)
+
+
+class Files(object):
+
+    def __init__(self, tmpdir):
+        self.netlist = str(tmpdir.join('t.net'))
+        self.pcb = str(tmpdir.join('t.kicad_pcb'))
+        self.stamp = 1000000000
+
+    def write(self, path, text):
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        # Files can change within the resolution of their times
+        self.stamp += 10
+        os.utime(path, (self.stamp, self.stamp))
+
+
+@pytest.fixture
+def files(tmpdir):
+    return Files(tmpdir)
+
+
+@pytest.fixture
+def counts(monkeypatch):
+    """The components and modules parsed by the project."""
+    counts = {'comps': 0, 'modules': 0}
+    parse_comp, parse_modules = watch.parse_comp, watch.parse_modules
+
+    def counted_comp(data):
+        counts['comps'] += 1
+        return parse_comp(data)
+
+    def counted_modules(modules):
+        counts['modules'] += len(modules)
+        return parse_modules(modules)
+    monkeypatch.setattr(watch, 'parse_comp', counted_comp)
+    monkeypatch.setattr(watch, 'parse_modules', counted_modules)
+    return counts
+
+
+parts = [('C1', '100n'), ('R1', '10'), ('R2', '10'), ('R3', '22')]
+modules = [('C1', 10, 10), ('R1', 20, 10), ('R2', 30, 10), ('R3', 40, 10)]
+
+
+def check(project, files):
+    """The outputs of the project are those of a full run."""
+    with io.open(files.netlist, 'rb') as f:
+        bom = generate_bom(load_netlist(f))
+    assert project.bom == bom
+    with io.open(files.pcb, 'rb') as f:
+        assert project.xyrs == generate_xyrs(f, bom)
+
+
+def test_update(files, counts):
+    files.write(files.netlist, netlist(parts))
+    files.write(files.pcb, board(modules))
+    project = Project(files.netlist, files.pcb)
+    assert project.update() == {'bom', 'xyrs'}
+    check(project, files)
+    assert counts == {'comps': 4, 'modules': 4}
+    assert project.update() == set()
+
+    # One component changes its BOM line
+    files.write(files.netlist, netlist(parts[:2] + [('R2', '22')] + parts[3:]))
+    assert project.update() == {'bom', 'xyrs'}
+    check(project, files)
+    assert counts == {'comps': 5, 'modules': 4}
+
+    # One module moves
+    files.write(files.pcb, board(modules[:1] + [('R1', 25, 15)] + modules[2:]))
+    assert project.update() == {'xyrs'}
+    check(project, files)
+    assert counts == {'comps': 5, 'modules': 5}
+    assert project.xyrs[1]['X-Loc'] == round(25 / 0.0254, 2)
+
+    # Rewritten without changes
+    files.write(files.pcb, board(modules[:1] + [('R1', 25, 15)] + modules[2:]))
+    assert project.update() == set()
+
+
+def test_added_and_removed(files, counts):
+    files.write(files.netlist, netlist(parts))
+    files.write(files.pcb, board(modules))
+    project = Project(files.netlist, files.pcb)
+    project.update()
+    files.write(files.netlist, netlist(parts[1:]))
+    files.write(files.pcb, board(modules[1:]))
+    assert project.update() == {'bom', 'xyrs'}
+    check(project, files)
+    # The text left of R1 matches the start of C1, so the changed span
+    # takes R1 along
+    assert counts == {'comps': 4, 'modules': 5}
+    files.write(files.netlist, netlist(parts[1:] + [('R4', '47')]))
+    files.write(files.pcb, board(modules[1:] + [('R4', 45, 30)]))
+    assert project.update() == {'bom', 'xyrs'}
+    check(project, files)
+    assert counts == {'comps': 5, 'modules': 6}
+
+
+def test_tab_indented(files, counts):
+    files.write(files.netlist, netlist(parts))
+    files.write(files.pcb, board(modules, '\t'))
+    project = Project(files.netlist, files.pcb)
+    project.update()
+    files.write(files.pcb, board(modules[:3] + [('R3', 40, 20)], '\t'))
+    assert project.update() == {'xyrs'}
+    check(project, files)
+    assert counts['modules'] == 5
+
+
+def test_unsplit_files(files):
+    # Not indented like KiCad writes them, parsed whole
+    files.write(files.netlist, netlist(parts).replace('\n', ' '))
+    files.write(files.pcb, board(modules).replace('\n', ' '))
+    project = Project(files.netlist, files.pcb)
+    assert project.update() == {'bom', 'xyrs'}
+    check(project, files)
+
+
+def test_broken_board(files):
+    files.write(files.netlist, netlist(parts))
+    files.write(files.pcb, board(modules))
+    project = Project(files.netlist, files.pcb)
+    project.update()
+    # Caught half written
+    files.write(files.pcb, board(modules)[:-60])
+    with pytest.raises(ValueError):
+        project.update()
+    files.write(files.pcb, board(modules[:3]))
+    assert project.update() == {'xyrs'}
+    check(project, files)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Bom tool
+#
+# Copyright (c) 2016-2018 Jose I Romero
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import gc
+import io
+import time
+
+from bomtool import xyrstool
+from bomtool.geometry import Outlines
+
+
+def board(n_modules):
+    out = ['(kicad_pcb (version 20171130) (host pcbnew "5.1.5")\n'
+           '  (gr_line (start 0 0) (end 100 0) (layer Edge.Cuts) (width 0.05))\n'
+           '  (gr_line (start 100 0) (end 100 80) (layer Edge.Cuts) (width 0.05))\n']
+    for i in range(n_modules):
+        out.append(
+            '  (module Resistor_SMD:R_0603_1608Metric (layer F.Cu)\n'
+            '    (at {x:.3f} {y:.3f} 90)\n'
+            '    (fp_text reference R{i} (at 0 -1.43 90) (layer F.SilkS))\n'
+            '    (fp_line (start -1.48 0.73) (end -1.48 -0.73) (layer F.CrtYd) (width 0.05))\n'
+            '    (fp_line (start 1.48 0.73) (end -1.48 0.73) (layer F.CrtYd) (width 0.05))\n'
+            '  )\n'.format(i=i, x=i * 0.5 % 100, y=i * 0.25 % 80))
+    out.append(')\n')
+    return ''.join(out)
+
+
+def bom(n_modules, per_line=10):
+    lines = []
+    for first in range(0, n_modules, per_line):
+        refs = ["R{}".format(i) for i in range(first, min(first + per_line, n_modules))]
+        lines.append({'qty': len(refs), 'refs': ", ".join(refs),
+                      'description': "RES SMD 10k 1% [0603]", 'package': "0603"})
+    return lines
+
+
+def test_placements():
+    xyrs = xyrstool.generate_xyrs(io.StringIO(board(3)), bom(3))
+    assert [p['#Designator'] for p in xyrs] == ['R0', 'R1', 'R2']
+    p = xyrs[1]
+    # In mils, from the lower left corner of the board
+    assert (p['X-Loc'], p['Y-Loc'], p['Rotation']) == (
+        round(0.5 / 0.0254, 2), round(79.75 / 0.0254, 2), 90)
+    # The courtyard is 2.96 x 1.46 mm, turned 90 degrees
+    assert (p['X-Size'], p['Y-Size']) == (round(1.46 / 0.0254, 2), round(2.96 / 0.0254, 2))
+
+
+def test_outlines_batched(monkeypatch):
+    calls = []
+    bounding_boxes = Outlines.bounding_boxes
+
+    def counted(self):
+        calls.append(self.layer)
+        return bounding_boxes(self)
+    monkeypatch.setattr(Outlines, 'bounding_boxes', counted)
+    xyrstool.generate_xyrs(io.StringIO(board(500)), bom(500))
+    # Once for the board outline, once for every courtyard
+    assert sorted(calls) == ['CrtYd', 'Edge.Cuts']
+
+
+def _time_per_placement(n, repeat=3):
+    pcb, lines = board(n), bom(n)
+    best = None
+    for _ in range(repeat):
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            xyrs = xyrstool.generate_xyrs(io.StringIO(pcb), lines)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        assert len(xyrs) == n
+        best = elapsed if best is None else min(best, elapsed)
+    return best / n
+
+
+def test_near_linear():
+    small = _time_per_placement(250)
+    large = _time_per_placement(4000)
+    # 16 times the placements, the time per placement may grow a little
+    # with the size of the dictionaries, not with the board
+    assert large < 2 * small